@@ -0,0 +1,175 @@
+"""
+Native async versions of the hot endpoints, served by utils.asgi.AsyncRouter in front of the Flask app.
+
+Responses match the sync views in api/v1/auth.py and api/v1/role.py; swagger docs live there.
+"""
+import uuid
+from http import HTTPStatus
+
+from flask import current_app
+from flask_jwt_extended import decode_token
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt import ExpiredSignatureError, PyJWTError
+
+from extensions import hasher
+from utils.asgi import json_response
+from utils.async_db import async_db
+from utils.blocklist import (
+    REFRESH_REUSED, REFRESH_ROTATED, BlocklistUnavailableError, consume_refresh_token_async,
+    is_token_revoked_async,
+)
+from utils.common import get_tokens, get_tokens_async
+from utils.hashing import HashingUnavailableError
+from utils.login_events import login_events
+from utils.permissions import has_permission_async
+
+
+def jwt_error(message, status):
+    return json_response({current_app.config['JWT_ERROR_MESSAGE_KEY']: message}, status)
+
+
+async def verify_token(request, refresh=False):
+    """
+    Проверка токена из заголовка Authorization, как это делает verify_jwt_in_request.
+
+    :return: (payload, None) или (None, ответ с ошибкой)
+    """
+    header = request.headers.get('authorization', '')
+    if not header.startswith('Bearer '):
+        return None, jwt_error('Missing Authorization Header', HTTPStatus.UNAUTHORIZED)
+
+    try:
+        payload = decode_token(header[len('Bearer '):])
+    except ExpiredSignatureError:
+        return None, jwt_error('Token has expired', HTTPStatus.UNAUTHORIZED)
+    except (PyJWTError, JWTExtendedException) as error:
+        return None, jwt_error(str(error), HTTPStatus.UNPROCESSABLE_ENTITY)
+
+    if refresh and payload.get('type') != 'refresh':
+        return None, jwt_error('Only refresh tokens are allowed', HTTPStatus.UNPROCESSABLE_ENTITY)
+    if not refresh and payload.get('type') == 'refresh':
+        return None, jwt_error('Only non-refresh tokens are allowed', HTTPStatus.UNPROCESSABLE_ENTITY)
+    # refresh tokens are checked against the blocklist by consume_refresh_token
+    if not refresh and await is_token_revoked_async(payload):
+        return None, jwt_error('Token has been revoked', HTTPStatus.UNAUTHORIZED)
+    return payload, None
+
+
+async def login(request):
+    username = request.json.get('username')
+    password = request.json.get('password')
+    if not username or not password:
+        return json_response(
+            {
+                "message": "username/password is empty",
+                "status": "error"
+            }, HTTPStatus.BAD_REQUEST)
+
+    user = await async_db.get_user_by_username(username)
+    if user is None:
+        return json_response(
+            {
+                "message": "user is not exist",
+                "status": "error"
+            }, HTTPStatus.UNAUTHORIZED)
+
+    try:
+        password_is_valid = await hasher.verify_async(user.pwd_hash, password)
+    except HashingUnavailableError:
+        return json_response(
+            {
+                "message": "service is busy, try again later",
+                "status": "error"
+            }, HTTPStatus.SERVICE_UNAVAILABLE)
+    if not password_is_valid:
+        return json_response(
+            {
+                "message": "username or password are not correct",
+                "status": "error"
+            }, HTTPStatus.UNAUTHORIZED)
+
+    access_token, refresh_token = await get_tokens_async(user.id, user=user)
+    login_events.enqueue(
+        user_id=user.id,
+        ip=request.remote_addr,
+        user_agent=request.user_agent,
+        device_key=request.json.get('device_key') or request.headers.get('x-device-key'),
+        block=False,
+    )
+    return json_response(
+        {
+            "message": "JWT tokens were generated successfully",
+            "status": "success",
+            "tokens": {
+                "access_token": access_token,
+                "refresh_token": refresh_token
+            }
+        }, HTTPStatus.OK)
+
+
+async def refresh_token(request):
+    token, error = await verify_token(request, refresh=True)
+    if error is not None:
+        return error
+
+    family_ttl = int(current_app.config['JWT_REFRESH_TOKEN_EXPIRES'].total_seconds())
+    try:
+        status = await consume_refresh_token_async(token, family_ttl)
+    except BlocklistUnavailableError:
+        return json_response(
+            {
+                "message": "token blocklist is unavailable, try again later",
+                "status": "error"
+            }, HTTPStatus.SERVICE_UNAVAILABLE)
+    if status != REFRESH_ROTATED:
+        message = "refresh token reuse detected" if status == REFRESH_REUSED else "token has been revoked"
+        return json_response(
+            {
+                "message": message,
+                "status": "error"
+            }, HTTPStatus.UNAUTHORIZED)
+
+    access_token, new_refresh_token = get_tokens(token['sub'], token)
+    return json_response(
+        {
+            "message": "JWT tokens were generated successfully",
+            "status": "success",
+            "tokens": {
+                "access_token": access_token,
+                "refresh_token": new_refresh_token,
+            }
+        }, HTTPStatus.OK)
+
+
+async def check_permissions(request):
+    claims, error = await verify_token(request)
+    if error is not None:
+        return error
+    if not (claims.get('is_superuser', False) or await has_permission_async(claims, 'roles')):
+        return json_response(
+            {
+                "message": "Permission denied",
+                "status": "error"
+            }, HTTPStatus.FORBIDDEN)
+
+    user_id = uuid.UUID(request.json.get('user_id'))
+    role_ids = [uuid.UUID(role_id) for role_id in request.json.get('role_ids')]
+    if not await async_db.user_has_roles(user_id, role_ids):
+        return json_response(
+            {
+                "message": "user is not found or hasn't any roles",
+                "status": "error"
+            }, HTTPStatus.NOT_FOUND)
+    return json_response(
+        {
+            "message": "permissions checked",
+            "status": "success",
+            "has_permissions": True
+        }, HTTPStatus.OK)
+
+
+routes = {
+    ('POST', '/api/v1/auth/login'): login,
+    ('POST', '/api/v1/auth/refresh-token'): refresh_token,
+    ('POST', '/api/v1/check-permissions'): check_permissions,
+}
@@ -0,0 +1,95 @@
+import hmac
+import os
+from functools import wraps
+from http import HTTPStatus
+
+from flask import Blueprint, Response, abort, current_app, make_response, request
+
+from extensions import db
+from utils.async_db import async_db
+from utils.db import pool_status
+from utils.login_events import login_events
+
+blueprint = Blueprint('metrics', __name__, url_prefix='/api/v1')
+
+POOL_METRICS = (
+    ('size', 'gauge', 'Connections kept open by the pool'),
+    ('in_use', 'gauge', 'Connections checked out right now'),
+    ('idle', 'gauge', 'Connections waiting in the pool'),
+    ('overflow', 'gauge', 'Connections opened above the pool size'),
+    ('checkouts', 'counter', 'Connection checkouts'),
+    ('checkout_timeouts', 'counter', 'Checkouts that gave up after POSTGRES_POOL_TIMEOUT'),
+    ('checkout_wait_seconds_total', 'counter', 'Time spent waiting for a free connection'),
+    ('checkout_wait_seconds_max', 'gauge', 'Longest wait for a free connection'),
+)
+
+# asyncpg pool of the native async endpoints; its checkouts are not instrumented
+ASYNC_POOL_METRICS = POOL_METRICS[:4]
+
+LOGIN_EVENTS_METRICS = (
+    ('dropped', 'counter', 'Login events dropped because the queue was full'),
+    ('failed', 'counter', 'Login events lost in failed batch writes'),
+)
+
+
+def metrics_token_required(fn):
+    """Metrics are for the scraper only: ``Authorization: Bearer METRICS_TOKEN``, off without a token."""
+    @wraps(fn)
+    def decorator(*args, **kwargs):
+        token = current_app.config.get('METRICS_TOKEN')
+        if not token:
+            abort(HTTPStatus.NOT_FOUND)
+        scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+        if scheme.lower() != 'bearer' or not hmac.compare_digest(credentials.encode(), token.encode()):
+            return make_response(
+                {
+                    "message": "invalid metrics token",
+                    "status": "error"
+                }, HTTPStatus.UNAUTHORIZED)
+        return fn(*args, **kwargs)
+
+    return decorator
+
+
+@blueprint.route('/metrics', methods=('GET', ))
+@metrics_token_required
+def get_metrics():
+    """
+    Connection pools and login history metrics of the worker that served the request
+    ---
+    tags:
+      - METRICS
+    description: |
+      Prometheus text format. Every worker has its own pools, the pid label tells them apart.
+      auth_db_pool_* is the pool of the sync views, auth_async_db_pool_* the asyncpg pool of the native async endpoints.
+      Requires the METRICS_TOKEN bearer token; without METRICS_TOKEN configured the endpoint answers 404.
+    responses:
+      200:
+        description: Metrics are available
+        content:
+          text/plain:
+            example: |
+              # TYPE auth_db_pool_in_use gauge
+              auth_db_pool_in_use{pid="12"} 3
+      401:
+        $ref: '#/components/responses/Unauthorized'
+      404:
+        $ref: '#/components/responses/NotFound'
+    security:
+      - metrics_token: []
+    """
+    pid = os.getpid()
+    lines = []
+    for prefix, metrics, status in (
+        ('auth_db_pool', POOL_METRICS, pool_status(db.engine)),
+        ('auth_async_db_pool', ASYNC_POOL_METRICS, async_db.pool_status()),
+    ):
+        for name, kind, description in metrics:
+            lines.append(f'# HELP {prefix}_{name} {description}')
+            lines.append(f'# TYPE {prefix}_{name} {kind}')
+            lines.append(f'{prefix}_{name}{{pid="{pid}"}} {status[name]}')
+    for name, kind, description in LOGIN_EVENTS_METRICS:
+        lines.append(f'# HELP auth_login_events_{name}_total {description}')
+        lines.append(f'# TYPE auth_login_events_{name}_total {kind}')
+        lines.append(f'auth_login_events_{name}_total{{pid="{pid}"}} {getattr(login_events, name)}')
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
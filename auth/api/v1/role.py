@@ -1,16 +1,38 @@
 import uuid
 from http import HTTPStatus
 
-from flask import Blueprint, make_response, request
+from flask import Blueprint, Response, current_app, make_response, request, stream_with_context
+from sqlalchemy.dialects.postgresql import insert
 
 from extensions import db
 from models import Role, UserRole, User
 from schemas import role_schema, user_role_schema
-from utils.common import permission_required
+from utils.assignments import (
+    assignment_results, existing_roles, existing_users, insert_user_roles, normalize_id, parse_ids,
+)
+from utils.common import (
+    get_role_user_ids, get_users_claims, invalidate_role_claims, invalidate_user_claims, permission_required,
+)
+from utils.db import replica_reads, use_statement_timeout
+from utils.hierarchy import HierarchyCycleError, add_parent, detach_role, get_parent_ids, remove_parent
+from utils.queries import get_role
+from utils.rbac import RbacImportError, export_rbac, import_rbac
+from utils.role_catalog import role_catalog
 
 blueprint = Blueprint('role', __name__, url_prefix='/api/v1')
 
 
+def catalog_response(body, etag):
+    """Role catalog response; 304 without the body when the client already has this ETag."""
+    if etag in request.if_none_match:
+        response = current_app.response_class(status=HTTPStatus.NOT_MODIFIED)
+    else:
+        response = current_app.response_class(body, status=HTTPStatus.OK, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
 @blueprint.route('/role', methods=('GET', ))
 @permission_required('roles')
 def get_role_list():
@@ -40,6 +62,8 @@ def get_role_list():
                 - id: 7166fd5f-a4e4-45f0-952c-78d0297c7b03
                   code: member
                   description: account with payment options
+      304:
+        description: roles have not changed since the ETag sent in If-None-Match
       401:
         $ref: '#/components/responses/Unauthorized'
       403:
@@ -47,17 +71,8 @@ def get_role_list():
       404:
         $ref: '#/components/responses/NotFound'
     """
-    roles = Role.query.all()
-    if roles is None:
-        return make_response({
-            "message": "Role list is empty",
-            "status": "success",
-        }, HTTPStatus.NO_CONTENT)
-    return make_response(
-        {
-            "status": "success",
-            "roles": [role_schema.dump(role) for role in roles]
-        }, HTTPStatus.OK)
+    catalog = role_catalog.get()
+    return catalog_response(catalog.list_body, catalog.list_etag)
 
 
 @blueprint.route('/role', methods=('POST',))
@@ -105,6 +120,7 @@ def create_role():
       - write:admin
       - read:admin
     """
+    use_statement_timeout('admin')
     role_code = request.json.get('code')
     role_description = request.json.get('description')
     if not role_code or not role_description:
@@ -113,16 +129,21 @@ def create_role():
                 "message": "role code/role description is empty",
                 "status": "error"
             }, HTTPStatus.BAD_REQUEST)
-    role = Role.query.filter_by(code=role_code).first()
-    if role is not None:
+    role_id = db.session.execute(
+        insert(Role).values(
+            code=role_code, description=role_description
+        ).on_conflict_do_nothing(
+            index_elements=[Role.code]
+        ).returning(Role.id)
+    ).scalar()
+    db.session.commit()
+    if role_id is None:
         return make_response(
             {
                 "message": "role is already existed",
                 "status": "error"
             }, HTTPStatus.BAD_REQUEST)
-    role = Role(code=role_code, description=role_description)
-    db.session.add(role)
-    db.session.commit()
+    role_catalog.bump()
     return make_response(
         {
             "message": "Role created",
@@ -165,6 +186,8 @@ def get_role_by_id(role_id):
                 id: a9c6e8da-f2bf-458a-978b-d2f50a031451
                 code: admin
                 description: unlimited access to all actions
+      304:
+        description: role has not changed since the ETag sent in If-None-Match
       401:
         $ref: '#/components/responses/Unauthorized'
       403:
@@ -172,18 +195,14 @@ def get_role_by_id(role_id):
       404:
         $ref: '#/components/responses/NotFound'
     """
-    role = Role.query.filter_by(id=role_id).first()
+    role = role_catalog.get().role(role_id)
     if role is None:
         return make_response(
             {
                 "message": "Role is not found",
                 "status": "error"
             }, HTTPStatus.NOT_FOUND)
-    return make_response(
-        {
-            "status": "success",
-            "role": role_schema.dump(role)
-        }, HTTPStatus.OK)
+    return catalog_response(*role)
 
 
 @blueprint.route('/role/<uuid:role_id>', methods=('PATCH',))
@@ -238,7 +257,8 @@ def change_role(role_id):
       404:
         $ref: '#/components/responses/NotFound'
     """
-    role = Role.query.filter_by(id=role_id).first()
+    use_statement_timeout('admin')
+    role = get_role(role_id)
     if role is None:
         return make_response(
             {
@@ -249,6 +269,8 @@ def change_role(role_id):
         setattr(role, key, request.json[key])
     db.session.add(role)
     db.session.commit()
+    role_catalog.bump()
+    invalidate_role_claims(role_id)
     return make_response(
         {
             "message": "role data was changed sucessfully",
@@ -296,15 +318,20 @@ def delete_role(role_id):
         - write:admin
         - read:admin
     """
-    role = Role.query.filter_by(id=role_id).first()
+    use_statement_timeout('admin')
+    role = get_role(role_id)
     if role is None:
         return make_response(
             {
                 "message": "Role is not found",
                 "status": "error"
             }, HTTPStatus.NOT_FOUND)
+    user_ids = get_role_user_ids(role_id)
+    detach_role(role_id)
     Role.query.filter_by(id=role_id).delete()
     db.session.commit()
+    role_catalog.bump()
+    invalidate_user_claims(*user_ids)
     return make_response(
         {
             "message": "role was sucessfully deleted",
@@ -312,6 +339,207 @@ def delete_role(role_id):
         }, HTTPStatus.NO_CONTENT)
 
 
+@blueprint.route('/role/<uuid:role_id>/parents', methods=('GET',))
+@permission_required('roles')
+def get_role_parents(role_id):
+    """
+    Parent roles of the role
+    ---
+    tags:
+    - ROLE_PARENTS
+    description: roles whose permissions the role inherits directly
+    parameters:
+    - name: role_id
+      in: path
+      required: true
+      description: Role uuid
+      schema:
+        type: string
+      example:
+        role_id: a9c6e8da-f2bf-458a-978b-d2f50a031451
+    responses:
+      200:
+        description: ids of the parent roles
+        content:
+          application/json:
+            schema:
+              $ref: '#/components/schemas/Response'
+              properties:
+                parent_ids:
+                  type: array
+                  items:
+                    type: string
+            example:
+              status: success
+              parent_ids: [7cf56926-054c-4522-ac6f-d9f5d0e9d18e]
+      401:
+        $ref: '#/components/responses/Unauthorized'
+      403:
+        $ref: '#/components/responses/Forbidden'
+      404:
+        $ref: '#/components/responses/NotFound'
+    """
+    if get_role(role_id) is None:
+        return make_response(
+            {
+                "message": "Role is not found",
+                "status": "error"
+            }, HTTPStatus.NOT_FOUND)
+    return make_response(
+        {
+            "status": "success",
+            "parent_ids": [str(parent_id) for parent_id in get_parent_ids(role_id)]
+        }, HTTPStatus.OK)
+
+
+@blueprint.route('/role/<uuid:role_id>/parents', methods=('POST',))
+@permission_required('roles')
+def add_role_parent(role_id):
+    """
+    Make the role inherit the permissions of another role
+    ---
+    tags:
+    - ROLE_PARENTS
+    description: >
+      The role and every role inheriting from it get the permissions of the parent
+      and of all its ancestors. An edge that would make a cycle is rejected.
+    parameters:
+    - name: role_id
+      in: path
+      required: true
+      description: Role uuid
+      schema:
+        type: string
+      example:
+        role_id: a9c6e8da-f2bf-458a-978b-d2f50a031451
+    requestBody:
+      content:
+        application/json:
+          schema:
+            $ref: '#/components/schemas/RoleParentRequest'
+          example:
+            parent_id: 7cf56926-054c-4522-ac6f-d9f5d0e9d18e
+    responses:
+      201:
+        description: parent was added
+        content:
+          application/json:
+            schema:
+              $ref: '#/components/schemas/Response'
+            example:
+              status: success
+              message: parent role was added
+      200:
+        description: the role already has this parent
+      401:
+        $ref: '#/components/responses/Unauthorized'
+      403:
+        $ref: '#/components/responses/Forbidden'
+      404:
+        $ref: '#/components/responses/NotFound'
+      409:
+        description: the parent already inherits from the role
+        content:
+          application/json:
+            schema:
+              $ref: '#/components/schemas/Response'
+            example:
+              status: error
+              message: role hierarchy can't have cycles
+    security:
+    - jwt_auth:
+      - write:admin
+      - read:admin
+    """
+    use_statement_timeout('admin')
+    parent_ids, _ = parse_ids([request.json.get('parent_id')])
+    role_ids = {role_id, *parent_ids}
+    if not parent_ids or len(existing_roles(role_ids)) != len(role_ids):
+        return make_response(
+            {
+                "message": "Role is not found",
+                "status": "error"
+            }, HTTPStatus.NOT_FOUND)
+    try:
+        created = add_parent(role_id, parent_ids[0])
+    except HierarchyCycleError:
+        db.session.rollback()
+        return make_response(
+            {
+                "message": "role hierarchy can't have cycles",
+                "status": "error"
+            }, HTTPStatus.CONFLICT)
+    db.session.commit()
+    if not created:
+        return make_response(
+            {
+                "message": "role already has this parent",
+                "status": "success"
+            }, HTTPStatus.OK)
+    invalidate_role_claims(role_id)
+    return make_response(
+        {
+            "message": "parent role was added",
+            "status": "success"
+        }, HTTPStatus.CREATED)
+
+
+@blueprint.route('/role/<uuid:role_id>/parents/<uuid:parent_id>', methods=('DELETE',))
+@permission_required('roles')
+def delete_role_parent(role_id, parent_id):
+    """
+    Stop the role inheriting from another role
+    ---
+    tags:
+    - ROLE_PARENTS
+    description: permissions the role still gets through other parents are kept
+    parameters:
+    - name: role_id
+      in: path
+      required: true
+      description: Role uuid
+      schema:
+        type: string
+      example:
+        role_id: a9c6e8da-f2bf-458a-978b-d2f50a031451
+    - name: parent_id
+      in: path
+      required: true
+      description: Parent role uuid
+      schema:
+        type: string
+      example:
+        parent_id: 7cf56926-054c-4522-ac6f-d9f5d0e9d18e
+    responses:
+      204:
+        description: parent was removed
+      401:
+        $ref: '#/components/responses/Unauthorized'
+      403:
+        $ref: '#/components/responses/Forbidden'
+      404:
+        $ref: '#/components/responses/NotFound'
+    security:
+    - jwt_auth:
+      - write:admin
+      - read:admin
+    """
+    use_statement_timeout('admin')
+    if not remove_parent(role_id, parent_id):
+        return make_response(
+            {
+                "message": "role has no such parent",
+                "status": "error"
+            }, HTTPStatus.NOT_FOUND)
+    db.session.commit()
+    invalidate_role_claims(role_id)
+    return make_response(
+        {
+            "message": "parent role was removed",
+            "status": "success"
+        }, HTTPStatus.NO_CONTENT)
+
+
 @blueprint.route('/assign-roles', methods=('POST',))
 @permission_required('roles')
 def assign_roles():
@@ -375,11 +603,26 @@ def assign_roles():
       - write:admin
       - read:admin
     """
-    user_id = request.json.get('user_id')
-    role_ids = request.json.get('role_ids')
-    user_role_list = [UserRole(user_id=user_id, role_id=id) for id in role_ids]
-    db.session.bulk_save_objects(user_role_list)
+    use_statement_timeout('admin')
+    user_ids, _ = parse_ids([request.json.get('user_id')])
+    if not existing_users(user_ids):
+        return make_response(
+            {
+                "message": "user not found",
+                "status": "error"
+            }, HTTPStatus.NOT_FOUND)
+    role_ids, invalid_role_ids = parse_ids(request.json.get('role_ids') or [])
+    if invalid_role_ids or len(existing_roles(role_ids)) != len(role_ids):
+        return make_response(
+            {
+                "message": "role not found",
+                "status": "error"
+            }, HTTPStatus.NOT_FOUND)
+
+    insert_user_roles(user_ids, role_ids)
     db.session.commit()
+    invalidate_user_claims(*user_ids)
+    user_role_list = UserRole.query.filter(UserRole.user_id == user_ids[0], UserRole.role_id.in_(role_ids))
     return make_response(
       {
           'message': 'roles were assigned to user',
@@ -388,9 +631,237 @@ def assign_roles():
       }, HTTPStatus.CREATED)
 
 
+@blueprint.route('/assign-roles/bulk', methods=('POST',))
+@permission_required('roles')
+def assign_roles_bulk():
+    """
+    Endpoint to assign roles to many users at once
+    ---
+    tags:
+      - ASSIGN_ROLES
+    description: >
+      Assign every role to every user. Idempotent: assignments that already exist are skipped.
+      Unknown roles fail the whole request, unknown users are reported per item.
+    requestBody:
+      content:
+        application/json:
+          schema:
+            $ref: '#/components/schemas/BulkUserRoleRequest'
+          example:
+            user_ids: [7cd483e9-5888-40fd-813a-a382154bcfd2, 8f4233c3-6284-41bd-af5a-737c6a3dc38d]
+            role_ids: [a9c6e8da-f2bf-458a-978b-d2f50a031451]
+    responses:
+      200:
+        description: Result for every user
+        content:
+          application/json:
+            schema:
+              $ref: '#/components/schemas/Response'
+              properties:
+                results:
+                  $ref: '#/components/schemas/BulkUserRoleResponse'
+            example:
+              status: success
+              message: roles were assigned
+              results:
+                - user_id: 7cd483e9-5888-40fd-813a-a382154bcfd2
+                  status: assigned
+                  assigned_role_ids: [a9c6e8da-f2bf-458a-978b-d2f50a031451]
+                - user_id: 8f4233c3-6284-41bd-af5a-737c6a3dc38d
+                  status: not_found
+      400:
+        description: Empty or too large request
+        content:
+          application/json:
+            schema:
+              $ref: '#/components/schemas/Response'
+            example:
+              status: error
+              message: user_ids/role_ids is empty
+      401:
+        $ref: '#/components/responses/Unauthorized'
+      403:
+        $ref: '#/components/responses/Forbidden'
+      404:
+        description: Some of the roles do not exist
+        content:
+          application/json:
+            schema:
+              $ref: '#/components/schemas/Response'
+            example:
+              status: error
+              message: role not found
+              role_ids: [a9c6e8da-f2bf-458a-978b-d2f50a031451]
+    security:
+    - jwt_auth:
+      - write:admin
+      - read:admin
+    """
+    use_statement_timeout('admin')
+    raw_user_ids = request.json.get('user_ids') or []
+    raw_role_ids = request.json.get('role_ids') or []
+    if not raw_user_ids or not raw_role_ids:
+        return make_response(
+            {
+                "message": "user_ids/role_ids is empty",
+                "status": "error"
+            }, HTTPStatus.BAD_REQUEST)
+    max_users = current_app.config['ASSIGN_ROLES_MAX_USERS']
+    if len(raw_user_ids) > max_users:
+        return make_response(
+            {
+                "message": f"at most {max_users} users per request",
+                "status": "error"
+            }, HTTPStatus.BAD_REQUEST)
+
+    role_ids, invalid_role_ids = parse_ids(raw_role_ids)
+    found_role_ids = existing_roles(role_ids)
+    missing_role_ids = invalid_role_ids + [str(role_id) for role_id in role_ids if role_id not in found_role_ids]
+    if missing_role_ids:
+        return make_response(
+            {
+                "message": "role not found",
+                "status": "error",
+                "role_ids": missing_role_ids
+            }, HTTPStatus.NOT_FOUND)
+
+    user_ids, invalid_user_ids = parse_ids(raw_user_ids)
+    found_user_ids = existing_users(user_ids)
+    created = insert_user_roles(
+        [user_id for user_id in user_ids if user_id in found_user_ids],
+        role_ids,
+        chunk_size=current_app.config['ASSIGN_ROLES_CHUNK_SIZE'],
+    )
+    db.session.commit()
+    invalidate_user_claims(*created)
+    return make_response(
+        {
+            "message": "roles were assigned",
+            "status": "success",
+            "results": assignment_results(user_ids, invalid_user_ids, found_user_ids, created)
+        }, HTTPStatus.OK)
+
+
+
+@blueprint.route('/rbac/export', methods=('GET',))
+@permission_required('roles')
+def export_rbac_view():
+    """
+    Export the access model
+    ---
+    tags:
+      - RBAC
+    description: >
+      Permissions, roles, role permissions and role parents as NDJSON, one object per line,
+      referring to each other by code. The output is accepted by /rbac/import in another environment.
+    responses:
+      200:
+        description: The access model
+        content:
+          application/x-ndjson:
+            example: |
+              {"type": "permission", "code": "users"}
+              {"type": "role", "code": "admin", "description": "unlimited access to all actions"}
+              {"type": "role", "code": "member", "description": "account with payment options"}
+              {"type": "role_permission", "role": "admin", "permission": "users"}
+              {"type": "role_parent", "role": "admin", "parent": "member"}
+      401:
+        $ref: '#/components/responses/Unauthorized'
+      403:
+        $ref: '#/components/responses/Forbidden'
+    security:
+    - jwt_auth:
+      - read:admin
+    """
+    use_statement_timeout('export')
+    return Response(stream_with_context(export_rbac()), mimetype='application/x-ndjson')
+
+
+@blueprint.route('/rbac/import', methods=('POST',))
+@permission_required('roles')
+def import_rbac_view():
+    """
+    Import the access model
+    ---
+    tags:
+      - RBAC
+    description: >
+      Make permissions, roles, role permissions and role parents match the NDJSON body in one
+      transaction: what the body lists is created or updated, everything else is deleted.
+      An invalid body changes nothing.
+    parameters:
+    - name: dry_run
+      in: query
+      required: false
+      description: only count the changes
+      schema:
+        type: boolean
+    requestBody:
+      content:
+        application/x-ndjson:
+          example: |
+            {"type": "permission", "code": "users"}
+            {"type": "role", "code": "admin", "description": "unlimited access to all actions"}
+            {"type": "role_permission", "role": "admin", "permission": "users"}
+    responses:
+      200:
+        description: Changes made (or that would be made) per entity
+        content:
+          application/json:
+            schema:
+              $ref: '#/components/schemas/Response'
+              properties:
+                changes:
+                  $ref: '#/components/schemas/RbacChanges'
+            example:
+              status: success
+              message: access model was imported
+              dry_run: false
+              changes:
+                permissions: {created: 1, updated: 0, deleted: 0}
+                roles: {created: 1, updated: 0, deleted: 2}
+                role_permissions: {created: 1, updated: 0, deleted: 0}
+                role_parents: {created: 0, updated: 0, deleted: 1}
+      400:
+        description: The body is not a valid access model
+        content:
+          application/json:
+            schema:
+              $ref: '#/components/schemas/Response'
+            example:
+              status: error
+              message: "line 3: unknown type 'group'"
+      401:
+        $ref: '#/components/responses/Unauthorized'
+      403:
+        $ref: '#/components/responses/Forbidden'
+    security:
+    - jwt_auth:
+      - write:admin
+      - read:admin
+    """
+    use_statement_timeout('admin')
+    dry_run = request.args.get('dry_run', 'false').lower() in ('1', 'true')
+    try:
+        changes = import_rbac(request.stream, dry_run=dry_run)
+    except RbacImportError as error:
+        return make_response(
+            {
+                "message": str(error),
+                "status": "error"
+            }, HTTPStatus.BAD_REQUEST)
+    return make_response(
+        {
+            "message": "access model was imported",
+            "status": "success",
+            "dry_run": dry_run,
+            "changes": changes
+        }, HTTPStatus.OK)
+
 
 @blueprint.route('/check-permissions', methods=('POST',))
 @permission_required('roles')
+@replica_reads
 def check_permissions():
     """
     Endpoint to check user permissions
@@ -461,10 +932,10 @@ def check_permissions():
     user_role = UserRole.query.join(User).filter(User.id.in_(
         [user_id])).join(Role).filter(Role.id.in_(role_ids)).first()
     if user_role is None:
-        make_response(
+        return make_response(
             {
                 "message": "user is not found or hasn't any roles",
-                "status": "success"
+                "status": "error"
             }, HTTPStatus.NOT_FOUND)
     return make_response(
         {
@@ -472,3 +943,87 @@ def check_permissions():
             "status": "success",
             "has_permissions": True
         }, HTTPStatus.OK)
+
+
+@blueprint.route('/check-permissions/batch', methods=('POST',))
+@permission_required('roles')
+def check_permissions_batch():
+    """
+    Endpoint to check many user permissions at once
+    ---
+    tags:
+      - CHECK_PERMISSIONS
+    description: >
+      Check (user_id, permission) pairs, e.g. for an API gateway. Answers come in request order;
+      superusers have every permission, unknown users and invalid ids have none.
+    requestBody:
+      content:
+        application/json:
+          schema:
+            $ref: '#/components/schemas/PermissionChecksRequest'
+          example:
+            checks:
+              - [7cd483e9-5888-40fd-813a-a382154bcfd2, roles]
+              - [7cd483e9-5888-40fd-813a-a382154bcfd2, personal_data]
+              - [8f4233c3-6284-41bd-af5a-737c6a3dc38d, users]
+    responses:
+      200:
+        description: One answer per check
+        content:
+          application/json:
+            schema:
+              $ref: '#/components/schemas/Response'
+              properties:
+                results:
+                  type: array
+                  items:
+                    type: boolean
+            example:
+              status: success
+              results: [true, false, false]
+      400:
+        description: Malformed or too large request
+        content:
+          application/json:
+            schema:
+              $ref: '#/components/schemas/Response'
+            example:
+              status: error
+              message: checks must be [user_id, permission] pairs
+      401:
+        $ref: '#/components/responses/Unauthorized'
+      403:
+        $ref: '#/components/responses/Forbidden'
+    security:
+    - jwt_auth:
+      - write:admin
+      - read:admin
+    """
+    checks = request.json.get('checks')
+    if not isinstance(checks, list) or not all(isinstance(check, list) and len(check) == 2 for check in checks):
+        return make_response(
+            {
+                "message": "checks must be [user_id, permission] pairs",
+                "status": "error"
+            }, HTTPStatus.BAD_REQUEST)
+    max_checks = current_app.config['PERMISSION_CHECKS_MAX_ITEMS']
+    if len(checks) > max_checks:
+        return make_response(
+            {
+                "message": f"at most {max_checks} checks per request",
+                "status": "error"
+            }, HTTPStatus.BAD_REQUEST)
+
+    user_ids, _ = parse_ids(user_id for user_id, _ in checks)
+    claims = get_users_claims(user_ids)
+    results = []
+    for user_id, permission in checks:
+        user_claims = claims.get(normalize_id(user_id))
+        results.append(user_claims is not None and (
+            user_claims['is_superuser'] or permission in user_claims['permissions']
+        ))
+    return make_response(
+        {
+            "status": "success",
+            "results": results
+        }, HTTPStatus.OK)
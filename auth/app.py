@@ -1,12 +1,18 @@
+import os
+from http import HTTPStatus
+
 import click
 from flasgger import Swagger
-from flask import Flask
+from flask import Flask, current_app, make_response
 
 from core import config as default_config
-from extensions import db, jwt, ma
+from extensions import db, hasher, jwt, ma, migrate, redis_db
+from utils.hashing import HashingUnavailableError
 
 __all__ = ('create_app',)
 
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
 
 def create_app(config=None) -> Flask:
     """Create a Flask app."""
@@ -16,6 +22,12 @@ def create_app(config=None) -> Flask:
     configure_blueprints(app)
     configure_db(app, config=config.PostgresSettings())
     configure_jwt(app, config=config.JWTSettings())
+    configure_hashing(app, config=config.HashingSettings())
+    configure_redis(app, config=config.RedisSettings())
+    configure_cache(app, config=config.CacheSettings())
+    configure_roles(app, config=config.RoleSettings())
+    configure_login_history(app, config=config.LoginHistorySettings())
+    configure_metrics(app, config=config.MetricsSettings())
     configure_ma(app)
     configure_swagger(app)
     configure_cli(app)
@@ -24,16 +36,127 @@ def create_app(config=None) -> Flask:
 
 
 def configure_db(app, config) -> None:
+    from sqlalchemy import event
+    from utils.async_db import async_db
+    from utils.db import apply_statement_timeout, engine_options, mark_sticky, replica_bind_keys
     app.config.from_object(config)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(config)
+    app.config['SQLALCHEMY_BINDS'] = replica_bind_keys(config)
+    app.config['SQLALCHEMY_REPLICA_BINDS'] = list(app.config['SQLALCHEMY_BINDS'])
     db.init_app(app)
+    migrate.init_app(app, db, directory=MIGRATIONS_DIR)
+    async_db.init_app(app)
+    if not event.contains(db.session, 'after_begin', apply_statement_timeout):
+        event.listen(db.session, 'after_begin', apply_statement_timeout)
+    if not event.contains(db.session, 'after_commit', mark_sticky):
+        event.listen(db.session, 'after_commit', mark_sticky)
     app.app_context().push()
-    db.create_all()
 
 
 def configure_jwt(app, config) -> None:
+    from utils.blocklist import BlocklistUnavailableError, is_token_revoked
+    from utils.jwks import KeySet
     app.config.from_object(config)
+
+    keys = KeySet.from_config(app.config)
+    if keys.is_asymmetric:
+        app.config['JWT_PRIVATE_KEY'] = keys.private_key
+        app.config['JWT_PUBLIC_KEY'] = keys.public_key
+    app.extensions['jwt_keys'] = keys
     jwt.init_app(app)
 
+    @jwt.additional_headers_loader
+    def add_key_id(identity):
+        kid = current_app.extensions['jwt_keys'].kid
+        return {'kid': kid} if kid else {}
+
+    @jwt.decode_key_loader
+    def get_decode_key(jwt_header, jwt_payload):
+        return current_app.extensions['jwt_keys'].decode_key(jwt_header)
+
+    @jwt.token_in_blocklist_loader
+    def check_if_token_revoked(jwt_header, jwt_payload):
+        # refresh tokens are checked atomically with their rotation in consume_refresh_token
+        if jwt_payload['type'] == 'refresh':
+            return False
+        return is_token_revoked(jwt_payload)
+
+    @app.errorhandler(BlocklistUnavailableError)
+    def blocklist_unavailable(error):
+        return make_response(
+            {
+                "message": "token blocklist is unavailable, try again later",
+                "status": "error"
+            }, HTTPStatus.SERVICE_UNAVAILABLE)
+
+
+def configure_hashing(app, config) -> None:
+    app.config.from_object(config)
+    hasher.init_app(app)
+
+    @app.errorhandler(HashingUnavailableError)
+    def hashing_unavailable(error):
+        return make_response(
+            {
+                "message": "service is busy, try again later",
+                "status": "error"
+            }, HTTPStatus.SERVICE_UNAVAILABLE)
+
+
+def configure_redis(app, config) -> None:
+    app.config.from_object(config)
+    redis_db.init_app(app)
+
+
+def configure_cache(app, config) -> None:
+    from utils.blocklist import revoked_tokens_cache, token_generations_cache
+    from utils.common import user_claims_cache
+    from utils.devices import known_devices
+    from utils.role_catalog import role_catalog
+    app.config.from_object(config)
+    for cache in (revoked_tokens_cache, token_generations_cache):
+        cache.configure(
+            maxsize=config.BLOCKLIST_LOCAL_CACHE_SIZE,
+            ttl=config.BLOCKLIST_LOCAL_CACHE_TTL,
+        )
+    user_claims_cache.configure(
+        maxsize=config.PERMISSIONS_LOCAL_CACHE_SIZE,
+        local_ttl=config.PERMISSIONS_LOCAL_CACHE_TTL,
+        ttl=config.PERMISSIONS_CACHE_TTL,
+    )
+    known_devices.configure(
+        maxsize=config.KNOWN_DEVICES_LOCAL_CACHE_SIZE,
+        local_ttl=config.KNOWN_DEVICES_LOCAL_CACHE_TTL,
+        ttl=config.KNOWN_DEVICES_CACHE_TTL,
+    )
+    role_catalog.configure(check_interval=config.ROLE_CATALOG_CHECK_INTERVAL)
+
+
+def configure_roles(app, config) -> None:
+    app.config.from_object(config)
+
+
+def configure_login_history(app, config) -> None:
+    from models import KnownDevice, UserDevice
+    from utils.login_events import login_events
+    app.config.from_object(config)
+    login_events.init_app(app, table=UserDevice.__table__, devices_table=KnownDevice.__table__)
+
+
+def configure_metrics(app, config) -> None:
+    app.config.from_object(config)
+
+
+def maintain_login_history(app):
+    from models import UserDevice
+    from utils.partitions import maintain_partitions
+    return maintain_partitions(
+        db.get_engine(app),
+        UserDevice.__table__,
+        ahead=app.config['LOGIN_HISTORY_PARTITIONS_AHEAD'],
+        retention=app.config['LOGIN_HISTORY_RETENTION_MONTHS'],
+    )
+
 
 def configure_ma(app) -> None:
     ma.init_app(app)
@@ -45,8 +168,10 @@ def configure_swagger(app) -> None:
 
 def configure_blueprints(app) -> None:
     from api.v1.auth import blueprint as auth_blueprint
+    from api.v1.metrics import blueprint as metrics_blueprint
     from api.v1.role import blueprint as role_blueprint
     app.register_blueprint(auth_blueprint)
+    app.register_blueprint(metrics_blueprint)
     app.register_blueprint(role_blueprint)
 
 
@@ -54,8 +179,81 @@ def configure_cli(app):
 
     @app.cli.command('recreate-database')
     def initdb():
-        db.drop_all()
-        db.create_all()
+        from flask_migrate import downgrade, upgrade
+        downgrade(revision='base')
+        upgrade()
+        maintain_login_history(app)
+
+    @app.cli.command('maintain-login-history')
+    def maintain_login_history_command():
+        """Create upcoming login history partitions and drop expired ones; run daily from cron."""
+        created, dropped = maintain_login_history(app)
+        click.echo(f'created: {", ".join(created) or "-"}; dropped: {", ".join(dropped) or "-"}')
+
+    @app.cli.command('export-rbac')
+    @click.argument('output', type=click.File('w'), default='-')
+    def export_rbac_command(output):
+        """Write permissions, roles, their permissions and parents to OUTPUT as NDJSON."""
+        from utils.rbac import export_rbac
+        output.writelines(export_rbac())
+
+    @app.cli.command('import-rbac')
+    @click.argument('source', type=click.File('r'), default='-')
+    @click.option('--dry-run', is_flag=True, help='Only report the changes.')
+    def import_rbac_command(source, dry_run):
+        """Make permissions and roles match the NDJSON in SOURCE, deleting what it does not list."""
+        from utils.rbac import RbacImportError, import_rbac
+        try:
+            changes = import_rbac(source, dry_run=dry_run)
+        except RbacImportError as error:
+            raise click.ClickException(str(error))
+        for name, counts in changes.items():
+            click.echo(f'{name}: ' + ', '.join(f'{action} {count}' for action, count in counts.items()))
+
+    @app.cli.command('import-users')
+    @click.argument('source', type=click.File('r', encoding='utf-8'))
+    @click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), help='By default from the extension.')
+    @click.option('--batch-size', default=5000, show_default=True, help='Records per COPY and transaction.')
+    @click.option('--workers', type=int, help='Hashing processes, HASHING_POOL_SIZE by default.')
+    @click.option('--checkpoint', type=click.Path(dir_okay=False), help='Progress file, SOURCE.checkpoint by default; removed on success.')
+    def import_users_command(source, fmt, batch_size, workers, checkpoint):
+        """
+        Load users from a CSV or NDJSON SOURCE: username, password or pwd_hash, optional id,
+        is_superuser, data_joined and personal data. Existing usernames are skipped;
+        an interrupted import continues from the checkpoint when run again.
+        """
+        from utils.hashing import PasswordHasher
+        from utils.user_import import UserImporter, UserImportError, detect_format, read_records
+        fmt = fmt or detect_format(source.name)
+        if fmt is None:
+            raise click.UsageError('--format is required when SOURCE has no .csv/.ndjson extension')
+        if checkpoint is None and source.name != '<stdin>':
+            checkpoint = f'{source.name}.checkpoint'
+
+        pool_hasher = PasswordHasher(
+            executor=app.config['HASHING_EXECUTOR'], pool_size=workers or app.config['HASHING_POOL_SIZE']
+        )
+        connection = db.engine.raw_connection()
+
+        def progress(stats):
+            click.echo(f'{stats.records} records, {stats.inserted} inserted, {stats.rate:.0f} records/s', err=True)
+
+        try:
+            importer = UserImporter(
+                connection, pool_hasher, batch_size=batch_size, checkpoint=checkpoint,
+                statement_timeout=app.config['POSTGRES_EXPORT_STATEMENT_TIMEOUT'],
+            )
+            stats = importer.run(read_records(source, fmt), progress=progress)
+        except UserImportError as error:
+            raise click.ClickException(str(error))
+        finally:
+            connection.close()
+            pool_hasher.shutdown(wait=True)
+        click.echo(
+            f'records: {stats.records - stats.resumed_from}, inserted: {stats.inserted}, '
+            f'existing: {stats.existing}, invalid: {stats.invalid}, '
+            f'{stats.elapsed:.1f}s, {stats.rate:.0f} records/s'
+        )
 
     @app.cli.command('create-superuser')
     @click.argument('name')
@@ -4,15 +4,19 @@ import sys
 import uvicorn
 from asgiref.wsgi import WsgiToAsgi
 
+from api.v1.async_views import routes
 from app import create_app
 from core.config import FLASK_HOST, FLASK_PORT
 from core.logger import LOGGING
+from utils.asgi import AsyncRouter
 
 SOURCE_DIR = os.path.dirname(__file__)
 if SOURCE_DIR not in sys.path:
     sys.path.append(SOURCE_DIR)
 
-asgi_app = WsgiToAsgi(create_app())
+flask_app = create_app()
+# login, refresh-token and check-permissions run as coroutines, everything else through WsgiToAsgi
+asgi_app = AsyncRouter(flask_app, routes=routes, fallback=WsgiToAsgi(flask_app))
 
 
 if __name__ == '__main__':
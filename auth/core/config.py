@@ -1,6 +1,7 @@
 import os
 from datetime import timedelta
 from logging import config as logging_config
+from typing import Optional
 
 from pydantic import BaseSettings, Field
 
@@ -30,6 +31,7 @@ PROJECT_NAME = os.getenv('PROJECT_NAME', 'auth')
 
 REDIS_HOST = os.getenv('REDIS_HOST', '127.0.0.1')
 REDIS_PORT = int(os.getenv('REDIS_PORT', 6389))
+REDIS_SOCKET_TIMEOUT = float(os.getenv('REDIS_SOCKET_TIMEOUT', 0.5))
 
 POSTGRES_HOST = os.getenv('POSTGRES_HOST', '127.0.0.1')
 POSTGRES_PORT = int(os.getenv('POSTGRES_PORT', 5433))
@@ -37,16 +39,84 @@ POSTGRES_NAME = os.getenv('POSTGRES_NAME', 'auth_database')
 POSTGRES_USER = os.getenv('POSTGRES_USER', 'auth')
 POSTGRES_PASSWORD = os.getenv('POSTGRES_PASSWORD', 1234)
 POSTGRES_OPTIONS = os.getenv('POSTGRES_OPTIONS', '-c search_path=users')
+POSTGRES_POOL_SIZE = int(os.getenv('POSTGRES_POOL_SIZE', 20))
+POSTGRES_MAX_OVERFLOW = int(os.getenv('POSTGRES_MAX_OVERFLOW', 10))
+POSTGRES_POOL_TIMEOUT = float(os.getenv('POSTGRES_POOL_TIMEOUT', 5))
+POSTGRES_POOL_RECYCLE = int(os.getenv('POSTGRES_POOL_RECYCLE', 1800))
+POSTGRES_POOL_PRE_PING = os.getenv('POSTGRES_POOL_PRE_PING', 'true').lower() == 'true'
+POSTGRES_APPLICATION_NAME = os.getenv('POSTGRES_APPLICATION_NAME', PROJECT_NAME)
+POSTGRES_STATEMENT_TIMEOUT = int(os.getenv('POSTGRES_STATEMENT_TIMEOUT', 5000))
+POSTGRES_ADMIN_STATEMENT_TIMEOUT = int(os.getenv('POSTGRES_ADMIN_STATEMENT_TIMEOUT', 30000))
+POSTGRES_EXPORT_STATEMENT_TIMEOUT = int(os.getenv('POSTGRES_EXPORT_STATEMENT_TIMEOUT', 300000))
+POSTGRES_PGBOUNCER = os.getenv('POSTGRES_PGBOUNCER', 'false').lower() == 'true'
+POSTGRES_REPLICA_URIS = os.getenv('POSTGRES_REPLICA_URIS', '')
+POSTGRES_REPLICA_STICKY_SECONDS = float(os.getenv('POSTGRES_REPLICA_STICKY_SECONDS', 5))
 
 FLASK_HOST = os.getenv('FLASK_HOST', '127.0.0.1')
 FLASK_PORT = int(os.getenv('FLASK_PORT', 5000))
 BASE_URL = os.getenv('BASE_URL', '/api/v1')
 
+SERVER_WORKERS = int(os.getenv('SERVER_WORKERS', 0))
+SERVER_MAX_REQUESTS = int(os.getenv('SERVER_MAX_REQUESTS', 10000))
+SERVER_MAX_REQUESTS_JITTER = int(os.getenv('SERVER_MAX_REQUESTS_JITTER', 1000))
+SERVER_TIMEOUT = int(os.getenv('SERVER_TIMEOUT', 30))
+SERVER_GRACEFUL_TIMEOUT = int(os.getenv('SERVER_GRACEFUL_TIMEOUT', 30))
+SERVER_KEEPALIVE = int(os.getenv('SERVER_KEEPALIVE', 5))
+
 
 JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'super-secret')
 JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=int(os.getenv('JWT_ACCESS_TOKEN_EXPIRES', 1)))
 JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=int(os.getenv('JWT_REFRESH_TOKEN_EXPIRES', 2)))
 JWT_ERROR_MESSAGE_KEY = os.getenv('JWT_ERROR_MESSAGE_KEY', 'message')
+JWT_PERMISSIONS_ENCODING = os.getenv('JWT_PERMISSIONS_ENCODING', 'list')
+JWT_ALGORITHM = os.getenv('JWT_ALGORITHM', 'HS256')
+JWT_PRIVATE_KEY_PATH = os.getenv('JWT_PRIVATE_KEY_PATH')
+JWT_PUBLIC_KEY_PATH = os.getenv('JWT_PUBLIC_KEY_PATH')
+JWT_PREVIOUS_PUBLIC_KEY_PATH = os.getenv('JWT_PREVIOUS_PUBLIC_KEY_PATH')
+JWT_KEY_ID = os.getenv('JWT_KEY_ID')
+JWT_JWKS_MAX_AGE = int(os.getenv('JWT_JWKS_MAX_AGE', 3600))
+JWT_VERIFIED_TOKEN_CACHE_SIZE = int(os.getenv('JWT_VERIFIED_TOKEN_CACHE_SIZE', 0))
+
+HASHING_EXECUTOR = os.getenv('HASHING_EXECUTOR', 'process')
+HASHING_POOL_SIZE = int(os.getenv('HASHING_POOL_SIZE', os.cpu_count() or 1))
+HASHING_QUEUE_SIZE = int(os.getenv('HASHING_QUEUE_SIZE', 64))
+HASHING_TIMEOUT = float(os.getenv('HASHING_TIMEOUT', 5))
+
+PERMISSIONS_CACHE_TTL = int(os.getenv('PERMISSIONS_CACHE_TTL', 3600))
+PERMISSIONS_LOCAL_CACHE_SIZE = int(os.getenv('PERMISSIONS_LOCAL_CACHE_SIZE', 10000))
+PERMISSIONS_LOCAL_CACHE_TTL = float(os.getenv('PERMISSIONS_LOCAL_CACHE_TTL', 5))
+
+BLOCKLIST_LOCAL_CACHE_SIZE = int(os.getenv('BLOCKLIST_LOCAL_CACHE_SIZE', 10000))
+BLOCKLIST_LOCAL_CACHE_TTL = float(os.getenv('BLOCKLIST_LOCAL_CACHE_TTL', 2))
+KNOWN_DEVICES_LOCAL_CACHE_SIZE = int(os.getenv('KNOWN_DEVICES_LOCAL_CACHE_SIZE', 100000))
+KNOWN_DEVICES_LOCAL_CACHE_TTL = float(os.getenv('KNOWN_DEVICES_LOCAL_CACHE_TTL', 300))
+KNOWN_DEVICES_CACHE_TTL = int(os.getenv('KNOWN_DEVICES_CACHE_TTL', 30 * 24 * 3600))
+ROLE_CATALOG_CHECK_INTERVAL = float(os.getenv('ROLE_CATALOG_CHECK_INTERVAL', 1))
+
+ASSIGN_ROLES_MAX_USERS = int(os.getenv('ASSIGN_ROLES_MAX_USERS', 10000))
+ASSIGN_ROLES_CHUNK_SIZE = int(os.getenv('ASSIGN_ROLES_CHUNK_SIZE', 1000))
+PERMISSION_CHECKS_MAX_ITEMS = int(os.getenv('PERMISSION_CHECKS_MAX_ITEMS', 1000))
+
+LOGIN_EVENTS_QUEUE_SIZE = int(os.getenv('LOGIN_EVENTS_QUEUE_SIZE', 10000))
+LOGIN_EVENTS_BATCH_SIZE = int(os.getenv('LOGIN_EVENTS_BATCH_SIZE', 500))
+LOGIN_EVENTS_FLUSH_INTERVAL = float(os.getenv('LOGIN_EVENTS_FLUSH_INTERVAL', 1))
+LOGIN_EVENTS_ENQUEUE_TIMEOUT = float(os.getenv('LOGIN_EVENTS_ENQUEUE_TIMEOUT', 0.05))
+LOGIN_HISTORY_PAGE_SIZE = int(os.getenv('LOGIN_HISTORY_PAGE_SIZE', 20))
+LOGIN_HISTORY_MAX_PAGE_SIZE = int(os.getenv('LOGIN_HISTORY_MAX_PAGE_SIZE', 100))
+LOGIN_HISTORY_STREAM_BATCH_SIZE = int(os.getenv('LOGIN_HISTORY_STREAM_BATCH_SIZE', 1000))
+LOGIN_HISTORY_RETENTION_MONTHS = int(os.getenv('LOGIN_HISTORY_RETENTION_MONTHS', 12))
+LOGIN_HISTORY_PARTITIONS_AHEAD = int(os.getenv('LOGIN_HISTORY_PARTITIONS_AHEAD', 3))
+
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+
+class ServerSettings(BaseSettings):
+    SERVER_WORKERS: int = Field(SERVER_WORKERS, description='0 derives the count from the CPU cores')
+    SERVER_MAX_REQUESTS: int = Field(SERVER_MAX_REQUESTS, description='requests before a worker is recycled, 0 disables')
+    SERVER_MAX_REQUESTS_JITTER: int = Field(SERVER_MAX_REQUESTS_JITTER, description='spreads recycling of the workers')
+    SERVER_TIMEOUT: int = Field(SERVER_TIMEOUT, description='seconds of silence before a worker is killed')
+    SERVER_GRACEFUL_TIMEOUT: int = Field(SERVER_GRACEFUL_TIMEOUT, description='seconds to finish requests on restart')
+    SERVER_KEEPALIVE: int = Field(SERVER_KEEPALIVE)
 
 
 class JWTSettings(BaseSettings):
@@ -54,6 +124,21 @@ class JWTSettings(BaseSettings):
     JWT_ACCESS_TOKEN_EXPIRES: timedelta = Field(JWT_ACCESS_TOKEN_EXPIRES)
     JWT_REFRESH_TOKEN_EXPIRES: timedelta = Field(JWT_REFRESH_TOKEN_EXPIRES)
     JWT_ERROR_MESSAGE_KEY: str = Field(JWT_ERROR_MESSAGE_KEY)
+    JWT_PERMISSIONS_ENCODING: str = Field(JWT_PERMISSIONS_ENCODING, description='list of codes or base64 bitmask')
+    JWT_ALGORITHM: str = Field(JWT_ALGORITHM, description='HS256, RS256 or EdDSA')
+    JWT_PRIVATE_KEY_PATH: Optional[str] = Field(JWT_PRIVATE_KEY_PATH, description='PEM key for asymmetric algorithms')
+    JWT_PUBLIC_KEY_PATH: Optional[str] = Field(JWT_PUBLIC_KEY_PATH, description='derived from private key if empty')
+    JWT_PREVIOUS_PUBLIC_KEY_PATH: Optional[str] = Field(JWT_PREVIOUS_PUBLIC_KEY_PATH, description='kept during rotation')
+    JWT_KEY_ID: Optional[str] = Field(JWT_KEY_ID, description='RFC 7638 thumbprint if empty')
+    JWT_JWKS_MAX_AGE: int = Field(JWT_JWKS_MAX_AGE)
+    JWT_VERIFIED_TOKEN_CACHE_SIZE: int = Field(JWT_VERIFIED_TOKEN_CACHE_SIZE, description='0 disables caching of verified tokens')
+
+
+class HashingSettings(BaseSettings):
+    HASHING_EXECUTOR: str = Field(HASHING_EXECUTOR, description='process, thread or inline')
+    HASHING_POOL_SIZE: int = Field(HASHING_POOL_SIZE)
+    HASHING_QUEUE_SIZE: int = Field(HASHING_QUEUE_SIZE, description='hash jobs allowed to wait for a free worker')
+    HASHING_TIMEOUT: float = Field(HASHING_TIMEOUT, description='seconds to wait for a slot and for the result')
 
 
 class PostgresSettings(BaseSettings):
@@ -62,7 +147,60 @@ class PostgresSettings(BaseSettings):
         f'@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_NAME}', description='url for auth service'
     )
     SQLALCHEMY_TRACK_MODIFICATIONS: bool = True
+    POSTGRES_POOL_SIZE: int = Field(POSTGRES_POOL_SIZE, description='connections kept open per worker')
+    POSTGRES_MAX_OVERFLOW: int = Field(POSTGRES_MAX_OVERFLOW, description='extra connections opened under load')
+    POSTGRES_POOL_TIMEOUT: float = Field(POSTGRES_POOL_TIMEOUT, description='seconds to wait for a free connection')
+    POSTGRES_POOL_RECYCLE: int = Field(POSTGRES_POOL_RECYCLE, description='seconds before a connection is reopened')
+    POSTGRES_POOL_PRE_PING: bool = Field(POSTGRES_POOL_PRE_PING)
+    POSTGRES_APPLICATION_NAME: str = Field(POSTGRES_APPLICATION_NAME, description='application_name in pg_stat_activity')
+    POSTGRES_STATEMENT_TIMEOUT: int = Field(POSTGRES_STATEMENT_TIMEOUT, description='ms, default endpoints')
+    POSTGRES_ADMIN_STATEMENT_TIMEOUT: int = Field(POSTGRES_ADMIN_STATEMENT_TIMEOUT, description='ms, role management')
+    POSTGRES_EXPORT_STATEMENT_TIMEOUT: int = Field(POSTGRES_EXPORT_STATEMENT_TIMEOUT, description='ms, streamed exports')
+    POSTGRES_PGBOUNCER: bool = Field(POSTGRES_PGBOUNCER, description='transaction pooling: no prepared statements or startup parameters')
+    POSTGRES_REPLICA_URIS: str = Field(POSTGRES_REPLICA_URIS, description='comma separated urls of read replicas')
+    POSTGRES_REPLICA_STICKY_SECONDS: float = Field(
+        POSTGRES_REPLICA_STICKY_SECONDS, description='seconds reads of a user go to primary after the user writes'
+    )
 
 
 class RedisSettings(BaseSettings):
     REDIS_URI: str = Field(f'redis://{REDIS_HOST}:{REDIS_PORT}')
+    REDIS_SOCKET_TIMEOUT: float = Field(REDIS_SOCKET_TIMEOUT)
+
+
+class CacheSettings(BaseSettings):
+    PERMISSIONS_CACHE_TTL: int = Field(PERMISSIONS_CACHE_TTL, description='seconds to keep user claims in redis')
+    PERMISSIONS_LOCAL_CACHE_SIZE: int = Field(PERMISSIONS_LOCAL_CACHE_SIZE)
+    PERMISSIONS_LOCAL_CACHE_TTL: float = Field(PERMISSIONS_LOCAL_CACHE_TTL, description='seconds to trust the worker copy')
+    BLOCKLIST_LOCAL_CACHE_SIZE: int = Field(BLOCKLIST_LOCAL_CACHE_SIZE)
+    BLOCKLIST_LOCAL_CACHE_TTL: float = Field(BLOCKLIST_LOCAL_CACHE_TTL, description='seconds to trust a "not revoked" answer')
+    KNOWN_DEVICES_LOCAL_CACHE_SIZE: int = Field(KNOWN_DEVICES_LOCAL_CACHE_SIZE, description='(user, device) pairs per worker')
+    KNOWN_DEVICES_LOCAL_CACHE_TTL: float = Field(
+        KNOWN_DEVICES_LOCAL_CACHE_TTL, description='seconds a worker keeps a known device without asking redis'
+    )
+    KNOWN_DEVICES_CACHE_TTL: int = Field(KNOWN_DEVICES_CACHE_TTL, description='seconds to keep known devices of an idle user in redis')
+    ROLE_CATALOG_CHECK_INTERVAL: float = Field(
+        ROLE_CATALOG_CHECK_INTERVAL, description='seconds a worker serves roles before checking the catalog version'
+    )
+
+
+class RoleSettings(BaseSettings):
+    ASSIGN_ROLES_MAX_USERS: int = Field(ASSIGN_ROLES_MAX_USERS, description='users per bulk assignment request')
+    ASSIGN_ROLES_CHUNK_SIZE: int = Field(ASSIGN_ROLES_CHUNK_SIZE, description='user-role rows per INSERT')
+    PERMISSION_CHECKS_MAX_ITEMS: int = Field(PERMISSION_CHECKS_MAX_ITEMS, description='checks per batch request')
+
+
+class LoginHistorySettings(BaseSettings):
+    LOGIN_EVENTS_QUEUE_SIZE: int = Field(LOGIN_EVENTS_QUEUE_SIZE, description='events waiting to be written')
+    LOGIN_EVENTS_BATCH_SIZE: int = Field(LOGIN_EVENTS_BATCH_SIZE, description='rows per INSERT')
+    LOGIN_EVENTS_FLUSH_INTERVAL: float = Field(LOGIN_EVENTS_FLUSH_INTERVAL, description='max seconds before a write')
+    LOGIN_EVENTS_ENQUEUE_TIMEOUT: float = Field(LOGIN_EVENTS_ENQUEUE_TIMEOUT, description='seconds login waits for the queue')
+    LOGIN_HISTORY_PAGE_SIZE: int = Field(LOGIN_HISTORY_PAGE_SIZE)
+    LOGIN_HISTORY_MAX_PAGE_SIZE: int = Field(LOGIN_HISTORY_MAX_PAGE_SIZE)
+    LOGIN_HISTORY_STREAM_BATCH_SIZE: int = Field(LOGIN_HISTORY_STREAM_BATCH_SIZE, description='rows per server-side fetch')
+    LOGIN_HISTORY_RETENTION_MONTHS: int = Field(LOGIN_HISTORY_RETENTION_MONTHS, description='monthly partitions kept')
+    LOGIN_HISTORY_PARTITIONS_AHEAD: int = Field(LOGIN_HISTORY_PARTITIONS_AHEAD, description='future monthly partitions created in advance')
+
+
+class MetricsSettings(BaseSettings):
+    METRICS_TOKEN: Optional[str] = Field(METRICS_TOKEN, description='bearer token of the scraper, metrics are off if empty')
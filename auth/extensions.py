@@ -1,7 +1,14 @@
-from flask_jwt_extended import JWTManager
-from flask_sqlalchemy import SQLAlchemy
+from flask_migrate import Migrate
 from flask_marshmallow import Marshmallow
 
-jwt = JWTManager()
-db = SQLAlchemy()
+from utils.cache import RedisClient
+from utils.db import RoutingSQLAlchemy
+from utils.hashing import PasswordHasher
+from utils.jwt_manager import CachingJWTManager
+
+jwt = CachingJWTManager()
+db = RoutingSQLAlchemy()
+migrate = Migrate()
 ma = Marshmallow()
+hasher = PasswordHasher()
+redis_db = RedisClient()
@@ -0,0 +1,53 @@
+"""
+Gunicorn settings of the production server: uvicorn workers, app preloaded in the master.
+
+    gunicorn -c auth/gunicorn.conf.py asgi:asgi_app
+"""
+import gc
+import logging
+import os
+import sys
+
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+if SOURCE_DIR not in sys.path:
+    sys.path.append(SOURCE_DIR)
+
+from core.config import FLASK_PORT, ServerSettings  # noqa: E402
+from utils.server import hashing_pool_size, process_memory, worker_count  # noqa: E402
+
+settings = ServerSettings()
+
+bind = f'0.0.0.0:{FLASK_PORT}'
+worker_class = 'uvicorn.workers.UvicornWorker'
+workers = worker_count(settings.SERVER_WORKERS)
+# create_app runs once in the master, workers share its memory pages copy-on-write
+preload_app = True
+max_requests = settings.SERVER_MAX_REQUESTS
+max_requests_jitter = settings.SERVER_MAX_REQUESTS_JITTER
+timeout = settings.SERVER_TIMEOUT
+graceful_timeout = settings.SERVER_GRACEFUL_TIMEOUT
+keepalive = settings.SERVER_KEEPALIVE
+
+# every worker has its own hashing pool: split the cores between them instead of cores per worker
+os.environ.setdefault('HASHING_POOL_SIZE', str(hashing_pool_size(workers)))
+
+# no collections in the master while the app is loaded; the heap is frozen before fork
+gc.disable()
+
+
+def pre_fork(server, worker):
+    from utils.server import prepare_fork
+    prepare_fork()
+
+
+def post_fork(server, worker):
+    gc.enable()
+
+
+def post_worker_init(worker):
+    memory = process_memory()
+    if memory is not None:
+        logging.getLogger('gunicorn.error').info(
+            'worker %s memory: rss %.1f MiB, pss %.1f MiB, private %.1f MiB',
+            worker.pid, *(memory[key] / 2 ** 20 for key in ('rss', 'pss', 'private')),
+        )
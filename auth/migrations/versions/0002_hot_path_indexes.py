@@ -0,0 +1,34 @@
+"""hot path indexes
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 05:59:44.298791
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # create_all databases could hold the same role twice for a user
+    op.execute(
+        'DELETE FROM users_roles a USING users_roles b '
+        'WHERE a.user_id = b.user_id AND a.role_id = b.role_id AND a.id > b.id'
+    )
+    op.create_unique_constraint('uq_users_roles_user_id_role_id', 'users_roles', ['user_id', 'role_id'])
+    op.create_index('ix_users_roles_role_id', 'users_roles', ['role_id'], unique=False)
+    op.create_index('ix_roles_permissions_role_id_perm_id', 'roles_permissions', ['role_id', 'perm_id'], unique=False)
+    op.create_index('ix_users_data_user_id', 'users_data', ['user_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_users_data_user_id', table_name='users_data')
+    op.drop_index('ix_roles_permissions_role_id_perm_id', table_name='roles_permissions')
+    op.drop_index('ix_users_roles_role_id', table_name='users_roles')
+    op.drop_constraint('uq_users_roles_user_id_role_id', 'users_roles', type_='unique')
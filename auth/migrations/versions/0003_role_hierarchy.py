@@ -0,0 +1,61 @@
+"""role hierarchy
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 07:05:12.431870
+
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'roles_parents',
+        sa.Column('role_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('parent_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.ForeignKeyConstraint(['parent_id'], ['roles.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['role_id'], ['roles.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('role_id', 'parent_id'),
+    )
+    op.create_table(
+        'roles_closure',
+        sa.Column('descendant_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('ancestor_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('paths', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['ancestor_id'], ['roles.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['descendant_id'], ['roles.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('descendant_id', 'ancestor_id'),
+    )
+    op.create_index(
+        'ix_roles_closure_ancestor_id_descendant_id', 'roles_closure', ['ancestor_id', 'descendant_id'], unique=False
+    )
+    # every role is its own ancestor, however it was inserted
+    op.execute(
+        'CREATE FUNCTION roles_closure_add_self() RETURNS trigger AS $$ '
+        'BEGIN '
+        'INSERT INTO roles_closure (descendant_id, ancestor_id, paths) VALUES (NEW.id, NEW.id, 1); '
+        'RETURN NEW; '
+        'END $$ LANGUAGE plpgsql'
+    )
+    op.execute(
+        'CREATE TRIGGER roles_closure_add_self AFTER INSERT ON roles '
+        'FOR EACH ROW EXECUTE PROCEDURE roles_closure_add_self()'
+    )
+    op.execute('INSERT INTO roles_closure (descendant_id, ancestor_id, paths) SELECT id, id, 1 FROM roles')
+
+
+def downgrade():
+    op.execute('DROP TRIGGER roles_closure_add_self ON roles')
+    op.execute('DROP FUNCTION roles_closure_add_self()')
+    op.drop_index('ix_roles_closure_ancestor_id_descendant_id', table_name='roles_closure')
+    op.drop_table('roles_closure')
+    op.drop_table('roles_parents')
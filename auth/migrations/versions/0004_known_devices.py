@@ -0,0 +1,63 @@
+"""known devices
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 09:12:40.518203
+
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+# utils.devices.device_fingerprint: sha256 of user agent, zero byte, device key
+FINGERPRINT = (
+    "encode(sha256(convert_to(coalesce(user_agent, ''), 'UTF8') || '\\x00'::bytea "
+    "|| convert_to(coalesce(device_key, ''), 'UTF8')), 'hex')"
+)
+
+
+def upgrade():
+    op.create_table(
+        'users_known_device',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('created_at', sa.TIMESTAMP(), nullable=False),
+        sa.Column('updated_at', sa.TIMESTAMP(), nullable=False),
+        sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('fingerprint', sa.CHAR(length=64), nullable=False),
+        sa.Column('device_key', sa.TEXT(), nullable=True),
+        sa.Column('user_agent', sa.TEXT(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('id'),
+        sa.UniqueConstraint('user_id', 'fingerprint', name='uq_users_known_device_user_id_fingerprint'),
+    )
+    op.add_column('users_device', sa.Column('fingerprint', sa.CHAR(length=64), nullable=True))
+    op.execute(f'UPDATE users_device SET fingerprint = {FINGERPRINT}')
+    # one known device per (user, fingerprint), dated by its first login
+    op.execute(
+        'INSERT INTO users_known_device (id, created_at, updated_at, user_id, fingerprint, device_key, user_agent) '
+        'SELECT DISTINCT ON (user_id, fingerprint) md5(random()::text || clock_timestamp()::text)::uuid, '
+        'created_at, created_at, user_id, fingerprint, device_key, user_agent '
+        'FROM users_device ORDER BY user_id, fingerprint, created_at'
+    )
+    op.drop_column('users_device', 'user_agent')
+    op.drop_column('users_device', 'device_key')
+
+
+def downgrade():
+    op.add_column('users_device', sa.Column('device_key', sa.TEXT(), nullable=True))
+    op.add_column('users_device', sa.Column('user_agent', sa.TEXT(), nullable=True))
+    op.execute(
+        'UPDATE users_device SET device_key = known.device_key, user_agent = known.user_agent '
+        'FROM users_known_device known '
+        'WHERE known.user_id = users_device.user_id AND known.fingerprint = users_device.fingerprint'
+    )
+    op.drop_column('users_device', 'fingerprint')
+    op.drop_table('users_known_device')
@@ -0,0 +1,75 @@
+"""partition login history
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 09:13:05.204117
+
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+# a partition per month that already holds logins; utils.partitions adds the upcoming ones
+CREATE_MONTH_PARTITIONS = (
+    'DO $$ DECLARE month date; BEGIN '
+    "FOR month IN SELECT DISTINCT date_trunc('month', created_at)::date FROM users_device_plain LOOP "
+    "EXECUTE format('CREATE TABLE %I PARTITION OF users_device FOR VALUES FROM (%L) TO (%L)', "
+    "'users_device_' || to_char(month, 'YYYY_MM'), month, (month + interval '1 month')::date); "
+    'END LOOP; END $$'
+)
+COLUMNS = 'id, created_at, updated_at, user_id, ip, fingerprint'
+
+
+def _rename(table, new_name, indexes):
+    # primary key and unique indexes are named after the table and would clash with the new one
+    op.rename_table(table, new_name)
+    for index in indexes:
+        op.execute(f'ALTER INDEX IF EXISTS {table}_{index} RENAME TO {new_name}_{index}')
+
+
+def upgrade():
+    _rename('users_device', 'users_device_plain', ('pkey', 'id_key'))
+    op.create_table(
+        'users_device',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('created_at', sa.TIMESTAMP(), nullable=False),
+        sa.Column('updated_at', sa.TIMESTAMP(), nullable=False),
+        sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('ip', postgresql.INET(), nullable=True),
+        sa.Column('fingerprint', sa.CHAR(length=64), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id', 'created_at'),
+        postgresql_partition_by='RANGE (created_at)',
+    )
+    op.execute(CREATE_MONTH_PARTITIONS)
+    op.execute(f'INSERT INTO users_device ({COLUMNS}) SELECT {COLUMNS} FROM users_device_plain')
+    op.drop_table('users_device_plain')
+    op.create_index(
+        'ix_users_device_user_id_created_at', 'users_device', ['user_id', 'created_at', 'id'], unique=False
+    )
+
+
+def downgrade():
+    _rename('users_device', 'users_device_partitioned', ('pkey',))
+    op.create_table(
+        'users_device',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('created_at', sa.TIMESTAMP(), nullable=False),
+        sa.Column('updated_at', sa.TIMESTAMP(), nullable=False),
+        sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('ip', postgresql.INET(), nullable=True),
+        sa.Column('fingerprint', sa.CHAR(length=64), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('id'),
+    )
+    op.execute(f'INSERT INTO users_device ({COLUMNS}) SELECT {COLUMNS} FROM users_device_partitioned')
+    # drops the month partitions and the index with it
+    op.drop_table('users_device_partitioned')
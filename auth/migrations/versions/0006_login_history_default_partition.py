@@ -0,0 +1,24 @@
+"""login history default partition
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 11:02:47.390114
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # logins of a month without a partition land here until utils.partitions moves them out
+    op.execute('CREATE TABLE users_device_default PARTITION OF users_device DEFAULT')
+
+
+def downgrade():
+    op.drop_table('users_device_default')
@@ -1,3 +1,3 @@
-from models.permissions import Permission, RolePermissions  # noqa
-from models.roles import Role, UserRole  # noqa
-from models.users import User, UserData  # noqa
+from models.permissions import Permission, RolePermissions, create_permissions  # noqa
+from models.roles import Role, RoleClosure, RoleParent, UserRole  # noqa
+from models.users import KnownDevice, User, UserData, UserDevice  # noqa
@@ -1,3 +1,5 @@
+from sqlalchemy.dialects.postgresql import insert
+
 from extensions import db
 from models.base import BaseModel
 
@@ -13,20 +15,28 @@ class Permission(BaseModel):
 
 class RolePermissions(BaseModel):
     __tablename__ = 'roles_permissions'
+    __table_args__ = (
+        # role -> permissions step of the permission join is answered from the index alone
+        db.Index('ix_roles_permissions_role_id_perm_id', 'role_id', 'perm_id'),
+    )
 
     role_id = db.Column(db.ForeignKey('roles.id', ondelete='CASCADE'), nullable=False)
     perm_id = db.Column(db.ForeignKey('permissions.id', ondelete='CASCADE'), nullable=False)
 
 
 def create_permissions():
+    from utils.permissions import invalidate_permission_index
+
     permissions = [
         'users',
         'personal_data',
         'roles',
     ]
 
-    for permission_code in permissions:
-        permission = Permission.query.filter_by(code=permission_code).first()
-        if not permission:
-            db.session.add(Permission(code=permission_code))
+    db.session.execute(
+        insert(Permission).values([{'code': code} for code in permissions]).on_conflict_do_nothing(
+            index_elements=[Permission.code]
+        )
+    )
     db.session.commit()
+    invalidate_permission_index()
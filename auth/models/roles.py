@@ -18,6 +18,39 @@ class Role(BaseModel):
 
 class UserRole(BaseModel):
     __tablename__ = 'users_roles'
+    __table_args__ = (
+        # also serves lookups by user_id, the leading column
+        db.UniqueConstraint('user_id', 'role_id', name='uq_users_roles_user_id_role_id'),
+        db.Index('ix_users_roles_role_id', 'role_id'),
+    )
 
     user_id = db.Column(UUID(as_uuid=True), db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, default=uuid.uuid4)  # noqa
     role_id = db.Column(UUID(as_uuid=True), db.ForeignKey('roles.id', ondelete='CASCADE'), nullable=False, default=uuid.uuid4)  # noqa
+
+
+class RoleParent(db.Model):
+    """Inheritance edge: the role gets every permission of the parent role."""
+    __tablename__ = 'roles_parents'
+
+    role_id = db.Column(UUID(as_uuid=True), db.ForeignKey('roles.id', ondelete='CASCADE'), primary_key=True)
+    parent_id = db.Column(UUID(as_uuid=True), db.ForeignKey('roles.id', ondelete='CASCADE'), primary_key=True)
+
+
+class RoleClosure(db.Model):
+    """
+    Транзитивное замыкание иерархии ролей: строка на каждую пару (предок, потомок), включая
+    саму роль с собой, с числом путей между ними.
+
+    Права пользователя - один join users_roles -> roles_closure -> roles_permissions
+    при любой глубине иерархии. Таблица ведется инкрементально в utils.hierarchy,
+    строку роли с самой собой добавляет триггер на вставку в roles.
+    """
+    __tablename__ = 'roles_closure'
+    __table_args__ = (
+        db.Index('ix_roles_closure_ancestor_id_descendant_id', 'ancestor_id', 'descendant_id'),
+    )
+
+    # descendant first: the login join goes from a user's role to its ancestors
+    descendant_id = db.Column(UUID(as_uuid=True), db.ForeignKey('roles.id', ondelete='CASCADE'), primary_key=True)
+    ancestor_id = db.Column(UUID(as_uuid=True), db.ForeignKey('roles.id', ondelete='CASCADE'), primary_key=True)
+    paths = db.Column(db.Integer, nullable=False, default=1)
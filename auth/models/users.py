@@ -1,10 +1,10 @@
 import datetime
+import uuid
 
-from sqlalchemy.dialects.postgresql import INET
+from sqlalchemy.dialects.postgresql import INET, UUID
 from sqlalchemy.ext.hybrid import hybrid_property
-from werkzeug.security import check_password_hash, generate_password_hash
 
-from extensions import db
+from extensions import db, hasher
 from models.base import BaseModel
 
 
@@ -27,14 +27,17 @@ class User(BaseModel):
     @password.setter
     def password(self, value):
         """Store the password as a hash for security."""
-        self.pwd_hash = generate_password_hash(value)
+        self.pwd_hash = hasher.hash(value)
 
     def check_password(self, value):
-        return check_password_hash(self.pwd_hash, value)
+        return hasher.verify(self.pwd_hash, value)
 
 
 class UserData(BaseModel):
     __tablename__ = 'users_data'
+    __table_args__ = (
+        db.Index('ix_users_data_user_id', 'user_id'),
+    )
 
     user_id = db.Column(db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     first_name = db.Column(db.TEXT())
@@ -49,12 +52,44 @@ class UserData(BaseModel):
 
 
 class UserDevice(BaseModel):
+    """
+    История входов, секционированная по месяцам created_at.
+
+    Партиции создаются заранее и удаляются целиком по истечении срока хранения
+    (utils.partitions, команда flask maintain-login-history). Входы месяца без партиции пишутся
+    в DEFAULT партицию users_device_default и переносятся при создании партиции.
+    Первичный ключ секционированной таблицы обязан включать ключ секционирования,
+    поэтому он составной: (id, created_at).
+    """
     __tablename__ = 'users_device'
-
+    __table_args__ = (
+        # keyset pagination of login history: WHERE user_id = ? ORDER BY created_at DESC, id DESC
+        db.Index('ix_users_device_user_id_created_at', 'user_id', 'created_at', 'id'),
+        {'postgresql_partition_by': 'RANGE (created_at)'},
+    )
+
+    id = db.Column(UUID(as_uuid=True), nullable=False, primary_key=True, default=uuid.uuid4)
+    created_at = db.Column(db.TIMESTAMP, nullable=False, primary_key=True, default=datetime.datetime.now)
     user_id = db.Column(db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     ip = db.Column(INET())
+    # user agent and device key of the login live in KnownDevice with the same (user_id, fingerprint)
+    fingerprint = db.Column(db.CHAR(64))
+
+    def __repr__(self):
+        return f'{self.ip} {self.fingerprint}'
+
+
+class KnownDevice(BaseModel):
+    """Устройство пользователя: одна строка на пару user agent + device_key, а не на каждый вход."""
+    __tablename__ = 'users_known_device'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'fingerprint', name='uq_users_known_device_user_id_fingerprint'),
+    )
+
+    user_id = db.Column(db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    fingerprint = db.Column(db.CHAR(64), nullable=False)
     device_key = db.Column(db.TEXT())
     user_agent = db.Column(db.TEXT())
 
     def __repr__(self):
-        return f'{self.ip} {self.user_agent}'
+        return f'{self.user_agent} {self.device_key}'
@@ -1,2 +1,2 @@
 from schemas.roles import role_schema, user_role_schema  # noqa
-from schemas.users import user_data_schema  # noqa
+from schemas.users import user_data_schema, user_login_schema  # noqa
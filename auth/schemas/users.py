@@ -1,4 +1,7 @@
+from marshmallow import fields
+
 from models.roles import Role
+from models.users import UserDevice
 from extensions import ma
 
 
@@ -7,4 +10,17 @@ class UserDataSchema(ma.SQLAlchemyAutoSchema):
         model = Role
 
 
+class UserDeviceSchema(ma.SQLAlchemySchema):
+    class Meta:
+        model = UserDevice
+        fields = ('ip', 'user_agent', 'device_key', 'created_at')
+
+
+class UserLoginSchema(ma.Schema):
+    login_date = fields.DateTime(attribute='created_at')
+    device = fields.Function(lambda login: user_device_schema.dump(login))
+
+
 user_data_schema = UserDataSchema()
+user_device_schema = UserDeviceSchema()
+user_login_schema = UserLoginSchema()
@@ -0,0 +1,84 @@
+import json
+import logging
+from http import HTTPStatus
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncRequest:
+    """The parts of an HTTP request the native async endpoints need."""
+
+    def __init__(self, scope, body):
+        self.scope = scope
+        self.method = scope['method']
+        self.path = scope['path']
+        self.headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+        self.remote_addr = scope['client'][0] if scope.get('client') else None
+        self.body = body
+        self._json = None
+
+    @property
+    def json(self):
+        if self._json is None:
+            self._json = json.loads(self.body or b'null')
+            if not isinstance(self._json, dict):
+                raise ValueError('JSON object expected')
+        return self._json
+
+    @property
+    def user_agent(self):
+        return self.headers.get('user-agent', '')
+
+
+def json_response(body, status=HTTPStatus.OK, headers=None):
+    return body, status, headers or {}
+
+
+class AsyncRouter:
+    """
+    ASGI-приложение: горячие эндпоинты обслуживаются корутинами в цикле событий воркера,
+    все остальное передается в fallback (Flask через WsgiToAsgi).
+
+    Корутина выполняется в контексте Flask-приложения (config, flask-jwt-extended), но без
+    потока на запрос: ожидание базы, Redis и пула хеширования не занимает поток, поэтому
+    один воркер держит тысячи запросов в полете.
+    """
+
+    def __init__(self, app, routes, fallback):
+        self.app = app
+        self.routes = routes
+        self.fallback = fallback
+
+    async def __call__(self, scope, receive, send):
+        handler = None
+        if scope['type'] == 'http':
+            handler = self.routes.get((scope['method'], scope['path'].rstrip('/') or '/'))
+        if handler is None:
+            return await self.fallback(scope, receive, send)
+
+        body = b''
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get('body', b'')
+            more_body = message.get('more_body', False)
+
+        request = AsyncRequest(scope, body)
+        with self.app.app_context():
+            try:
+                payload, status, headers = await handler(request)
+            except ValueError:
+                payload, status, headers = json_response(
+                    {"message": "request body is not valid", "status": "error"}, HTTPStatus.BAD_REQUEST
+                )
+            except Exception:
+                logger.exception('unhandled error in %s %s', request.method, request.path)
+                payload, status, headers = json_response(
+                    {"message": "internal server error", "status": "error"}, HTTPStatus.INTERNAL_SERVER_ERROR
+                )
+
+        raw = json.dumps(payload).encode()
+        response_headers = [(b'content-type', b'application/json'), (b'content-length', str(len(raw)).encode())]
+        response_headers += [(name.encode('latin-1'), value.encode('latin-1')) for name, value in headers.items()]
+        await send({'type': 'http.response.start', 'status': int(status), 'headers': response_headers})
+        await send({'type': 'http.response.body', 'body': raw})
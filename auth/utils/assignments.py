@@ -0,0 +1,88 @@
+import uuid
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+
+from extensions import db
+from models import Role, User, UserRole
+
+ASSIGNED = 'assigned'
+UNCHANGED = 'unchanged'
+NOT_FOUND = 'not_found'
+INVALID = 'invalid'
+
+
+def normalize_id(value):
+    """Canonical string form of a uuid, None if ``value`` is not one."""
+    try:
+        return str(uuid.UUID(str(value)))
+    except ValueError:
+        return None
+
+
+def parse_ids(values):
+    """(valid uuids in request order without duplicates, values that are not uuids)."""
+    valid, invalid = {}, []
+    for value in values:
+        try:
+            valid.setdefault(uuid.UUID(str(value)), None)
+        except ValueError:
+            invalid.append(value)
+    return list(valid), invalid
+
+
+def existing_ids(model, ids):
+    """Which of ``ids`` exist in the table of ``model``: one query for the whole list."""
+    if not ids:
+        return set()
+    rows = db.session.execute(select(model.id).where(model.id.in_(ids)))
+    return {row.id for row in rows}
+
+
+def existing_users(user_ids):
+    return existing_ids(User, user_ids)
+
+
+def existing_roles(role_ids):
+    return existing_ids(Role, role_ids)
+
+
+def insert_user_roles(user_ids, role_ids, chunk_size=1000):
+    """
+    Назначаем каждую роль каждому пользователю.
+
+    Строки вставляются пачками по chunk_size через INSERT ... ON CONFLICT DO NOTHING,
+    поэтому повторный запуск ничего не дублирует, а RETURNING возвращает только новые пары.
+    Коммит остается за вызывающим: все пачки идут одной транзакцией.
+
+    :return: {user_id: [role_id, ...]} для реально созданных назначений
+    """
+    created = {}
+    pairs = [{'user_id': user_id, 'role_id': role_id} for user_id in user_ids for role_id in role_ids]
+    for start in range(0, len(pairs), chunk_size):
+        rows = db.session.execute(
+            insert(UserRole).values(
+                pairs[start:start + chunk_size]
+            ).on_conflict_do_nothing(
+                constraint='uq_users_roles_user_id_role_id'
+            ).returning(UserRole.user_id, UserRole.role_id)
+        )
+        for row in rows:
+            created.setdefault(row.user_id, []).append(row.role_id)
+    return created
+
+
+def assignment_results(user_ids, invalid_ids, found_ids, created):
+    """Per-user outcome of a bulk assignment: ids that are not uuids first, then users in request order."""
+    results = [{'user_id': str(value), 'status': INVALID} for value in invalid_ids]
+    for user_id in user_ids:
+        if user_id not in found_ids:
+            results.append({'user_id': str(user_id), 'status': NOT_FOUND})
+            continue
+        assigned = [str(role_id) for role_id in created.get(user_id, ())]
+        results.append({
+            'user_id': str(user_id),
+            'status': ASSIGNED if assigned else UNCHANGED,
+            'assigned_role_ids': assigned,
+        })
+    return results
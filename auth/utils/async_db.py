@@ -0,0 +1,128 @@
+import os
+
+from sqlalchemy import exists, lambda_stmt, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from models import Permission, RoleClosure, RolePermissions, User, UserRole
+
+
+class AsyncDatabase:
+    """
+    Доступ к базе для нативных async эндпоинтов через asyncpg.
+
+    Движок строится из тех же PostgresSettings, что и синхронный, но с драйвером asyncpg
+    и создается лениво в процессе воркера: соединения привязаны к его циклу событий.
+    Запросы - Core по таблицам моделей, без ORM-сессии и ее identity map, в виде lambda_stmt
+    (см. utils.queries). asyncpg готовит их на сервере и держит подготовленные запросы в кеше
+    соединения; за PgBouncer в режиме транзакций (POSTGRES_PGBOUNCER) кеш выключается,
+    а statement_timeout вместо параметра запуска ставится в каждой транзакции.
+    """
+
+    def __init__(self):
+        self.url = None
+        self.options = {}
+        self.statement_timeout = None
+        self._engine = None
+        self._pid = None
+
+    def init_app(self, app):
+        self.url = make_url(app.config['SQLALCHEMY_DATABASE_URI']).set(drivername='postgresql+asyncpg')
+        server_settings = {'application_name': app.config['POSTGRES_APPLICATION_NAME']}
+        connect_args = {'server_settings': server_settings}
+        self.statement_timeout = None
+        if app.config['POSTGRES_PGBOUNCER']:
+            # prepared statements live in a server connection, PgBouncer hands out a different one
+            self.url = self.url.update_query_dict({'prepared_statement_cache_size': '0'})
+            connect_args['statement_cache_size'] = 0
+            # and it rejects startup parameters it does not track
+            self.statement_timeout = int(app.config['POSTGRES_STATEMENT_TIMEOUT'])
+        else:
+            server_settings['statement_timeout'] = str(app.config['POSTGRES_STATEMENT_TIMEOUT'])
+        self.options = {
+            'pool_size': app.config['POSTGRES_POOL_SIZE'],
+            'max_overflow': app.config['POSTGRES_MAX_OVERFLOW'],
+            'pool_timeout': app.config['POSTGRES_POOL_TIMEOUT'],
+            'pool_recycle': app.config['POSTGRES_POOL_RECYCLE'],
+            'pool_pre_ping': app.config['POSTGRES_POOL_PRE_PING'],
+            'connect_args': connect_args,
+        }
+        self._engine = None
+        app.extensions['async_db'] = self
+
+    @property
+    def engine(self):
+        if self._engine is None or self._pid != os.getpid():
+            if self.url is None:
+                raise RuntimeError('Async database is not initialized')
+            self._engine = create_async_engine(self.url, **self.options)
+            self._pid = os.getpid()
+        return self._engine
+
+    def pool_status(self):
+        """Gauges of this worker's asyncpg pool; zeros until an async endpoint has opened it."""
+        if self._engine is None or self._pid != os.getpid():
+            return {'size': 0, 'in_use': 0, 'idle': 0, 'overflow': 0}
+        pool = self._engine.sync_engine.pool
+        return {
+            'size': pool.size(),
+            'in_use': pool.checkedout(),
+            'idle': pool.checkedin(),
+            'overflow': max(pool.overflow(), 0),
+        }
+
+    async def dispose(self):
+        if self._engine is not None:
+            await self._engine.dispose()
+            self._engine = None
+
+    async def _begin(self, connection):
+        if self.statement_timeout is not None:
+            await connection.exec_driver_sql(f'SET LOCAL statement_timeout = {self.statement_timeout}')
+
+    async def fetch_one(self, statement):
+        async with self.engine.connect() as connection:
+            await self._begin(connection)
+            result = await connection.execute(statement)
+            return result.first()
+
+    async def fetch_all(self, statement):
+        async with self.engine.connect() as connection:
+            await self._begin(connection)
+            result = await connection.execute(statement)
+            return result.all()
+
+    async def get_user_by_username(self, username):
+        return await self.fetch_one(lambda_stmt(
+            lambda: select(User.id, User.pwd_hash, User.is_superuser).where(User.username == username)
+        ))
+
+    async def get_user(self, user_id):
+        return await self.fetch_one(lambda_stmt(lambda: select(User.id, User.is_superuser).where(User.id == user_id)))
+
+    async def get_user_permission_codes(self, user_id):
+        rows = await self.fetch_all(lambda_stmt(
+            lambda: select(Permission.code).join(
+                RolePermissions, RolePermissions.perm_id == Permission.id
+            ).join(
+                RoleClosure, RoleClosure.ancestor_id == RolePermissions.role_id
+            ).join(
+                UserRole, UserRole.role_id == RoleClosure.descendant_id
+            ).where(
+                UserRole.user_id == user_id
+            ).distinct()
+        ))
+        return [row.code for row in rows]
+
+    async def get_permission_codes(self):
+        rows = await self.fetch_all(lambda_stmt(lambda: select(Permission.code).order_by(Permission.code)))
+        return [row.code for row in rows]
+
+    async def user_has_roles(self, user_id, role_ids):
+        row = await self.fetch_one(
+            select(exists().where(UserRole.user_id == user_id, UserRole.role_id.in_(role_ids)))
+        )
+        return bool(row[0])
+
+
+async_db = AsyncDatabase()
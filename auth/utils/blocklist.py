@@ -0,0 +1,211 @@
+import logging
+import time
+
+from redis import RedisError
+
+from extensions import redis_db
+from utils.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+revoked_tokens_cache = LRUCache()
+token_generations_cache = LRUCache()
+
+REFRESH_ROTATED = 'rotated'
+REFRESH_REUSED = 'reused'
+REFRESH_REVOKED = 'revoked'
+
+# KEYS: revoked jti, user generation, family revocation flag, used jti
+# ARGV: token generation, used jti ttl, family revocation ttl
+CONSUME_REFRESH_TOKEN_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then return 'revoked' end
+if tonumber(ARGV[1]) < tonumber(redis.call('GET', KEYS[2]) or '0') then return 'revoked' end
+if redis.call('EXISTS', KEYS[3]) == 1 then return 'revoked' end
+if redis.call('SET', KEYS[4], 1, 'NX', 'EX', ARGV[2]) then return 'rotated' end
+redis.call('SET', KEYS[3], 1, 'EX', ARGV[3])
+return 'reused'
+"""
+
+
+class BlocklistUnavailableError(Exception):
+    """The blocklist could not be read or written: logout or refresh did not happen, the client has to retry."""
+
+
+def _key(jti):
+    return f'revoked:{jti}'
+
+
+def _generation_key(user_id):
+    return f'token_generation:{user_id}'
+
+
+def _family_key(family):
+    return f'refresh_family:{family}'
+
+
+def _used_key(jti):
+    return f'refresh_used:{jti}'
+
+
+def revoke_token(jwt_payload):
+    """Put the token's jti into the blocklist until the token expires by itself."""
+    jti = jwt_payload['jti']
+    ttl = int(jwt_payload['exp'] - time.time()) + 1
+    if ttl <= 0:
+        return
+    # checks fail open when Redis is down, so a lost write must not pass for a successful logout
+    revoked_tokens_cache.set(jti, True, ttl=ttl)
+    try:
+        redis_db.set(_key(jti), 1, ex=ttl)
+    except RedisError as error:
+        logger.warning('token blocklist is unavailable', exc_info=True)
+        raise BlocklistUnavailableError('Token was not revoked') from error
+
+
+def get_token_generation(user_id):
+    """Generation to stamp into new tokens of the user (``gen`` claim)."""
+    user_id = str(user_id)
+    generation = token_generations_cache.get(user_id)
+    if generation is not None:
+        return generation
+
+    try:
+        generation = int(redis_db.get(_generation_key(user_id)) or 0)
+    except RedisError:
+        logger.warning('token generations are unavailable', exc_info=True)
+        return 0
+    token_generations_cache.set(user_id, generation)
+    return generation
+
+
+async def get_token_generation_async(user_id):
+    user_id = str(user_id)
+    generation = token_generations_cache.get(user_id)
+    if generation is not None:
+        return generation
+
+    try:
+        generation = int(await redis_db.aio.get(_generation_key(user_id)) or 0)
+    except RedisError:
+        logger.warning('token generations are unavailable', exc_info=True)
+        return 0
+    token_generations_cache.set(user_id, generation)
+    return generation
+
+
+def revoke_all_tokens(user_id):
+    """
+    Выход со всех устройств: одно увеличение поколения вместо записи каждого токена в blocklist.
+
+    Токены с поколением меньше текущего считаются отозванными. Ключ хранится без срока жизни:
+    обновление переносит поколение в каждый новый refresh токен, поэтому цепочка обновлений
+    может жить дольше любого TTL, а сброс счетчика в 0 вернул бы ей силу. PERSIST снимает
+    срок жизни с ключей, записанных раньше с EXPIRE.
+    """
+    user_id = str(user_id)
+    pipeline = redis_db.pipeline()
+    pipeline.incr(_generation_key(user_id))
+    pipeline.persist(_generation_key(user_id))
+    try:
+        generation, _ = pipeline.execute()
+    except RedisError as error:
+        logger.warning('token generations are unavailable', exc_info=True)
+        raise BlocklistUnavailableError('Tokens were not revoked') from error
+    token_generations_cache.set(user_id, generation)
+    return generation
+
+
+def is_token_revoked(jwt_payload):
+    """
+    Проверяем, отозван ли токен: по jti или по поколению токенов пользователя.
+
+    Почти все токены не отозваны, поэтому ответы кешируются в воркере: отрицательный на
+    BLOCKLIST_LOCAL_CACHE_TTL секунд (столько отзыв из другого воркера может оставаться незамеченным),
+    положительный - до истечения токена. Промахи по обоим кешам закрываются одним MGET.
+    Если Redis недоступен, токен считается действующим.
+    """
+    revoked, generation = _cached_revocation(jwt_payload)
+    if revoked is None or generation is None:
+        try:
+            stored = redis_db.mget(_key(jwt_payload['jti']), _generation_key(jwt_payload['sub']))
+        except RedisError:
+            logger.warning('token blocklist is unavailable', exc_info=True)
+            return bool(revoked)
+        revoked, generation = _store_revocation(jwt_payload, revoked, generation, *stored)
+
+    return revoked or jwt_payload.get('gen', 0) < generation
+
+
+async def is_token_revoked_async(jwt_payload):
+    revoked, generation = _cached_revocation(jwt_payload)
+    if revoked is None or generation is None:
+        try:
+            stored = await redis_db.aio.mget(_key(jwt_payload['jti']), _generation_key(jwt_payload['sub']))
+        except RedisError:
+            logger.warning('token blocklist is unavailable', exc_info=True)
+            return bool(revoked)
+        revoked, generation = _store_revocation(jwt_payload, revoked, generation, *stored)
+
+    return revoked or jwt_payload.get('gen', 0) < generation
+
+
+def _cached_revocation(jwt_payload):
+    return revoked_tokens_cache.get(jwt_payload['jti']), token_generations_cache.get(str(jwt_payload['sub']))
+
+
+def _store_revocation(jwt_payload, revoked, generation, revoked_flag, stored_generation):
+    if revoked is None:
+        revoked = revoked_flag is not None
+        if revoked:
+            revoked_tokens_cache.set(jwt_payload['jti'], True, ttl=max(jwt_payload['exp'] - time.time(), 0))
+        else:
+            revoked_tokens_cache.set(jwt_payload['jti'], False)
+    if generation is None:
+        generation = int(stored_generation or 0)
+        token_generations_cache.set(str(jwt_payload['sub']), generation)
+    return revoked, generation
+
+
+def get_refresh_family(jwt_payload):
+    """Refresh tokens issued before rotation have no ``fam`` claim and start a family of their own."""
+    return jwt_payload.get('fam', jwt_payload['jti'])
+
+
+def consume_refresh_token(jwt_payload, family_ttl):
+    """
+    Одноразовое использование refresh токена за один вызов Redis.
+
+    Lua-скрипт атомарно проверяет отзыв по jti и по поколению, отзыв семейства и помечает токен
+    использованным. Повторное предъявление уже использованного токена означает его утечку:
+    семейство (все токены, полученные цепочкой обновлений от одного входа) отзывается на
+    family_ttl секунд - время жизни самого нового refresh токена семейства.
+    Без Redis одноразовость не проверить, поэтому обновление не выполняется.
+    """
+    keys, args = _consume_arguments(jwt_payload, family_ttl)
+    try:
+        return redis_db.register_script(CONSUME_REFRESH_TOKEN_SCRIPT)(keys=keys, args=args, client=redis_db)
+    except RedisError as error:
+        logger.warning('token blocklist is unavailable', exc_info=True)
+        raise BlocklistUnavailableError('Refresh token was not consumed') from error
+
+
+async def consume_refresh_token_async(jwt_payload, family_ttl):
+    keys, args = _consume_arguments(jwt_payload, family_ttl)
+    try:
+        return await redis_db.aio.register_script(CONSUME_REFRESH_TOKEN_SCRIPT)(keys=keys, args=args)
+    except RedisError as error:
+        logger.warning('token blocklist is unavailable', exc_info=True)
+        raise BlocklistUnavailableError('Refresh token was not consumed') from error
+
+
+def _consume_arguments(jwt_payload, family_ttl):
+    jti = jwt_payload['jti']
+    keys = (
+        _key(jti),
+        _generation_key(jwt_payload['sub']),
+        _family_key(get_refresh_family(jwt_payload)),
+        _used_key(jti),
+    )
+    used_ttl = max(int(jwt_payload['exp'] - time.time()) + 1, 1)
+    args = (jwt_payload.get('gen', 0), used_ttl, family_ttl)
+    return keys, args
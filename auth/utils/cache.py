@@ -0,0 +1,215 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from redis import Redis, RedisError
+from redis import asyncio as aioredis
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class RedisClient:
+    """Redis connection configured from the app's ``REDIS_URI``."""
+
+    def __init__(self):
+        self._client = None
+        self._async_client = None
+        self._options = {}
+
+    def init_app(self, app):
+        self._options = {
+            'url': app.config['REDIS_URI'],
+            'decode_responses': True,
+            'socket_timeout': app.config.get('REDIS_SOCKET_TIMEOUT'),
+        }
+        self._client = Redis.from_url(**self._options)
+        self._async_client = None
+        app.extensions['redis'] = self
+
+    @property
+    def aio(self):
+        """asyncio client for the native async endpoints, created in the worker on first use."""
+        if self._async_client is None:
+            if not self._options:
+                raise RuntimeError('Redis client is not initialized')
+            self._async_client = aioredis.Redis.from_url(**self._options)
+        return self._async_client
+
+    def __getattr__(self, name):
+        if self._client is None:
+            raise RuntimeError('Redis client is not initialized')
+        return getattr(self._client, name)
+
+
+class LRUCache:
+    """Thread-safe in-process LRU cache with optional per-entry time to live."""
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def configure(self, maxsize, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clear()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                return default
+            value, expires_at = item
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        if self.maxsize <= 0:
+            return
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TieredCache:
+    """
+    Двухуровневый кеш: локальный LRU процесса перед общим для всех воркеров Redis.
+
+    Локальный уровень живет local_ttl секунд, поэтому после инвалидации в другом воркере
+    данные могут быть устаревшими не дольше этого времени. Ошибки Redis не роняют запрос:
+    кеш считается промахнувшимся, и вызывающий код идет в базу.
+    """
+
+    def __init__(self, namespace, redis, maxsize=1024, local_ttl=5, ttl=3600):
+        self.namespace = namespace
+        self.redis = redis
+        self.ttl = ttl
+        self.local = LRUCache(maxsize, local_ttl)
+
+    def configure(self, maxsize, local_ttl, ttl):
+        self.ttl = ttl
+        self.local.configure(maxsize, local_ttl)
+
+    def key(self, key):
+        return f'{self.namespace}:{key}'
+
+    def get(self, key):
+        value = self.local.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        try:
+            raw = self.redis.get(self.key(key))
+        except RedisError:
+            logger.warning('%s cache is unavailable', self.namespace, exc_info=True)
+            return None
+        if raw is None:
+            return None
+        value = json.loads(raw)
+        self.local.set(key, value)
+        return value
+
+    def set(self, key, value):
+        self.local.set(key, value)
+        try:
+            self.redis.set(self.key(key), json.dumps(value), ex=self.ttl)
+        except RedisError:
+            logger.warning('%s cache is unavailable', self.namespace, exc_info=True)
+
+    def get_many(self, keys):
+        """{key: value} of the cached keys: the worker LRU first, one MGET for the rest."""
+        found, missing = {}, []
+        for key in keys:
+            value = self.local.get(key, _MISSING)
+            if value is _MISSING:
+                missing.append(key)
+            else:
+                found[key] = value
+        if not missing:
+            return found
+        try:
+            raws = self.redis.mget([self.key(key) for key in missing])
+        except RedisError:
+            logger.warning('%s cache is unavailable', self.namespace, exc_info=True)
+            return found
+        for key, raw in zip(missing, raws):
+            if raw is not None:
+                found[key] = json.loads(raw)
+                self.local.set(key, found[key])
+        return found
+
+    def set_many(self, values):
+        if not values:
+            return
+        for key, value in values.items():
+            self.local.set(key, value)
+        try:
+            pipeline = self.redis.pipeline(transaction=False)
+            for key, value in values.items():
+                pipeline.set(self.key(key), json.dumps(value), ex=self.ttl)
+            pipeline.execute()
+        except RedisError:
+            logger.warning('%s cache is unavailable', self.namespace, exc_info=True)
+
+    async def get_async(self, key):
+        value = self.local.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        try:
+            raw = await self.redis.aio.get(self.key(key))
+        except RedisError:
+            logger.warning('%s cache is unavailable', self.namespace, exc_info=True)
+            return None
+        if raw is None:
+            return None
+        value = json.loads(raw)
+        self.local.set(key, value)
+        return value
+
+    async def set_async(self, key, value):
+        self.local.set(key, value)
+        try:
+            await self.redis.aio.set(self.key(key), json.dumps(value), ex=self.ttl)
+        except RedisError:
+            logger.warning('%s cache is unavailable', self.namespace, exc_info=True)
+
+    def delete(self, *keys):
+        if not keys:
+            return
+        self.local.delete(*keys)
+        try:
+            self.redis.delete(*(self.key(key) for key in keys))
+        except RedisError:
+            logger.warning('%s cache is unavailable', self.namespace, exc_info=True)
+
+    def clear(self):
+        self.local.clear()
+        try:
+            keys = list(self.redis.scan_iter(match=self.key('*'), count=1000))
+            for start in range(0, len(keys), 1000):
+                self.redis.delete(*keys[start:start + 1000])
+        except RedisError:
+            logger.warning('%s cache is unavailable', self.namespace, exc_info=True)
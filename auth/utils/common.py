@@ -2,16 +2,24 @@ import uuid
 from functools import wraps
 from http import HTTPStatus
 
-from flask import make_response
+from flask import current_app, make_response
 from flask_jwt_extended import create_access_token, create_refresh_token
 from flask_jwt_extended import get_jwt, get_jwt_identity, verify_jwt_in_request
 
-from extensions import db
-from models import Permission, RolePermissions, UserRole, User
+from extensions import db, redis_db
+from models import UserRole
+from utils.async_db import async_db
+from utils.blocklist import get_refresh_family, get_token_generation, get_token_generation_async
+from utils.cache import TieredCache
+from utils.hierarchy import descendant_ids
+from utils.permissions import has_permission, permission_claims, permission_claims_async
+from utils.queries import get_user, get_user_by_username, user_permissions, users_claims
+
+user_claims_cache = TieredCache('user_claims', redis_db)
 
 
 def get_user_id_by_username(username):
-    user = User.query.filter_by(username=username).first()
+    user = get_user_by_username(username)
     if user is not None:
         raise ValueError('User not exists', username)
 
@@ -19,39 +27,128 @@ def get_user_id_by_username(username):
 
 
 def get_user_permissions(user_id):
-    permissions = db.session.query(
-        Permission
-    ).join(
-        RolePermissions
-    ).join(
-        UserRole, UserRole.role_id == RolePermissions.role_id
-    ).filter(
-        UserRole.user_id == user_id
-    ).all()
+    return db.session.execute(user_permissions(user_id)).scalars().all()
 
-    return permissions
 
+def get_user_claims(user_id, user=None):
+    """
+    Права и флаг суперпользователя для токена. Результат кешируется по user_id, поэтому
+    join из get_user_permissions выполняется только при промахе кеша.
 
-def get_tokens(user_id, token=None):
+    :param user_id:
+    :param user: уже загруженный пользователь, чтобы не читать его из базы повторно
+    :return:
+    """
+    claims = user_claims_cache.get(str(user_id))
+    if claims is not None:
+        return claims
 
-    if token is None:
-        user = User.query.filter_by(id=user_id).first()
+    if user is None:
+        user = get_user(user_id)
         if not user:
             raise ValueError('User not exists', user_id)
 
-        permissions = [permission.code for permission in get_user_permissions(user.id)]
-        is_superuser = user.is_superuser
-    else:
-        permissions = token.get('permissions', [])
-        is_superuser = token.get('is_superuser', False)
+    claims = {
+        'permissions': [permission.code for permission in get_user_permissions(user.id)],
+        'is_superuser': bool(user.is_superuser),
+    }
+    user_claims_cache.set(str(user_id), claims)
+    return claims
+
 
-    additional_claims = {
-        'permissions': permissions,
-        'is_superuser': is_superuser,
+def get_users_claims(user_ids):
+    """
+    get_user_claims для многих пользователей сразу.
+
+    Закешированные claims берутся из кеша одним MGET, для остальных права собираются одним
+    запросом с группировкой по пользователю и кладутся в кеш. Промахи читаются из primary:
+    отставшая реплика положила бы в общий кеш права до последнего assign_roles на весь TTL.
+    Несуществующих пользователей в результате нет.
+
+    :return: {str(user_id): claims}
+    """
+    keys = list(dict.fromkeys(str(user_id) for user_id in user_ids))
+    claims = user_claims_cache.get_many(keys)
+    missing = [key for key in keys if key not in claims]
+    if missing:
+        loaded = {
+            str(row.id): {'permissions': sorted(set(row.codes or ())), 'is_superuser': bool(row.is_superuser)}
+            for row in db.session.execute(users_claims(missing), bind_arguments={'bind': db.engine})
+        }
+        user_claims_cache.set_many(loaded)
+        claims.update(loaded)
+    return claims
+
+
+async def get_user_claims_async(user_id, user=None):
+    """get_user_claims for the async endpoints: the cache and the permission join without blocking the loop."""
+    claims = await user_claims_cache.get_async(str(user_id))
+    if claims is not None:
+        return claims
+
+    if user is None:
+        user = await async_db.get_user(user_id)
+        if not user:
+            raise ValueError('User not exists', user_id)
+
+    claims = {
+        'permissions': await async_db.get_user_permission_codes(user.id),
+        'is_superuser': bool(user.is_superuser),
     }
+    await user_claims_cache.set_async(str(user_id), claims)
+    return claims
+
+
+def invalidate_user_claims(*user_ids):
+    user_claims_cache.delete(*(str(user_id) for user_id in user_ids))
+
+
+def get_role_user_ids(*role_ids):
+    """Users holding one of the roles or a role that inherits from it."""
+    rows = db.session.query(UserRole.user_id).filter(UserRole.role_id.in_(descendant_ids(role_ids))).distinct()
+    return [row.user_id for row in rows]
+
+
+def invalidate_role_claims(*role_ids):
+    """Drop cached claims of every user holding one of the roles."""
+    invalidate_user_claims(*get_role_user_ids(*role_ids))
+
+
+def get_tokens(user_id, token=None, user=None):
+
+    if token is None:
+        claims = get_user_claims(user_id, user)
+        encoding = current_app.config.get('JWT_PERMISSIONS_ENCODING', 'list')
+        additional_claims = permission_claims(claims['permissions'], encoding)
+        additional_claims['is_superuser'] = claims['is_superuser']
+        additional_claims['gen'] = get_token_generation(user_id)
+        family = uuid.uuid4().hex
+    else:
+        # Токен уже проверен consume_refresh_token, его поколение актуально.
+        additional_claims = {key: token[key] for key in ('permissions', 'pmask', 'pver') if key in token}
+        additional_claims['is_superuser'] = token.get('is_superuser', False)
+        additional_claims['gen'] = token.get('gen', 0)
+        family = get_refresh_family(token)
+
+    return _create_tokens(user_id, additional_claims, family)
+
+
+async def get_tokens_async(user_id, user=None):
+    """
+    Токены при входе для async эндпоинтов. Обновление по refresh токену не ходит в базу и Redis,
+    поэтому для него подходит get_tokens.
+    """
+    claims = await get_user_claims_async(user_id, user)
+    encoding = current_app.config.get('JWT_PERMISSIONS_ENCODING', 'list')
+    additional_claims = await permission_claims_async(claims['permissions'], encoding)
+    additional_claims['is_superuser'] = claims['is_superuser']
+    additional_claims['gen'] = await get_token_generation_async(user_id)
+    return _create_tokens(user_id, additional_claims, uuid.uuid4().hex)
+
 
+def _create_tokens(user_id, additional_claims, family):
     access_token = create_access_token(identity=user_id, additional_claims=additional_claims)
-    refresh_token = create_refresh_token(identity=user_id, additional_claims=additional_claims)
+    refresh_token = create_refresh_token(identity=user_id, additional_claims={**additional_claims, 'fam': family})
 
     return access_token, refresh_token
 
@@ -73,11 +170,10 @@ def permission_required(permission):
             claims = get_jwt()
             uri_user_id = kwargs.get('user_id')
             token_user_id = uuid.UUID(get_jwt_identity())
-            permissions = claims.get('permissions', [])
             is_superuser = claims.get('is_superuser', False)
             is_owner = uri_user_id == token_user_id
 
-            if is_superuser or is_owner or permission in permissions:
+            if is_superuser or is_owner or has_permission(claims, permission):
                 return fn(*args, **kwargs)
             else:
                 return make_response(
@@ -0,0 +1,229 @@
+import functools
+import logging
+import random
+import threading
+import time
+
+from flask import current_app, has_request_context, request
+from flask_jwt_extended import get_jwt_identity
+from flask_sqlalchemy import SignallingSession, SQLAlchemy
+from redis import RedisError
+from sqlalchemy import exc, orm
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql.dml import UpdateBase
+
+logger = logging.getLogger(__name__)
+
+# endpoint class -> setting with its statement timeout, ms
+STATEMENT_TIMEOUTS = {
+    'default': 'POSTGRES_STATEMENT_TIMEOUT',
+    'admin': 'POSTGRES_ADMIN_STATEMENT_TIMEOUT',
+    'export': 'POSTGRES_EXPORT_STATEMENT_TIMEOUT',
+}
+_STATEMENT_TIMEOUT_KEY = 'auth.statement_timeout'
+_REPLICA_READS_KEY = 'auth.replica_reads'
+_WROTE_KEY = 'auth.wrote'
+_STICKY_KEY = 'auth.sticky'
+
+
+class PoolMetrics:
+    """Checkout wait statistics of the connection pool of this process."""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, wait, timed_out=False):
+        with self._lock:
+            self.checkouts += 1
+            self.timeouts += timed_out
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = self.timeouts = 0
+            self.wait_total = self.wait_max = 0.0
+
+
+pool_metrics = PoolMetrics()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that measures how long requests wait for a free connection."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            pool_metrics.observe(time.perf_counter() - started, timed_out=True)
+            raise
+        pool_metrics.observe(time.perf_counter() - started)
+        return connection
+
+
+def engine_options(config):
+    """
+    Параметры движка SQLAlchemy из PostgresSettings.
+
+    statement_timeout по умолчанию задается при подключении, поэтому не стоит лишнего запроса;
+    классы эндпоинтов с другим таймаутом меняют его в своей транзакции через SET LOCAL.
+    PgBouncer отклоняет неизвестные ему параметры запуска, поэтому с POSTGRES_PGBOUNCER
+    передается только application_name, а таймаут ставится в каждой транзакции.
+    """
+    connect_args = {'application_name': config.POSTGRES_APPLICATION_NAME}
+    if not config.POSTGRES_PGBOUNCER:
+        connect_args['options'] = f'-c statement_timeout={config.POSTGRES_STATEMENT_TIMEOUT}'
+    return {
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': config.POSTGRES_POOL_SIZE,
+        'max_overflow': config.POSTGRES_MAX_OVERFLOW,
+        'pool_timeout': config.POSTGRES_POOL_TIMEOUT,
+        'pool_recycle': config.POSTGRES_POOL_RECYCLE,
+        'pool_pre_ping': config.POSTGRES_POOL_PRE_PING,
+        'connect_args': connect_args,
+    }
+
+
+def use_statement_timeout(endpoint_class):
+    """Apply the statement timeout of ``endpoint_class`` to transactions of the current request."""
+    request.environ[_STATEMENT_TIMEOUT_KEY] = current_app.config[STATEMENT_TIMEOUTS[endpoint_class]]
+
+
+def apply_statement_timeout(session, transaction, connection):
+    """
+    Session ``after_begin`` listener issuing SET LOCAL for requests with a non-default timeout,
+    and for every transaction behind PgBouncer, where connections carry no timeout of their own.
+    """
+    default = current_app.config['POSTGRES_STATEMENT_TIMEOUT']
+    timeout = request.environ.get(_STATEMENT_TIMEOUT_KEY, default) if has_request_context() else default
+    if timeout != default or current_app.config['POSTGRES_PGBOUNCER']:
+        connection.exec_driver_sql(f'SET LOCAL statement_timeout = {int(timeout)}')
+
+
+def pool_status(engine):
+    pool = engine.pool
+    return {
+        'size': pool.size(),
+        'in_use': pool.checkedout(),
+        'idle': pool.checkedin(),
+        'overflow': max(pool.overflow(), 0),
+        'checkouts': pool_metrics.checkouts,
+        'checkout_timeouts': pool_metrics.timeouts,
+        'checkout_wait_seconds_total': pool_metrics.wait_total,
+        'checkout_wait_seconds_max': pool_metrics.wait_max,
+    }
+
+
+def replica_bind_keys(config):
+    """SQLALCHEMY_BINDS entries for the read replicas listed in POSTGRES_REPLICA_URIS."""
+    uris = [uri.strip() for uri in config.POSTGRES_REPLICA_URIS.split(',') if uri.strip()]
+    return {f'replica_{number}': uri for number, uri in enumerate(uris)}
+
+
+def replica_reads(view):
+    """Let the read-only view read from a replica unless the request or its user has just written."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        request.environ[_REPLICA_READS_KEY] = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def _sticky_key(identity):
+    return f'replica_sticky:{identity}'
+
+
+def _identity():
+    try:
+        return get_jwt_identity()
+    except RuntimeError:
+        return None
+
+
+def _is_sticky():
+    """Did the current user write within POSTGRES_REPLICA_STICKY_SECONDS, so replicas may lag behind?"""
+    sticky = request.environ.get(_STICKY_KEY)
+    if sticky is None:
+        identity = _identity()
+        if identity is None:
+            sticky = False
+        else:
+            try:
+                sticky = bool(current_app.extensions['redis'].exists(_sticky_key(identity)))
+            except RedisError:
+                logger.warning('replica stickiness is unavailable, reading from primary', exc_info=True)
+                sticky = True
+        request.environ[_STICKY_KEY] = sticky
+    return sticky
+
+
+class RoutingSession(SignallingSession):
+    """
+    Сессия, отправляющая чтение read-only эндпоинтов на реплики.
+
+    Реплика выбирается, только если эндпоинт помечен replica_reads, в этом запросе еще не было
+    записи и пользователь не писал последние POSTGRES_REPLICA_STICKY_SECONDS секунд
+    (read-your-writes: после записи его чтения идут в primary, пока реплики догоняют).
+    Запись, flush и все вне запроса идут в primary.
+    """
+
+    def __init__(self, db, **options):
+        self.db = db
+        # SQLALCHEMY_BINDS holds only replicas and no model has a __bind_key__, so every table is on
+        # the primary: without the table -> engine map Session.get_bind no longer walks each statement
+        options.setdefault('binds', {})
+        super().__init__(db, **options)
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is not None:
+            # bind_arguments={'bind': db.engine} pins a read to the primary
+            return bind
+        if self._flushing or isinstance(clause, UpdateBase):
+            if has_request_context():
+                request.environ[_WROTE_KEY] = True
+            return super().get_bind(mapper, clause)
+
+        replica = self._choose_replica()
+        if replica is not None:
+            return replica
+        return super().get_bind(mapper, clause)
+
+    def _choose_replica(self):
+        if not has_request_context():
+            return None
+        environ = request.environ
+        if not environ.get(_REPLICA_READS_KEY) or environ.get(_WROTE_KEY):
+            return None
+        bind_keys = current_app.config.get('SQLALCHEMY_REPLICA_BINDS')
+        if not bind_keys or _is_sticky():
+            return None
+        return self.db.get_engine(self.app, bind=random.choice(bind_keys))
+
+
+def mark_sticky(session):
+    """Session ``after_commit`` listener starting the read-your-writes window of the user who wrote."""
+    if not has_request_context() or not current_app.config.get('SQLALCHEMY_REPLICA_BINDS'):
+        return
+    environ = request.environ
+    if not environ.get(_WROTE_KEY) or environ.get(_STICKY_KEY):
+        return
+    identity = _identity()
+    if identity is None:
+        return
+    environ[_STICKY_KEY] = True
+    try:
+        current_app.extensions['redis'].set(
+            _sticky_key(identity), 1, px=int(current_app.config['POSTGRES_REPLICA_STICKY_SECONDS'] * 1000)
+        )
+    except RedisError:
+        logger.warning('replica stickiness is unavailable', exc_info=True)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
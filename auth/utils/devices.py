@@ -0,0 +1,84 @@
+import hashlib
+import logging
+
+from redis import RedisError
+
+from extensions import redis_db
+from utils.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+
+def device_fingerprint(user_agent, device_key):
+    raw = f'{user_agent or ""}\0{device_key or ""}'
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class KnownDevices:
+    """
+    Кеш известных устройств пользователя: локальный LRU воркера перед множествами known_devices:{user_id} в Redis.
+
+    Явной инвалидации нет: пользователи удаляются вне приложения, в обход ORM. Множество живет
+    в Redis ttl секунд с записи последнего нового устройства, запись воркера - local_ttl секунд,
+    поэтому пользователь, удаленный и созданный заново с тем же id, получает записи устройств
+    не позже истечения этих сроков.
+    Если Redis недоступен, устройство считается новым: его вставка идемпотентна
+    и стоит лишь лишнего обращения к базе.
+    """
+
+    def __init__(self, redis, maxsize=0, local_ttl=300, ttl=30 * 24 * 3600):
+        self.redis = redis
+        self.ttl = ttl
+        self.local = LRUCache(maxsize, local_ttl)
+
+    def configure(self, maxsize, local_ttl, ttl):
+        self.ttl = ttl
+        self.local.configure(maxsize, local_ttl)
+
+    @staticmethod
+    def key(user_id):
+        return f'known_devices:{user_id}'
+
+    def filter_unknown(self, devices):
+        """Devices (dicts with user_id and fingerprint) that may be missing from the database."""
+        candidates = [
+            device for device in devices
+            if not self.local.get((str(device['user_id']), device['fingerprint']))
+        ]
+        if not candidates:
+            return []
+
+        try:
+            pipeline = self.redis.pipeline(transaction=False)
+            for device in candidates:
+                pipeline.sismember(self.key(device['user_id']), device['fingerprint'])
+            known = pipeline.execute()
+        except RedisError:
+            logger.warning('known devices cache is unavailable', exc_info=True)
+            return candidates
+
+        unknown = []
+        for device, is_known in zip(candidates, known):
+            if is_known:
+                self.local.set((str(device['user_id']), device['fingerprint']), True)
+            else:
+                unknown.append(device)
+        return unknown
+
+    def remember(self, devices):
+        """Mark devices as known once they are written to the database."""
+        if not devices:
+            return
+        for device in devices:
+            self.local.set((str(device['user_id']), device['fingerprint']), True)
+        try:
+            pipeline = self.redis.pipeline(transaction=False)
+            for device in devices:
+                pipeline.sadd(self.key(device['user_id']), device['fingerprint'])
+                pipeline.expire(self.key(device['user_id']), self.ttl)
+            pipeline.execute()
+        except RedisError:
+            logger.warning('known devices cache is unavailable', exc_info=True)
+
+
+known_devices = KnownDevices(redis_db)
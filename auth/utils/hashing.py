@@ -0,0 +1,144 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+EXECUTORS = ('process', 'thread', 'inline')
+
+
+class HashingUnavailableError(Exception):
+    """The hashing pool is saturated or did not answer in time."""
+
+
+class PasswordHasher:
+    """
+    Выполняет PBKDF2 вне потока, обрабатывающего запрос.
+
+    Хеширование уходит в пул процессов (по умолчанию размером с число ядер), поэтому тяжелые
+    /login и /register масштабируются по ядрам и не занимают GIL, пока дешевые эндпойнты
+    обслуживают свои запросы. Очередь ограничена: если свободного места нет дольше HASHING_TIMEOUT
+    секунд, выбрасывается HashingUnavailableError и клиент получает 503 вместо бесконечного ожидания.
+    """
+
+    def __init__(self, executor='inline', pool_size=1, queue_size=0, timeout=None):
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._configure(executor, pool_size, queue_size, timeout)
+
+    def init_app(self, app):
+        self.shutdown()
+        self._configure(
+            app.config.get('HASHING_EXECUTOR', 'process'),
+            app.config.get('HASHING_POOL_SIZE') or os.cpu_count() or 1,
+            app.config.get('HASHING_QUEUE_SIZE', 0),
+            app.config.get('HASHING_TIMEOUT'),
+        )
+        app.extensions['password_hasher'] = self
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password)
+
+    def hash_many(self, passwords):
+        """
+        Hash a batch for bulk imports: chunks go to every worker of the pool at once.
+
+        Jobs are submitted immediately and the hashes come back lazily, in order, so the caller
+        can load the previous batch meanwhile. The request queue limit and timeout do not apply.
+        """
+        if self.executor_type == 'inline':
+            return map(generate_password_hash, passwords)
+        chunksize = max(1, len(passwords) // (self.pool_size * 4))
+        return self._get_executor().map(generate_password_hash, passwords, chunksize=chunksize)
+
+    def verify(self, pwd_hash, password):
+        if not pwd_hash or password is None:
+            return False
+        return self._run(check_password_hash, pwd_hash, password)
+
+    async def verify_async(self, pwd_hash, password):
+        """verify for the event loop: waits for the pool without blocking the loop."""
+        if not pwd_hash or password is None:
+            return False
+        return await self._run_async(check_password_hash, pwd_hash, password)
+
+    def shutdown(self, wait=False):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+            self._pid = None
+
+    def _configure(self, executor, pool_size, queue_size, timeout):
+        if executor not in EXECUTORS:
+            raise ValueError('Unknown hashing executor', executor)
+        self.executor_type = executor
+        self.pool_size = max(int(pool_size), 1)
+        self.queue_size = max(int(queue_size), 0)
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(self.pool_size + self.queue_size)
+
+    def _get_executor(self):
+        # Пул создается лениво и пересоздается после fork: процессы пула родителя в воркере недоступны.
+        if self._executor is not None and self._pid == os.getpid():
+            return self._executor
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                if self.executor_type == 'process':
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.pool_size,
+                        mp_context=multiprocessing.get_context('spawn'),
+                    )
+                else:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.pool_size,
+                        thread_name_prefix='password-hasher',
+                    )
+                self._pid = os.getpid()
+        return self._executor
+
+    async def _run_async(self, fn, *args):
+        if self.executor_type == 'inline':
+            return fn(*args)
+
+        # Слот нельзя ждать на семафоре потоков из цикла событий: при заполненной очереди сразу 503.
+        if not self._slots.acquire(blocking=False):
+            raise HashingUnavailableError('Password hashing queue is full')
+        future = asyncio.wrap_future(self._submit(fn, *args))
+        try:
+            return await asyncio.wait_for(future, timeout=self.timeout)
+        except asyncio.TimeoutError:
+            raise HashingUnavailableError('Password hashing timed out')
+
+    def _run(self, fn, *args):
+        if self.executor_type == 'inline':
+            return fn(*args)
+
+        if not self._slots.acquire(timeout=self.timeout):
+            raise HashingUnavailableError('Password hashing queue is full')
+        future = self._submit(fn, *args)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise HashingUnavailableError('Password hashing timed out')
+
+    def _submit(self, fn, *args):
+        """
+        Submit a job holding an acquired slot.
+
+        The slot is released when the job finishes, not when the caller stops waiting for it:
+        a job that timed out still occupies a worker.
+        """
+        slots = self._slots
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            slots.release()
+            raise
+        future.add_done_callback(lambda _: slots.release())
+        return future
@@ -0,0 +1,156 @@
+"""
+Иерархия ролей: ребра roles_parents и их транзитивное замыкание roles_closure.
+
+Замыкание хранит для каждой пары (предок, потомок) число путей между ними, поэтому у роли
+может быть несколько родителей: новое ребро parent -> role прибавляет к каждой паре
+(предок parent, потомок role) произведение путей через это ребро, удаление ребра вычитает
+то же произведение, а пары без путей удаляются. Каждое изменение - несколько запросов над
+множествами строк, без обхода графа в Python. Коммит остается за вызывающим.
+
+Изменения ребер сериализуются блокировкой roles_parents до конца транзакции: иначе
+одновременные A -> B и B -> A проходят проверку на цикл по еще не обновленному замыканию.
+"""
+from sqlalchemy import delete, exists, func, or_, select, text, true, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import aliased
+
+from extensions import db
+from models import Role, RoleClosure, RoleParent
+
+
+class HierarchyCycleError(ValueError):
+    """The parent already inherits from the role."""
+
+
+def _paths_through_edge(role_id, parent_id):
+    """(ancestor of the parent, descendant of the role, number of paths) going through parent -> role."""
+    ancestors = aliased(RoleClosure)
+    descendants = aliased(RoleClosure)
+    return select(
+        ancestors.ancestor_id,
+        descendants.descendant_id,
+        (ancestors.paths * descendants.paths).label('paths'),
+    ).join_from(
+        ancestors, descendants, true()
+    ).where(
+        ancestors.descendant_id == parent_id,
+        descendants.ancestor_id == role_id,
+    )
+
+
+def lock_hierarchy():
+    """
+    Block other changes of role edges until the transaction ends.
+
+    SHARE ROW EXCLUSIVE conflicts with itself and with writes, but not with reads.
+    """
+    db.session.execute(text(f'LOCK TABLE {RoleParent.__tablename__} IN SHARE ROW EXCLUSIVE MODE'))
+
+
+def is_ancestor(ancestor_id, descendant_id):
+    return db.session.execute(select(exists().where(
+        RoleClosure.ancestor_id == ancestor_id, RoleClosure.descendant_id == descendant_id
+    ))).scalar()
+
+
+def add_parent(role_id, parent_id):
+    """
+    Make ``role_id`` inherit the permissions of ``parent_id``.
+
+    :return: False if the role already had this parent
+    """
+    lock_hierarchy()
+    if is_ancestor(role_id, parent_id):
+        raise HierarchyCycleError(role_id, parent_id)
+    created = db.session.execute(
+        insert(RoleParent).values(
+            role_id=role_id, parent_id=parent_id
+        ).on_conflict_do_nothing().returning(RoleParent.role_id)
+    ).first()
+    if created is None:
+        return False
+
+    statement = insert(RoleClosure).from_select(
+        ['ancestor_id', 'descendant_id', 'paths'], _paths_through_edge(role_id, parent_id)
+    )
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=[RoleClosure.descendant_id, RoleClosure.ancestor_id],
+        set_={'paths': RoleClosure.paths + statement.excluded.paths},
+    ))
+    return True
+
+
+def remove_parent(role_id, parent_id):
+    """
+    Stop ``role_id`` inheriting from ``parent_id``.
+
+    :return: False if there was no such edge
+    """
+    lock_hierarchy()
+    removed = db.session.execute(
+        delete(RoleParent).where(
+            RoleParent.role_id == role_id, RoleParent.parent_id == parent_id
+        ).returning(RoleParent.role_id)
+    ).first()
+    if removed is None:
+        return False
+
+    edge = _paths_through_edge(role_id, parent_id).subquery()
+    db.session.execute(
+        update(RoleClosure).values(
+            paths=RoleClosure.paths - edge.c.paths
+        ).where(
+            RoleClosure.ancestor_id == edge.c.ancestor_id,
+            RoleClosure.descendant_id == edge.c.descendant_id,
+        ).execution_options(synchronize_session=False)
+    )
+    db.session.execute(
+        delete(RoleClosure).where(RoleClosure.paths <= 0).execution_options(synchronize_session=False)
+    )
+    return True
+
+
+def detach_role(role_id):
+    """Remove every edge of the role before deleting it, so paths going through it leave the closure."""
+    lock_hierarchy()
+    edges = db.session.execute(
+        select(RoleParent.role_id, RoleParent.parent_id).where(
+            or_(RoleParent.role_id == role_id, RoleParent.parent_id == role_id)
+        )
+    ).all()
+    for edge in edges:
+        remove_parent(edge.role_id, edge.parent_id)
+
+
+def rebuild_closure():
+    """
+    Recompute the whole closure from roles_parents in two statements, for bulk edge changes.
+
+    The edges must not form a cycle: the recursive query would never end. Call lock_hierarchy
+    before reading the edges the new ones were checked against.
+    """
+    lock_hierarchy()
+    paths = select(
+        Role.id.label('ancestor_id'), Role.id.label('descendant_id')
+    ).cte('paths', recursive=True)
+    paths = paths.union_all(
+        select(paths.c.ancestor_id, RoleParent.role_id).join_from(
+            paths, RoleParent, RoleParent.parent_id == paths.c.descendant_id
+        )
+    )
+    db.session.execute(delete(RoleClosure).execution_options(synchronize_session=False))
+    db.session.execute(insert(RoleClosure).from_select(
+        ['ancestor_id', 'descendant_id', 'paths'],
+        select(paths.c.ancestor_id, paths.c.descendant_id, func.count()).group_by(
+            paths.c.ancestor_id, paths.c.descendant_id
+        ),
+    ))
+
+
+def get_parent_ids(role_id):
+    return db.session.execute(select(RoleParent.parent_id).where(RoleParent.role_id == role_id)).scalars().all()
+
+
+def descendant_ids(role_ids):
+    """Select of the roles inheriting from any of ``role_ids``, the roles themselves included."""
+    return select(RoleClosure.descendant_id).where(RoleClosure.ancestor_id.in_(role_ids))
@@ -0,0 +1,118 @@
+import base64
+import hashlib
+import json
+
+from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
+from cryptography.hazmat.primitives.serialization import load_pem_private_key, load_pem_public_key
+from jwt.algorithms import OKPAlgorithm, RSAAlgorithm
+
+ASYMMETRIC_ALGORITHMS = {
+    'RS256': RSAAlgorithm,
+    'RS384': RSAAlgorithm,
+    'RS512': RSAAlgorithm,
+    'PS256': RSAAlgorithm,
+    'PS384': RSAAlgorithm,
+    'PS512': RSAAlgorithm,
+    'EdDSA': OKPAlgorithm,
+}
+
+# RFC 7638: members that take part in the thumbprint, per key type
+THUMBPRINT_MEMBERS = {
+    'RSA': ('e', 'kty', 'n'),
+    'OKP': ('crv', 'kty', 'x'),
+}
+
+
+def read_key(path):
+    with open(path) as key_file:
+        return key_file.read()
+
+
+def public_key_to_jwk(public_key_pem, algorithm, kid=None):
+    key = load_pem_public_key(public_key_pem.encode())
+    jwk = json.loads(ASYMMETRIC_ALGORITHMS[algorithm].to_jwk(key))
+    jwk.update(alg=algorithm, use='sig', kid=kid or jwk_thumbprint(jwk))
+    return jwk
+
+
+def public_key_from_private(private_key_pem):
+    key = load_pem_private_key(private_key_pem.encode(), password=None)
+    return key.public_key().public_bytes(Encoding.PEM, PublicFormat.SubjectPublicKeyInfo).decode()
+
+
+def jwk_thumbprint(jwk):
+    members = {name: jwk[name] for name in THUMBPRINT_MEMBERS[jwk['kty']]}
+    digest = hashlib.sha256(json.dumps(members, separators=(',', ':'), sort_keys=True).encode()).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b'=').decode()
+
+
+class KeySet:
+    """
+    Ключи подписи токенов и их публикация в виде JWKS.
+
+    Текущий ключ подписывает токены и попадает в заголовок kid. Предыдущий публичный ключ
+    (если задан) остается в JWKS и принимается при проверке, чтобы ротация ключа
+    не разлогинивала пользователей с еще живыми токенами.
+    """
+
+    def __init__(self, algorithm, private_key=None, public_key=None, previous_public_key=None, kid=None,
+                 secret_key=None):
+        self.algorithm = algorithm
+        self.secret_key = secret_key
+        self.kid = None
+        self.private_key = private_key
+        self.public_keys = {}
+        self.jwks = {'keys': []}
+
+        if self.is_asymmetric:
+            self._load_keys(public_key, previous_public_key, kid)
+
+        self.body = json.dumps(self.jwks, separators=(',', ':'))
+        self.etag = hashlib.sha256(self.body.encode()).hexdigest()[:32]
+
+    def _load_keys(self, public_key, previous_public_key, kid):
+        if self.private_key is None:
+            raise ValueError('Private key is required for algorithm', self.algorithm)
+        public_key = public_key or public_key_from_private(self.private_key)
+
+        current = public_key_to_jwk(public_key, self.algorithm, kid)
+        self.kid = current['kid']
+        self.public_keys[self.kid] = public_key
+        self.jwks['keys'].append(current)
+
+        if previous_public_key:
+            previous = public_key_to_jwk(previous_public_key, self.algorithm)
+            self.public_keys.setdefault(previous['kid'], previous_public_key)
+            self.jwks['keys'].append(previous)
+
+    @property
+    def is_asymmetric(self):
+        return self.algorithm in ASYMMETRIC_ALGORITHMS
+
+    @property
+    def public_key(self):
+        return self.public_keys.get(self.kid)
+
+    @classmethod
+    def from_config(cls, config):
+        algorithm = config.get('JWT_ALGORITHM', 'HS256')
+        if algorithm not in ASYMMETRIC_ALGORITHMS:
+            return cls(algorithm, secret_key=config.get('JWT_SECRET_KEY'))
+
+        private_key = config.get('JWT_PRIVATE_KEY')
+        if not private_key and config.get('JWT_PRIVATE_KEY_PATH'):
+            private_key = read_key(config['JWT_PRIVATE_KEY_PATH'])
+        public_key = config.get('JWT_PUBLIC_KEY')
+        if not public_key and config.get('JWT_PUBLIC_KEY_PATH'):
+            public_key = read_key(config['JWT_PUBLIC_KEY_PATH'])
+        previous_public_key = None
+        if config.get('JWT_PREVIOUS_PUBLIC_KEY_PATH'):
+            previous_public_key = read_key(config['JWT_PREVIOUS_PUBLIC_KEY_PATH'])
+
+        return cls(algorithm, private_key, public_key, previous_public_key, config.get('JWT_KEY_ID'))
+
+    def decode_key(self, jwt_header):
+        """Public key for the token's kid; tokens without kid are checked with the current key."""
+        if not self.is_asymmetric:
+            return self.secret_key
+        return self.public_keys.get(jwt_header.get('kid'), self.public_key)
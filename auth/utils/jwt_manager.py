@@ -0,0 +1,38 @@
+import hashlib
+import time
+
+from flask_jwt_extended import JWTManager
+
+from utils.cache import LRUCache
+
+
+class CachingJWTManager(JWTManager):
+    """
+    JWTManager, который проверяет подпись и разбирает каждый токен один раз на воркер.
+
+    Один и тот же access токен предъявляется сотни раз за время жизни, поэтому результат
+    декодирования кешируется по sha256 токена до его exp. Проверки отзыва и типа токена
+    выполняются flask-jwt-extended после декодирования и кешем не затрагиваются.
+    Кеш включается настройкой JWT_VERIFIED_TOKEN_CACHE_SIZE > 0.
+    """
+
+    def __init__(self, app=None):
+        self.verified_tokens = LRUCache(maxsize=0)
+        super().__init__(app)
+
+    def init_app(self, app):
+        super().init_app(app)
+        self.verified_tokens.configure(app.config.get('JWT_VERIFIED_TOKEN_CACHE_SIZE', 0))
+
+    def _decode_jwt_from_config(self, encoded_token, csrf_value=None, allow_expired=False):
+        if self.verified_tokens.maxsize <= 0 or csrf_value is not None or allow_expired:
+            return super()._decode_jwt_from_config(encoded_token, csrf_value, allow_expired)
+
+        key = hashlib.sha256(encoded_token.encode()).digest()
+        decoded_token = self.verified_tokens.get(key)
+        if decoded_token is None:
+            decoded_token = super()._decode_jwt_from_config(encoded_token, csrf_value, allow_expired)
+            ttl = decoded_token.get('exp', 0) - time.time()
+            if ttl > 0:
+                self.verified_tokens.set(key, decoded_token, ttl=ttl)
+        return dict(decoded_token)
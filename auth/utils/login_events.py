@@ -0,0 +1,155 @@
+import atexit
+import datetime
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+
+from sqlalchemy.dialects.postgresql import insert
+
+from extensions import db
+from utils.devices import device_fingerprint, known_devices
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class LoginEventWriter:
+    """
+    Фоновая запись истории входов пачками.
+
+    /login только кладет событие в ограниченную очередь. Фоновый поток забирает события
+    и пишет их одним многострочным INSERT, как только набралось LOGIN_EVENTS_BATCH_SIZE событий
+    или прошло LOGIN_EVENTS_FLUSH_INTERVAL секунд. Если очередь заполнена, запрос ждет
+    не дольше LOGIN_EVENTS_ENQUEUE_TIMEOUT, после чего событие отбрасывается: вход важнее истории.
+    При остановке процесса очередь дописывается в базу. Отброшенные события и события
+    неудавшихся записей считаются в dropped и failed и отдаются в /api/v1/metrics.
+
+    Событие входа хранит только отпечаток устройства. Само устройство (user agent, device_key)
+    пишется в devices_table лишь если его нет в кеше известных устройств, в той же транзакции.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.table = None
+        self.devices_table = None
+        self.batch_size = 500
+        self.flush_interval = 1.0
+        self.enqueue_timeout = 0.05
+        self.dropped = 0
+        self.failed = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        atexit.register(self.stop)
+
+    def init_app(self, app, table, devices_table):
+        self.stop()
+        self.app = app
+        self.table = table
+        self.devices_table = devices_table
+        self.batch_size = app.config.get('LOGIN_EVENTS_BATCH_SIZE', self.batch_size)
+        self.flush_interval = app.config.get('LOGIN_EVENTS_FLUSH_INTERVAL', self.flush_interval)
+        self.enqueue_timeout = app.config.get('LOGIN_EVENTS_ENQUEUE_TIMEOUT', self.enqueue_timeout)
+        self._queue = queue.Queue(maxsize=app.config.get('LOGIN_EVENTS_QUEUE_SIZE', 0))
+        app.extensions['login_events'] = self
+
+    def enqueue(self, user_id, ip=None, user_agent=None, device_key=None, block=True):
+        """Queue a login; ``block=False`` drops the event at once if the queue is full (event loop callers)."""
+        now = datetime.datetime.now()
+        fingerprint = device_fingerprint(user_agent, device_key)
+        event = {
+            'id': uuid.uuid4(),
+            'user_id': user_id,
+            'ip': ip,
+            'fingerprint': fingerprint,
+            'created_at': now,
+            'updated_at': now,
+        }
+        device = {
+            'id': uuid.uuid4(),
+            'user_id': user_id,
+            'fingerprint': fingerprint,
+            'user_agent': user_agent,
+            'device_key': device_key,
+            'created_at': now,
+            'updated_at': now,
+        }
+        self._ensure_started()
+        try:
+            self._queue.put((event, device), block=block, timeout=self.enqueue_timeout)
+        except queue.Full:
+            self.dropped += 1
+            logger.warning('login events queue is full, event of user %s is dropped', user_id)
+
+    def flush(self):
+        """Block until every queued event is written."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def stop(self):
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._thread = None
+                return
+            self._queue.put(_STOP)
+            self._thread.join(timeout=self.flush_interval + 10)
+            self._thread = None
+
+    def _ensure_started(self):
+        # Поток создается в том процессе, который пишет события: после fork поток родителя не существует.
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._thread = threading.Thread(target=self._run, name='login-events-writer', daemon=True)
+                self._pid = os.getpid()
+                self._thread.start()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    event = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if event is _STOP:
+                    self._queue.task_done()
+                    stopping = True
+                    break
+                batch.append(event)
+
+            if batch:
+                self._write(batch)
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch):
+        devices = {}
+        for _, device in batch:
+            devices.setdefault((device['user_id'], device['fingerprint']), device)
+        try:
+            new_devices = known_devices.filter_unknown(list(devices.values()))
+            with db.get_engine(self.app).begin() as connection:
+                if new_devices:
+                    connection.execute(
+                        insert(self.devices_table).values(new_devices).on_conflict_do_nothing(
+                            index_elements=['user_id', 'fingerprint'],
+                        )
+                    )
+                connection.execute(self.table.insert().values([event for event, _ in batch]))
+        except Exception:
+            self.failed += len(batch)
+            logger.exception('failed to write %s login events', len(batch))
+            return
+        known_devices.remember(new_devices)
+
+
+login_events = LoginEventWriter()
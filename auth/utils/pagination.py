@@ -0,0 +1,23 @@
+import base64
+import datetime
+import json
+import uuid
+
+
+class InvalidCursorError(ValueError):
+    """Cursor from the query string can't be decoded."""
+
+
+def encode_cursor(created_at, row_id):
+    """Opaque keyset cursor pointing at the last row of a page ordered by (created_at, id)."""
+    raw = json.dumps([created_at.isoformat(), str(row_id)], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, row_id = json.loads(raw)
+        return datetime.datetime.fromisoformat(created_at), uuid.UUID(row_id)
+    except (TypeError, ValueError) as error:
+        raise InvalidCursorError('Invalid cursor', cursor) from error
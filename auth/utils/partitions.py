@@ -0,0 +1,108 @@
+import datetime
+import logging
+import re
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+PARTITION_NAME = re.compile(r'.+_(\d{4}_\d{2}|default)')
+
+
+def month_start(day, shift=0):
+    """First day of the month ``shift`` months away from the month of ``day``."""
+    months = day.year * 12 + day.month - 1 + shift
+    return datetime.date(months // 12, months % 12 + 1, 1)
+
+
+def partition_name(table, month):
+    return f'{table.name}_{month:%Y_%m}'
+
+
+def default_partition_name(table):
+    return f'{table.name}_default'
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    """Alembic autogenerate filter: monthly partitions are managed here, not by migrations."""
+    table = object if type_ == 'table' else getattr(object, 'table', None)
+    return not (reflected and compare_to is None and table is not None and PARTITION_NAME.fullmatch(table.name))
+
+
+def get_partitions(connection, table):
+    """Names of the partitions attached to ``table``."""
+    rows = connection.execute(
+        text(
+            'SELECT child.relname FROM pg_inherits '
+            'JOIN pg_class parent ON parent.oid = pg_inherits.inhparent '
+            'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+            'WHERE parent.oid = CAST(:table AS regclass)'
+        ),
+        {'table': table.name},
+    )
+    return {row.relname for row in rows}
+
+
+def create_partitions(connection, table, today=None, ahead=3, column='created_at'):
+    """
+    Создаем месячные партиции от текущего месяца на ahead месяцев вперед.
+
+    Запуск идемпотентен: существующие партиции пропускаются. Строки месяца без партиции
+    попадают в DEFAULT партицию; при создании партиции месяца они переносятся в нее,
+    иначе Postgres не даст создать партицию, пересекающуюся со строками DEFAULT.
+    """
+    month = month_start(today or datetime.date.today())
+    existing = get_partitions(connection, table)
+    default = default_partition_name(table)
+    created = []
+    for shift in range(ahead + 1):
+        start, end = month_start(month, shift), month_start(month, shift + 1)
+        name = partition_name(table, start)
+        if name in existing:
+            continue
+        bounds = f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        if default not in existing:
+            connection.execute(text(f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "{table.name}" {bounds}'))
+        else:
+            connection.execute(text(
+                f'CREATE TABLE IF NOT EXISTS "{name}" (LIKE "{table.name}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'
+            ))
+            connection.execute(text(
+                f'WITH moved AS (DELETE FROM "{default}" WHERE "{column}" >= :start AND "{column}" < :end RETURNING *) '
+                f'INSERT INTO "{name}" SELECT * FROM moved'
+            ), {'start': start, 'end': end})
+            connection.execute(text(f'ALTER TABLE "{table.name}" ATTACH PARTITION "{name}" {bounds}'))
+        created.append(name)
+    return created
+
+
+def drop_partitions(connection, table, today=None, retention=12, column='created_at'):
+    """
+    Удаляем партиции месяцев старше retention месяцев целиком.
+
+    DROP TABLE партиции освобождает место сразу и не оставляет мертвых строк,
+    в отличие от DELETE по всей таблице. Текущий месяц входит в retention.
+    Устаревшие строки DEFAULT партиции удаляются обычным DELETE.
+    """
+    first_month = month_start(today or datetime.date.today(), 1 - retention)
+    cutoff = partition_name(table, first_month)
+    prefix = f'{table.name}_'
+    default = default_partition_name(table)
+    dropped = []
+    for name in sorted(get_partitions(connection, table)):
+        if name == default:
+            connection.execute(text(f'DELETE FROM "{name}" WHERE "{column}" < :cutoff'), {'cutoff': first_month})
+        # Names end with YYYY_MM, so they compare in month order.
+        elif name.startswith(prefix) and name < cutoff:
+            connection.execute(text(f'DROP TABLE IF EXISTS "{name}"'))
+            dropped.append(name)
+    return dropped
+
+
+def maintain_partitions(engine, table, ahead=3, retention=12, today=None):
+    with engine.begin() as connection:
+        created = create_partitions(connection, table, today=today, ahead=ahead)
+        dropped = drop_partitions(connection, table, today=today, retention=retention)
+    if created or dropped:
+        logger.info('%s partitions created: %s, dropped: %s', table.name, created, dropped)
+    return created, dropped
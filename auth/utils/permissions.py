@@ -0,0 +1,201 @@
+import base64
+import hashlib
+import json
+import logging
+
+from redis import RedisError
+
+from extensions import redis_db
+from models import Permission
+from utils.async_db import async_db
+from utils.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+CURRENT_VERSION_KEY = 'permission_index:current'
+
+# Индексы неизменяемы, поэтому версии кешируются в воркере навсегда. Текущая версия - ненадолго.
+# У каждой функции есть async-вариант для эндпоинтов в цикле событий: промах читает таблицу через
+# async_db, а не через сессию Flask-SQLAlchemy.
+_indexes = {}
+_current = LRUCache(maxsize=1, ttl=60)
+
+
+def _index_key(version):
+    return f'permission_index:{version}'
+
+
+class PermissionIndex:
+    """
+    Версия реестра прав: каждому коду права соответствует номер бита.
+
+    Версия - хеш упорядоченного списка кодов, поэтому одинаковый набор прав во всех воркерах
+    дает одну и ту же версию. Токен хранит версию вместе с маской и проверяется
+    по тому индексу, с которым был выпущен.
+    """
+
+    def __init__(self, codes):
+        self.codes = tuple(codes)
+        self.positions = {code: position for position, code in enumerate(self.codes)}
+        self.version = hashlib.sha1('\n'.join(self.codes).encode()).hexdigest()[:8]
+
+    def encode(self, codes):
+        mask = 0
+        for code in codes:
+            position = self.positions.get(code)
+            if position is not None:
+                mask |= 1 << position
+        raw = mask.to_bytes((mask.bit_length() + 7) // 8, 'little')
+        return base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+
+    @staticmethod
+    def decode(encoded_mask):
+        raw = base64.urlsafe_b64decode(encoded_mask + '=' * (-len(encoded_mask) % 4))
+        return int.from_bytes(raw, 'little')
+
+    def has(self, encoded_mask, code):
+        position = self.positions.get(code)
+        if position is None:
+            return False
+        return bool(self.decode(encoded_mask) >> position & 1)
+
+
+def build_permission_index():
+    rows = Permission.query.with_entities(Permission.code).order_by(Permission.code)
+    return PermissionIndex(row.code for row in rows)
+
+
+async def build_permission_index_async():
+    return PermissionIndex(await async_db.get_permission_codes())
+
+
+def get_current_permission_index():
+    index = _current.get(CURRENT_VERSION_KEY)
+    if index is not None:
+        return index
+
+    index = None
+    try:
+        version = redis_db.get(CURRENT_VERSION_KEY)
+        if version is not None:
+            index = get_permission_index(version)
+    except RedisError:
+        logger.warning('permission index registry is unavailable', exc_info=True)
+
+    if index is None:
+        index = build_permission_index()
+        _indexes[index.version] = index
+        try:
+            redis_db.set(_index_key(index.version), json.dumps(index.codes))
+            redis_db.set(CURRENT_VERSION_KEY, index.version)
+        except RedisError:
+            logger.warning('permission index registry is unavailable', exc_info=True)
+
+    _current.set(CURRENT_VERSION_KEY, index)
+    return index
+
+
+async def get_current_permission_index_async():
+    index = _current.get(CURRENT_VERSION_KEY)
+    if index is not None:
+        return index
+
+    index = None
+    try:
+        version = await redis_db.aio.get(CURRENT_VERSION_KEY)
+        if version is not None:
+            index = await get_permission_index_async(version)
+    except RedisError:
+        logger.warning('permission index registry is unavailable', exc_info=True)
+
+    if index is None:
+        index = await build_permission_index_async()
+        _indexes[index.version] = index
+        try:
+            await redis_db.aio.set(_index_key(index.version), json.dumps(index.codes))
+            await redis_db.aio.set(CURRENT_VERSION_KEY, index.version)
+        except RedisError:
+            logger.warning('permission index registry is unavailable', exc_info=True)
+
+    _current.set(CURRENT_VERSION_KEY, index)
+    return index
+
+
+def get_permission_index(version):
+    index = _indexes.get(version)
+    if index is not None:
+        return index
+
+    try:
+        codes = redis_db.get(_index_key(version))
+    except RedisError:
+        logger.warning('permission index registry is unavailable', exc_info=True)
+        return None
+    if codes is not None:
+        index = PermissionIndex(json.loads(codes))
+    else:
+        # Registry in Redis was lost; the version may still be the one of the current table.
+        index = build_permission_index()
+        if index.version != version:
+            return None
+
+    _indexes[version] = index
+    return index
+
+
+async def get_permission_index_async(version):
+    index = _indexes.get(version)
+    if index is not None:
+        return index
+
+    try:
+        codes = await redis_db.aio.get(_index_key(version))
+    except RedisError:
+        logger.warning('permission index registry is unavailable', exc_info=True)
+        return None
+    if codes is not None:
+        index = PermissionIndex(json.loads(codes))
+    else:
+        index = await build_permission_index_async()
+        if index.version != version:
+            return None
+
+    _indexes[version] = index
+    return index
+
+
+def invalidate_permission_index():
+    """Next token issuance rebuilds the index from the permissions table; issued versions stay readable."""
+    _current.clear()
+    try:
+        redis_db.delete(CURRENT_VERSION_KEY)
+    except RedisError:
+        logger.warning('permission index registry is unavailable', exc_info=True)
+
+
+def permission_claims(codes, encoding='list'):
+    if encoding == 'bitmask':
+        index = get_current_permission_index()
+        return {'pmask': index.encode(codes), 'pver': index.version}
+    return {'permissions': list(codes)}
+
+
+async def permission_claims_async(codes, encoding='list'):
+    if encoding == 'bitmask':
+        index = await get_current_permission_index_async()
+        return {'pmask': index.encode(codes), 'pver': index.version}
+    return {'permissions': list(codes)}
+
+
+def has_permission(claims, code):
+    if 'pmask' in claims:
+        index = get_permission_index(claims.get('pver'))
+        return index is not None and index.has(claims['pmask'], code)
+    return code in claims.get('permissions', [])
+
+
+async def has_permission_async(claims, code):
+    if 'pmask' in claims:
+        index = await get_permission_index_async(claims.get('pver'))
+        return index is not None and index.has(claims['pmask'], code)
+    return code in claims.get('permissions', [])
@@ -0,0 +1,72 @@
+"""
+Запросы горячих эндпоинтов в виде lambda-выражений SQLAlchemy.
+
+lambda_stmt строит выражение и ключ кеша один раз на место в коде: последующие вызовы берут
+скомпилированный SQL из кеша движка и подставляют только параметры из замыкания, без сборки
+Query, фильтров и обхода дерева выражения на каждый запрос. SQL уходит в базу как обычный
+параметризованный запрос, поэтому работает и за PgBouncer в режиме транзакций.
+"""
+from sqlalchemy import func, lambda_stmt, select
+
+from extensions import db
+from models import Permission, Role, RoleClosure, RolePermissions, User, UserRole
+
+
+def user_by_username(username):
+    return lambda_stmt(lambda: select(User).where(User.username == username).limit(1))
+
+
+def user_by_id(user_id):
+    return lambda_stmt(lambda: select(User).where(User.id == user_id).limit(1))
+
+
+def user_permissions(user_id):
+    """Permissions of the user's roles and of every role they inherit from: one join through the closure."""
+    return lambda_stmt(
+        lambda: select(Permission).join(
+            RolePermissions, RolePermissions.perm_id == Permission.id
+        ).join(
+            RoleClosure, RoleClosure.ancestor_id == RolePermissions.role_id
+        ).join(
+            UserRole, UserRole.role_id == RoleClosure.descendant_id
+        ).where(
+            UserRole.user_id == user_id
+        ).distinct()
+    )
+
+
+def role_by_id(role_id):
+    return lambda_stmt(lambda: select(Role).where(Role.id == role_id).limit(1))
+
+
+def users_claims(user_ids):
+    """id, is_superuser and permission codes of each existing user in one grouped join."""
+    return select(
+        User.id,
+        User.is_superuser,
+        func.array_agg(Permission.code).filter(Permission.code.isnot(None)).label('codes'),
+    ).outerjoin(
+        UserRole, UserRole.user_id == User.id
+    ).outerjoin(
+        RoleClosure, RoleClosure.descendant_id == UserRole.role_id
+    ).outerjoin(
+        RolePermissions, RolePermissions.role_id == RoleClosure.ancestor_id
+    ).outerjoin(
+        Permission, Permission.id == RolePermissions.perm_id
+    ).where(
+        User.id.in_(user_ids)
+    ).group_by(
+        User.id
+    )
+
+
+def get_user_by_username(username):
+    return db.session.execute(user_by_username(username)).scalars().first()
+
+
+def get_user(user_id):
+    return db.session.execute(user_by_id(user_id)).scalars().first()
+
+
+def get_role(role_id):
+    return db.session.execute(role_by_id(role_id)).scalars().first()
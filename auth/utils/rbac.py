@@ -0,0 +1,286 @@
+"""
+Выгрузка и загрузка модели доступа (права, роли, права ролей, наследование ролей) в NDJSON.
+
+Каждая строка - один объект с полем type:
+
+    {"type": "permission", "code": "users"}
+    {"type": "role", "code": "admin", "description": "unlimited access to all actions"}
+    {"type": "role_permission", "role": "admin", "permission": "users"}
+    {"type": "role_parent", "role": "admin", "parent": "member"}
+
+Роли и права ссылаются друг на друга по коду, а не по id, поэтому файл переносится между
+окружениями. Загрузка - сверка: база приводится к содержимому файла одной транзакцией.
+Текущее состояние читается четырьмя запросами, разница применяется пачками insert/update/delete
+на каждую таблицу, так что число запросов не зависит от размера модели.
+"""
+import json
+
+from sqlalchemy import Text, column, delete, select, tuple_, update, values
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import aliased
+
+from extensions import db
+from models import Permission, Role, RoleParent, RolePermissions
+from utils.common import get_role_user_ids, invalidate_user_claims
+from utils.hierarchy import lock_hierarchy, rebuild_closure
+from utils.permissions import invalidate_permission_index
+from utils.role_catalog import role_catalog
+
+PERMISSION = 'permission'
+ROLE = 'role'
+ROLE_PERMISSION = 'role_permission'
+ROLE_PARENT = 'role_parent'
+
+
+class RbacImportError(ValueError):
+    """The NDJSON document is not a valid access model; nothing was changed."""
+
+
+class RbacModel:
+    """Access model read from NDJSON: codes only, no ids."""
+
+    def __init__(self):
+        self.permissions = set()
+        self.roles = {}
+        self.role_permissions = set()
+        self.role_parents = set()
+
+    def add(self, item):
+        kind = item.get('type')
+        if kind == PERMISSION:
+            self.permissions.add(_code(item, 'code'))
+        elif kind == ROLE:
+            self.roles[_code(item, 'code')] = item.get('description') or ''
+        elif kind == ROLE_PERMISSION:
+            self.role_permissions.add((_code(item, 'role'), _code(item, 'permission')))
+        elif kind == ROLE_PARENT:
+            self.role_parents.add((_code(item, 'role'), _code(item, 'parent')))
+        else:
+            raise RbacImportError(f'unknown type {kind!r}')
+
+    def validate(self):
+        for role, permission in self.role_permissions:
+            if role not in self.roles or permission not in self.permissions:
+                raise RbacImportError(f'role_permission {role}/{permission} refers to a missing role or permission')
+        for role, parent in self.role_parents:
+            if role not in self.roles or parent not in self.roles:
+                raise RbacImportError(f'role_parent {role}/{parent} refers to a missing role')
+        if _has_cycle(self.role_parents):
+            raise RbacImportError("role hierarchy can't have cycles")
+
+
+def _code(item, key):
+    value = item.get(key)
+    if not isinstance(value, str) or not value:
+        raise RbacImportError(f'{key} must be a non-empty string')
+    return value
+
+
+def _has_cycle(edges):
+    """Kahn's algorithm over the (role, parent) edges."""
+    children = {}
+    parents_left = {}
+    for role, parent in edges:
+        children.setdefault(parent, []).append(role)
+        parents_left[role] = parents_left.get(role, 0) + 1
+        parents_left.setdefault(parent, 0)
+    ready = [role for role, count in parents_left.items() if count == 0]
+    while ready:
+        for child in children.get(ready.pop(), ()):
+            parents_left[child] -= 1
+            if parents_left[child] == 0:
+                ready.append(child)
+    return any(parents_left.values())
+
+
+def read_rbac(lines):
+    """Parse NDJSON lines (str or bytes) into an RbacModel without keeping the document in memory."""
+    model = RbacModel()
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+            if not isinstance(item, dict):
+                raise RbacImportError('line must be a json object')
+            model.add(item)
+        except (ValueError, RbacImportError) as error:
+            raise RbacImportError(f'line {number}: {error}') from error
+    model.validate()
+    return model
+
+
+def _role_permission_pairs():
+    return select(Role.code, Permission.code).join_from(
+        RolePermissions, Role, Role.id == RolePermissions.role_id
+    ).join(
+        Permission, Permission.id == RolePermissions.perm_id
+    )
+
+
+def _role_parent_pairs():
+    parent = aliased(Role)
+    return select(Role.code, parent.code).join_from(
+        RoleParent, Role, Role.id == RoleParent.role_id
+    ).join(
+        parent, parent.id == RoleParent.parent_id
+    )
+
+
+def export_rbac():
+    """Yield the access model as NDJSON lines; rows are read through server-side cursors."""
+    def rows(statement):
+        return db.session.execute(statement.execution_options(stream_results=True))
+
+    for row in rows(select(Permission.code).order_by(Permission.code)):
+        yield _line({'type': PERMISSION, 'code': row.code})
+    for row in rows(select(Role.code, Role.description).order_by(Role.code)):
+        yield _line({'type': ROLE, 'code': row.code, 'description': row.description})
+    pairs = _role_permission_pairs()
+    for role, permission in rows(pairs.order_by(*pairs.selected_columns)):
+        yield _line({'type': ROLE_PERMISSION, 'role': role, 'permission': permission})
+    pairs = _role_parent_pairs()
+    for role, parent in rows(pairs.order_by(*pairs.selected_columns)):
+        yield _line({'type': ROLE_PARENT, 'role': role, 'parent': parent})
+
+
+def _line(item):
+    return json.dumps(item, ensure_ascii=False) + '\n'
+
+
+def _counts(created=(), updated=(), deleted=()):
+    return {'created': len(created), 'updated': len(updated), 'deleted': len(deleted)}
+
+
+def reconcile(model):
+    """
+    Привести базу к модели: сначала сравнение с текущим состоянием, затем пачки изменений.
+
+    Коммит остается за вызывающим. Права пользователя меняются, только если у его роли или
+    у ее предка меняются права или родители; такие пользователи ищутся по иерархии до изменений
+    и после них, чтобы учесть и потерянные, и полученные права.
+
+    :return: число созданных, измененных и удаленных строк по каждой сущности
+        и id пользователей, чьи права могли измениться
+    """
+    # an edge added concurrently after this read would survive the import and could close a cycle
+    lock_hierarchy()
+    permission_ids = dict(db.session.execute(select(Permission.code, Permission.id)).all())
+    roles = {row.code: row for row in db.session.execute(select(Role.code, Role.id, Role.description))}
+    role_permissions = {tuple(row) for row in db.session.execute(_role_permission_pairs())}
+    role_parents = {tuple(row) for row in db.session.execute(_role_parent_pairs())}
+
+    new_permissions = model.permissions - permission_ids.keys()
+    old_permissions = permission_ids.keys() - model.permissions
+    new_roles = model.roles.keys() - roles.keys()
+    old_roles = roles.keys() - model.roles.keys()
+    changed_roles = {
+        code: description for code, description in model.roles.items()
+        if code in roles and roles[code].description != description
+    }
+    new_role_permissions = model.role_permissions - role_permissions
+    old_role_permissions = role_permissions - model.role_permissions
+    new_role_parents = model.role_parents - role_parents
+    old_role_parents = role_parents - model.role_parents
+
+    role_ids = {code: row.id for code, row in roles.items()}
+    affected_roles = {
+        role for role, _ in old_role_permissions | new_role_permissions | old_role_parents | new_role_parents
+    }
+    user_ids = set(_role_user_ids(affected_roles, role_ids))
+    # links and edges first: those of removed roles and permissions go before the cascade deletes them
+    if old_role_permissions:
+        db.session.execute(delete(RolePermissions).where(
+            tuple_(RolePermissions.role_id, RolePermissions.perm_id).in_(
+                [(role_ids[role], permission_ids[permission]) for role, permission in old_role_permissions]
+            )
+        ).execution_options(synchronize_session=False))
+    if old_role_parents:
+        db.session.execute(delete(RoleParent).where(
+            tuple_(RoleParent.role_id, RoleParent.parent_id).in_(
+                [(role_ids[role], role_ids[parent]) for role, parent in old_role_parents]
+            )
+        ).execution_options(synchronize_session=False))
+    if old_permissions:
+        db.session.execute(delete(Permission).where(
+            Permission.code.in_(old_permissions)
+        ).execution_options(synchronize_session=False))
+    if old_roles:
+        db.session.execute(delete(Role).where(
+            Role.code.in_(old_roles)
+        ).execution_options(synchronize_session=False))
+
+    if new_permissions:
+        rows = db.session.execute(
+            insert(Permission).values([{'code': code} for code in new_permissions]).returning(
+                Permission.code, Permission.id
+            )
+        )
+        permission_ids.update(rows.all())
+    if new_roles:
+        rows = db.session.execute(
+            insert(Role).values([{'code': code, 'description': model.roles[code]} for code in new_roles]).returning(
+                Role.code, Role.id
+            )
+        )
+        role_ids.update(rows.all())
+    if changed_roles:
+        changed = values(column('code', Text), column('description', Text), name='changed').data(
+            list(changed_roles.items())
+        )
+        db.session.execute(
+            update(Role).values(description=changed.c.description).where(
+                Role.code == changed.c.code
+            ).execution_options(synchronize_session=False)
+        )
+    if new_role_permissions:
+        db.session.execute(insert(RolePermissions).values([
+            {'role_id': role_ids[role], 'perm_id': permission_ids[permission]}
+            for role, permission in new_role_permissions
+        ]))
+    if new_role_parents:
+        db.session.execute(insert(RoleParent).values([
+            {'role_id': role_ids[role], 'parent_id': role_ids[parent]} for role, parent in new_role_parents
+        ]))
+    if old_role_parents or new_role_parents:
+        rebuild_closure()
+    user_ids.update(_role_user_ids(affected_roles, role_ids))
+
+    changes = {
+        'permissions': _counts(new_permissions, (), old_permissions),
+        'roles': _counts(new_roles, changed_roles, old_roles),
+        'role_permissions': _counts(new_role_permissions, (), old_role_permissions),
+        'role_parents': _counts(new_role_parents, (), old_role_parents),
+    }
+    return changes, user_ids
+
+
+def _role_user_ids(codes, role_ids):
+    ids = [role_ids[code] for code in codes if code in role_ids]
+    return get_role_user_ids(*ids) if ids else []
+
+
+def import_rbac(lines, dry_run=False):
+    """
+    Parse and reconcile in one transaction, then drop what was cached from the old model:
+    claims are invalidated only for the users whose roles gained or lost permissions.
+
+    With ``dry_run`` the changes are only counted and rolled back.
+    """
+    model = read_rbac(lines)
+    try:
+        changes, user_ids = reconcile(model)
+    except Exception:
+        db.session.rollback()
+        raise
+    if dry_run:
+        db.session.rollback()
+        return changes
+
+    db.session.commit()
+    if changes['roles'] != _counts():
+        role_catalog.bump()
+    if changes['permissions'] != _counts():
+        invalidate_permission_index()
+    invalidate_user_claims(*user_ids)
+    return changes
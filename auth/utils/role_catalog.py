@@ -0,0 +1,96 @@
+import hashlib
+import logging
+import threading
+import time
+
+from flask import json
+from redis import RedisError
+
+from extensions import redis_db
+from models import Role
+from schemas import role_schema
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'role_catalog:version'
+
+
+def _etag(body):
+    return hashlib.sha1(body.encode()).hexdigest()[:16]
+
+
+class RoleSnapshot:
+    """Roles of one catalog version with the response bodies and ETags rendered once."""
+
+    def __init__(self, version, roles):
+        self.version = version
+        dumped = [role_schema.dump(role) for role in roles]
+        self.list_body = json.dumps({"status": "success", "roles": dumped})
+        self.list_etag = _etag(self.list_body)
+        self.role_bodies = {}
+        for role in dumped:
+            body = json.dumps({"status": "success", "role": role})
+            self.role_bodies[str(role['id'])] = (body, _etag(body))
+
+    def role(self, role_id):
+        """(body, etag) of the role or None."""
+        return self.role_bodies.get(str(role_id))
+
+
+class RoleCatalog:
+    """
+    Справочник ролей в памяти воркера.
+
+    Роли меняются несколько раз в месяц, поэтому список и отдельные роли отдаются из снимка,
+    а не из базы. Снимок помечен версией из счетчика role_catalog:version в Redis: изменение
+    роли увеличивает счетчик, и каждый воркер перечитывает роли, заметив новую версию при
+    следующей проверке (не чаще раза в ROLE_CATALOG_CHECK_INTERVAL секунд). Если Redis
+    недоступен, снимок перечитывается из базы на каждой проверке.
+    """
+
+    def __init__(self, redis, check_interval=1):
+        self.redis = redis
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def configure(self, check_interval):
+        self.check_interval = check_interval
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._snapshot = None
+            self._checked_at = None
+
+    def _current_version(self):
+        try:
+            return self.redis.get(VERSION_KEY) or '0'
+        except RedisError:
+            logger.warning('role catalog version is unavailable', exc_info=True)
+            return None
+
+    def get(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._snapshot is not None and now - self._checked_at < self.check_interval:
+                return self._snapshot
+
+            # the version is read before the roles: a change committed in between only triggers one more reload
+            version = self._current_version()
+            if self._snapshot is None or version is None or version != self._snapshot.version:
+                self._snapshot = RoleSnapshot(version, Role.query.all())
+            self._checked_at = now
+            return self._snapshot
+
+    def bump(self):
+        """Publish a role change to every worker; call after the change is committed."""
+        self.clear()
+        try:
+            self.redis.incr(VERSION_KEY)
+        except RedisError:
+            logger.warning('role catalog version is unavailable', exc_info=True)
+
+
+role_catalog = RoleCatalog(redis_db)
@@ -0,0 +1,63 @@
+import gc
+import logging
+import os
+
+from flask import current_app, has_app_context
+
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+MEMORY_FIELDS = {'Rss': 'rss', 'Pss': 'pss', 'Private_Clean': 'private', 'Private_Dirty': 'private'}
+
+
+def worker_count(configured=0, cpus=None):
+    """
+    Число воркеров: заданное явно или по числу ядер.
+
+    Воркеры uvicorn асинхронные, поэтому одного на ядро достаточно, чтобы загрузить процессор;
+    минимум два, чтобы переработка одного воркера не оставляла сервис без обработчика.
+    """
+    if configured > 0:
+        return configured
+    return max(2, cpus or os.cpu_count() or 1)
+
+
+def hashing_pool_size(workers, cpus=None):
+    """Hashing processes per worker so that all workers together use every core once."""
+    return max(1, (cpus or os.cpu_count() or 1) // workers)
+
+
+def dispose_engines():
+    """Close the connections the master opened while loading the app: sockets must not be shared after fork."""
+    if not has_app_context():
+        return
+    binds = [None] + list(current_app.config.get('SQLALCHEMY_REPLICA_BINDS') or ())
+    for bind in binds:
+        db.get_engine(current_app, bind=bind).dispose()
+
+
+def prepare_fork():
+    """
+    Вызывается в мастере перед каждым fork воркера.
+
+    gc.freeze переносит все объекты загруженного приложения в постоянное поколение: сборщик мусора
+    воркера их не обходит и не пишет в их заголовки, поэтому страницы памяти мастера остаются
+    общими (copy-on-write) и не копируются в каждый воркер.
+    """
+    dispose_engines()
+    gc.freeze()
+
+
+def process_memory(pid='self'):
+    """Rss, Pss and private (unshared) memory of the process in bytes, from /proc/<pid>/smaps_rollup."""
+    memory = {'rss': 0, 'pss': 0, 'private': 0}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as smaps:
+            for line in smaps:
+                name, _, value = line.partition(':')
+                if name in MEMORY_FIELDS:
+                    memory[MEMORY_FIELDS[name]] += int(value.split()[0]) * 1024
+    except OSError:
+        return None
+    return memory
@@ -0,0 +1,249 @@
+"""
+Массовая загрузка пользователей (команда flask import-users).
+
+Записи читаются потоком из CSV с заголовком или NDJSON и обрабатываются пачками. Пароли
+пачки хешируются пулом процессов, пока в базу грузится предыдущая пачка; записи с готовым
+pwd_hash не хешируются. Пачка копируется через COPY во временную таблицу, откуда одним
+запросом попадает в users (ON CONFLICT DO NOTHING: существующие логины и id пропускаются)
+и в users_data для новых пользователей с личными данными. Каждая пачка - своя транзакция;
+после коммита число обработанных записей и хеш их содержимого пишутся в файл контрольной точки,
+и повторный запуск продолжает с нее. Если начало источника не совпадает с хешем (другой файл
+с тем же именем), импорт отказывается продолжать; после успешного завершения точка удаляется.
+Повтор уже загруженной пачки ничего не дублирует.
+"""
+import csv
+import hashlib
+import io
+import itertools
+import json
+import os
+import time
+import uuid
+
+USER_DATA_FIELDS = ('first_name', 'last_name', 'email', 'birth_date', 'phone', 'city')
+_STAGING_COLUMNS = ('id', 'username', 'pwd_hash', 'is_superuser', 'data_joined', 'data_id', *USER_DATA_FIELDS)
+_TRUE = ('1', 'true', 't', 'yes', 'y')
+
+_CREATE_STAGING = (
+    'CREATE TEMP TABLE IF NOT EXISTS import_users ('
+    'id uuid, username varchar(255), pwd_hash varchar(255), is_superuser boolean, data_joined timestamp, '
+    'data_id uuid, first_name text, last_name text, email text, birth_date timestamp, phone text, city text'
+    ') ON COMMIT DELETE ROWS'
+)
+_COPY_STAGING = f'COPY import_users ({", ".join(_STAGING_COLUMNS)}) FROM STDIN WITH (FORMAT csv)'
+_INSERT_FROM_STAGING = (
+    'WITH inserted AS ('
+    ' INSERT INTO users (id, created_at, updated_at, username, pwd_hash, is_superuser, data_joined)'
+    ' SELECT id, LOCALTIMESTAMP, LOCALTIMESTAMP, username, pwd_hash, is_superuser,'
+    ' coalesce(data_joined, LOCALTIMESTAMP) FROM import_users'
+    ' ON CONFLICT DO NOTHING RETURNING id'
+    '), data AS ('
+    f' INSERT INTO users_data (id, created_at, updated_at, user_id, {", ".join(USER_DATA_FIELDS)})'
+    f' SELECT s.data_id, LOCALTIMESTAMP, LOCALTIMESTAMP, s.id, {", ".join("s." + f for f in USER_DATA_FIELDS)}'
+    ' FROM import_users s JOIN inserted USING (id) WHERE s.data_id IS NOT NULL'
+    ')'
+    ' SELECT count(*) FROM inserted'
+)
+
+
+class UserImportError(Exception):
+    """
+    The import stopped: a batch could not be loaded, everything before it is committed and recorded
+    in the checkpoint, or the checkpoint does not match the source.
+    """
+
+
+def read_records(source, fmt):
+    """Records of a CSV (with a header row) or NDJSON stream, one at a time."""
+    if fmt == 'csv':
+        return csv.DictReader(source)
+    return (_json_record(line) for line in source if line.strip())
+
+
+def _json_record(line):
+    try:
+        return json.loads(line)
+    except ValueError:
+        return None  # counted as invalid, like any other unusable record
+
+
+def detect_format(filename):
+    extension = os.path.splitext(filename or '')[1].lstrip('.').lower()
+    return {'csv': 'csv', 'ndjson': 'ndjson', 'jsonl': 'ndjson'}.get(extension)
+
+
+def load_checkpoint(path):
+    """Number of records already loaded and the digest of their content, None without a checkpoint."""
+    if not path or not os.path.exists(path):
+        return None
+    with open(path) as checkpoint:
+        return json.load(checkpoint)
+
+
+def save_checkpoint(path, records, digest):
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w') as checkpoint:
+        json.dump({'records': records, 'digest': digest}, checkpoint)
+    os.replace(temporary, path)
+
+
+def remove_checkpoint(path):
+    if path and os.path.exists(path):
+        os.remove(path)
+
+
+def _update_digest(digest, records):
+    for record in records:
+        digest.update(repr(record).encode())
+        digest.update(b'\n')
+
+
+class ImportStats:
+    def __init__(self, resumed_from=0):
+        self.resumed_from = resumed_from
+        self.records = resumed_from
+        self.inserted = 0
+        self.existing = 0
+        self.invalid = 0
+        self.started = time.monotonic()
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    @property
+    def rate(self):
+        """Records per second processed by this run."""
+        return (self.records - self.resumed_from) / max(self.elapsed, 1e-9)
+
+
+def _value(record, key):
+    value = record.get(key)
+    if value is None or value == '':
+        return None
+    return value if isinstance(value, str) else str(value)
+
+
+def _parse(record):
+    """(staging row without the hash, password to hash or None) or None for an unusable record."""
+    username = _value(record, 'username')
+    pwd_hash = _value(record, 'pwd_hash')
+    password = _value(record, 'password')
+    if username is None or (pwd_hash is None and password is None):
+        return None
+    user_id = _value(record, 'id')
+    try:
+        user_id = uuid.UUID(user_id) if user_id is not None else uuid.uuid4()
+    except ValueError:
+        return None
+    is_superuser = record.get('is_superuser')
+    if not isinstance(is_superuser, bool):
+        is_superuser = str(is_superuser or '').strip().lower() in _TRUE
+    data = [_value(record, field) for field in USER_DATA_FIELDS]
+    data_id = uuid.uuid4() if any(value is not None for value in data) else None
+    row = [user_id, username, pwd_hash, is_superuser, _value(record, 'data_joined'), data_id, *data]
+    return row, None if pwd_hash is not None else password
+
+
+class UserImporter:
+    """
+    Loads batches of records over one raw connection.
+
+    :param connection: DBAPI (psycopg2) connection; the importer commits it after every batch
+    :param hasher: PasswordHasher whose pool hashes the passwords
+    """
+
+    def __init__(self, connection, hasher, batch_size=5000, checkpoint=None, statement_timeout=None):
+        self.connection = connection
+        self.hasher = hasher
+        self.batch_size = batch_size
+        self.checkpoint = checkpoint
+        self.statement_timeout = statement_timeout
+        self._digest = hashlib.sha256()
+
+    def run(self, records, progress=None):
+        """
+        Import ``records`` from the checkpoint on.
+
+        :param progress: called with the ImportStats after every committed batch
+        """
+        records = iter(records)
+        self._digest = hashlib.sha256()
+        stats = ImportStats(self._resume(records))
+        with self.connection.cursor() as cursor:
+            cursor.execute(_CREATE_STAGING)
+        self.connection.commit()
+
+        pending = None
+        while True:
+            batch = list(itertools.islice(records, self.batch_size))
+            # the hashes of this batch are computed by the pool while the previous one is loaded
+            prepared = self._prepare(batch) if batch else None
+            if pending is not None:
+                self._load(*pending, stats)
+                if progress is not None:
+                    progress(stats)
+            if prepared is None:
+                remove_checkpoint(self.checkpoint)
+                return stats
+            pending = prepared
+
+    def _resume(self, records):
+        """Skip the records loaded according to the checkpoint, making sure the source starts with them."""
+        checkpoint = load_checkpoint(self.checkpoint)
+        if checkpoint is None:
+            return 0
+        loaded = list(itertools.islice(records, checkpoint['records']))
+        _update_digest(self._digest, loaded)
+        if len(loaded) != checkpoint['records'] or self._digest.hexdigest() != checkpoint.get('digest'):
+            raise UserImportError(
+                f'the first {checkpoint["records"]} records differ from the ones recorded in {self.checkpoint}; '
+                'delete it to import from the start'
+            )
+        return len(loaded)
+
+    def _prepare(self, batch):
+        rows, passwords, invalid = [], [], 0
+        for record in batch:
+            parsed = _parse(record) if isinstance(record, dict) else None
+            if parsed is None:
+                invalid += 1
+                continue
+            row, password = parsed
+            rows.append(row)
+            if password is not None:
+                passwords.append(password)
+        return batch, rows, self.hasher.hash_many(passwords), invalid
+
+    def _load(self, batch, rows, hashes, invalid, stats):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            if row[2] is None:
+                row[2] = next(hashes)
+            writer.writerow(row)
+        buffer.seek(0)
+
+        size = len(batch)
+        first_record = stats.records + 1
+        try:
+            with self.connection.cursor() as cursor:
+                if self.statement_timeout is not None:
+                    cursor.execute(f'SET LOCAL statement_timeout = {int(self.statement_timeout)}')
+                cursor.copy_expert(_COPY_STAGING, buffer)
+                cursor.execute(_INSERT_FROM_STAGING)
+                inserted = cursor.fetchone()[0]
+            self.connection.commit()
+        except Exception as error:
+            self.connection.rollback()
+            raise UserImportError(
+                f'records {first_record}-{first_record + size - 1} were not loaded: {error}'
+            ) from error
+
+        stats.records += size
+        stats.inserted += inserted
+        stats.existing += len(rows) - inserted
+        stats.invalid += invalid
+        _update_digest(self._digest, batch)
+        if self.checkpoint:
+            save_checkpoint(self.checkpoint, stats.records, self._digest.hexdigest())
@@ -0,0 +1,110 @@
+"""
+Per-request overhead of the token checks done by ``permission_required``.
+
+Builds a minimal app (no database) with one endpoint behind ``permission_required`` and times it through
+the Flask test client with the token blocklist disabled, fronted by the worker cache and hitting Redis on
+every call, then with and without the verified-token cache. Needs the Redis from REDIS_URI.
+Run from the repo root:
+
+    PYTHONPATH=auth python benchmarks/authenticated_request.py --requests 5000
+"""
+import argparse
+import os
+import sys
+import time
+
+SOURCE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'auth')
+if SOURCE_DIR not in sys.path:
+    sys.path.append(SOURCE_DIR)
+
+from flask import Flask  # noqa: E402
+from flask_jwt_extended import create_access_token, decode_token  # noqa: E402
+
+from core import config  # noqa: E402
+from extensions import jwt, redis_db  # noqa: E402
+from utils.blocklist import is_token_revoked, revoked_tokens_cache  # noqa: E402
+from utils.common import permission_required  # noqa: E402
+
+
+def create_bench_app():
+    app = Flask(__name__)
+    app.config.from_object(config.JWTSettings())
+    app.config.from_object(config.RedisSettings())
+    jwt.init_app(app)
+    redis_db.init_app(app)
+
+    @app.route('/protected/<uuid:user_id>')
+    @permission_required('users')
+    def protected(user_id):
+        return {'status': 'success'}
+
+    return app
+
+
+def measure(app, requests):
+    user_id = '8f4233c3-6284-41bd-af5a-737c6a3dc38d'
+    with app.app_context():
+        token = create_access_token(identity=user_id, additional_claims={'permissions': ['users']})
+    headers = {'Authorization': f'Bearer {token}'}
+    client = app.test_client()
+
+    for _ in range(100):
+        client.get(f'/protected/{user_id}', headers=headers)
+
+    started = time.perf_counter()
+    for _ in range(requests):
+        response = client.get(f'/protected/{user_id}', headers=headers)
+    elapsed = time.perf_counter() - started
+    assert response.status_code == 200, response.json
+    return elapsed / requests * 1e6
+
+
+def measure_decode(app, requests):
+    with app.app_context():
+        token = create_access_token(identity='8f4233c3-6284-41bd-af5a-737c6a3dc38d')
+        decode_token(token)
+        started = time.perf_counter()
+        for _ in range(requests):
+            decode_token(token)
+        return (time.perf_counter() - started) / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=5000)
+    args = parser.parse_args()
+
+    app = create_bench_app()
+    results = {}
+
+    jwt._token_in_blocklist_callback = lambda jwt_header, jwt_payload: False
+    results['no blocklist'] = measure(app, args.requests)
+
+    jwt._token_in_blocklist_callback = lambda jwt_header, jwt_payload: is_token_revoked(jwt_payload)
+    revoked_tokens_cache.configure(maxsize=10000, ttl=60)
+    results['blocklist, worker cache'] = measure(app, args.requests)
+
+    revoked_tokens_cache.configure(maxsize=0)
+    results['blocklist, redis every call'] = measure(app, args.requests)
+
+    revoked_tokens_cache.configure(maxsize=10000, ttl=60)
+    jwt.verified_tokens.configure(maxsize=10000)
+    results['blocklist + verified token cache'] = measure(app, args.requests)
+
+    jwt._token_in_blocklist_callback = lambda jwt_header, jwt_payload: False
+    results['verified token cache only'] = measure(app, args.requests)
+
+    baseline = results['no blocklist']
+    print(f'{"mode":<36}{"us/request":>12}{"overhead us":>14}')
+    for mode, per_request in results.items():
+        print(f'{mode:<36}{per_request:>12.1f}{per_request - baseline:>14.1f}')
+
+    jwt.verified_tokens.configure(maxsize=0)
+    uncached = measure_decode(app, args.requests)
+    jwt.verified_tokens.configure(maxsize=10000)
+    cached = measure_decode(app, args.requests)
+    print(f'decode_token: {uncached:.1f}us without verified token cache, {cached:.1f}us with it')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Login throughput vs. hashing pool size.
+
+Simulates a login storm: CLIENTS threads (the WsgiToAsgi worker threads) verify passwords in a loop
+while one more thread serves a cheap endpoint and records its latency. Run from the repo root:
+
+    PYTHONPATH=auth python benchmarks/password_hashing.py --clients 16 --duration 5
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+
+SOURCE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'auth')
+if SOURCE_DIR not in sys.path:
+    sys.path.append(SOURCE_DIR)
+
+from utils.hashing import PasswordHasher  # noqa: E402
+
+
+def cheap_request():
+    return json.dumps({'status': 'success', 'tokens': {'access_token': 'x' * 300, 'refresh_token': 'y' * 300}})
+
+
+def run(hasher, clients, duration):
+    pwd_hash = hasher.hash('password')
+    hasher.verify(pwd_hash, 'password')  # warm up the pool
+
+    stop = threading.Event()
+    logins = [0] * clients
+    latencies = []
+
+    def login_client(number):
+        while not stop.is_set():
+            hasher.verify(pwd_hash, 'password')
+            logins[number] += 1
+
+    def cheap_client():
+        while not stop.is_set():
+            started = time.perf_counter()
+            cheap_request()
+            latencies.append(time.perf_counter() - started)
+            time.sleep(0.001)
+
+    threads = [threading.Thread(target=login_client, args=(i,)) for i in range(clients)]
+    threads.append(threading.Thread(target=cheap_client))
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    latencies.sort()
+    return {
+        'logins_per_sec': sum(logins) / duration,
+        'cheap_p50_ms': statistics.median(latencies) * 1000,
+        'cheap_p99_ms': latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--max-pool-size', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    print(f'cpu_count={os.cpu_count()} clients={args.clients} duration={args.duration}s')
+    print(f'{"executor":<10}{"pool":>6}{"logins/s":>12}{"cheap p50 ms":>15}{"cheap p99 ms":>15}')
+
+    setups = [('inline', 1)] + [('process', size) for size in range(1, args.max_pool_size + 1)]
+    for executor, pool_size in setups:
+        hasher = PasswordHasher(executor, pool_size, queue_size=args.clients, timeout=60)
+        result = run(hasher, args.clients, args.duration)
+        hasher.shutdown(wait=True)
+        print(
+            f'{executor:<10}{pool_size:>6}{result["logins_per_sec"]:>12.1f}'
+            f'{result["cheap_p50_ms"]:>15.3f}{result["cheap_p99_ms"]:>15.3f}'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Per-call cost of the hot lookups built as ORM queries vs. lambda statements (utils.queries).
+
+Runs every lookup REQUESTS times both ways inside one transaction that is rolled back at the end
+and reports CPU time of this process per call (the wait for Postgres is not counted), best of ROUNDS.
+The SQL is the same, so the difference is the Python work of building and compiling the query. Needs the migrated database from SQLALCHEMY_DATABASE_URI. Run from the repo root:
+
+    PYTHONPATH=auth python benchmarks/precompiled_statements.py --requests 2000 --rounds 5
+"""
+import argparse
+import os
+import sys
+import time
+
+SOURCE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'auth')
+if SOURCE_DIR not in sys.path:
+    sys.path.append(SOURCE_DIR)
+
+from app import create_app  # noqa: E402
+from extensions import db  # noqa: E402
+from models import Permission, Role, RolePermissions, User, UserRole  # noqa: E402
+from utils.queries import get_role, get_user, get_user_by_username, user_permissions  # noqa: E402
+
+
+def orm_lookups(user, role):
+    return {
+        'user_by_username': lambda: User.query.filter_by(username=user.username).first(),
+        'user_by_id': lambda: User.query.filter_by(id=user.id).first(),
+        'user_permissions': lambda: db.session.query(Permission).join(RolePermissions).join(
+            UserRole, UserRole.role_id == RolePermissions.role_id
+        ).filter(UserRole.user_id == user.id).all(),
+        'role_by_id': lambda: Role.query.filter_by(id=role.id).first(),
+    }
+
+
+def lambda_lookups(user, role):
+    return {
+        'user_by_username': lambda: get_user_by_username(user.username),
+        'user_by_id': lambda: get_user(user.id),
+        'user_permissions': lambda: db.session.execute(user_permissions(user.id)).scalars().all(),
+        'role_by_id': lambda: get_role(role.id),
+    }
+
+
+def timed(lookup, requests, rounds):
+    lookup()  # warm up the compiled cache
+    best = None
+    for _ in range(rounds):
+        started = time.process_time()
+        for _ in range(requests):
+            lookup()
+        elapsed = time.process_time() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best / requests * 10 ** 6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    create_app()
+    user = User(username='benchmark-user', password='benchmark')
+    role = Role(code='benchmark-role', description='benchmark')
+    permission = Permission(code='benchmark-permission')
+    db.session.add_all([user, role, permission])
+    db.session.flush()
+    db.session.add_all([
+        UserRole(user_id=user.id, role_id=role.id),
+        RolePermissions(role_id=role.id, perm_id=permission.id),
+    ])
+    db.session.flush()
+    try:
+        orm, precompiled = orm_lookups(user, role), lambda_lookups(user, role)
+        print(f'{"lookup":<18}{"orm, us":>10}{"lambda, us":>12}{"saved, us":>11}')  # CPU microseconds per call
+        for name in orm:
+            orm_us = timed(orm[name], args.requests, args.rounds)
+            lambda_us = timed(precompiled[name], args.requests, args.rounds)
+            print(f'{name:<18}{orm_us:>10.1f}{lambda_us:>12.1f}{orm_us - lambda_us:>11.1f}')
+    finally:
+        db.session.rollback()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Memory per gunicorn worker with and without preloading the app.
+
+Starts the production server (auth/gunicorn.conf.py), warms every worker up with requests and reads
+Rss, Pss and private memory of each process from /proc. Needs Postgres and Redis as for the app.
+Run from the repo root (Linux only):
+
+    PYTHONPATH=auth python benchmarks/worker_memory.py --workers 4 --requests 2000
+    PYTHONPATH=auth python benchmarks/worker_memory.py --workers 4 --requests 2000 --no-preload
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCE_DIR = os.path.join(ROOT_DIR, 'auth')
+CONFIG = os.path.join(SOURCE_DIR, 'gunicorn.conf.py')
+if SOURCE_DIR not in sys.path:
+    sys.path.append(SOURCE_DIR)
+
+from utils.server import process_memory  # noqa: E402
+
+
+def children(pid):
+    with open(f'/proc/{pid}/task/{pid}/children') as file:
+        return [int(child) for child in file.read().split()]
+
+
+def wait_for(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/api/v1/metrics', timeout=1)
+            return
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.2)
+    raise RuntimeError('server did not start')
+
+
+def warm_up(port, requests):
+    body = json.dumps({'username': 'benchmark', 'password': 'benchmark'}).encode()
+    for number in range(requests):
+        request = urllib.request.Request(
+            f'http://127.0.0.1:{port}/api/v1/auth/login' if number % 2 else f'http://127.0.0.1:{port}/api/v1/metrics',
+            data=body if number % 2 else None,
+            headers={'Content-Type': 'application/json'},
+        )
+        try:
+            urllib.request.urlopen(request, timeout=5).read()
+        except urllib.error.HTTPError:
+            pass
+
+
+def run(workers, requests, port, preload):
+    config = CONFIG
+    if not preload:
+        config_file = tempfile.NamedTemporaryFile('w', suffix='.py', delete=False)
+        config_file.write(f'exec(open({CONFIG!r}).read())\npreload_app = False\n')
+        config_file.close()
+        config = config_file.name
+
+    env = dict(os.environ, SERVER_WORKERS=str(workers), FLASK_PORT=str(port), SERVER_MAX_REQUESTS='0')
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', config, 'asgi:asgi_app'],
+        cwd=ROOT_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_for(port)
+        warm_up(port, requests)
+        pids = children(server.pid)
+        memory = [process_memory(pid) for pid in pids]
+        master = process_memory(server.pid)
+    finally:
+        server.terminate()
+        server.wait()
+        if config != CONFIG:
+            os.unlink(config)
+
+    mib = 2 ** 20
+    return {
+        'preload': preload,
+        'workers': len(pids),
+        'master_pss_mib': round(master['pss'] / mib, 1),
+        'worker_rss_mib': round(sum(item['rss'] for item in memory) / len(memory) / mib, 1),
+        'worker_pss_mib': round(sum(item['pss'] for item in memory) / len(memory) / mib, 1),
+        'worker_private_mib': round(sum(item['private'] for item in memory) / len(memory) / mib, 1),
+        'total_pss_mib': round((master['pss'] + sum(item['pss'] for item in memory)) / mib, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--no-preload', action='store_true')
+    args = parser.parse_args()
+    print(json.dumps(run(args.workers, args.requests, args.port, preload=not args.no_preload)))
+
+
+if __name__ == '__main__':
+    main()
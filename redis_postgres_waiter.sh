@@ -22,4 +22,10 @@ then
     echo "Postgres db started"
 fi
 
+if [ "$RUN_MIGRATIONS" = "true" ]
+then
+    echo "Applying migrations..."
+    FLASK_APP=app:create_app flask db upgrade && FLASK_APP=app:create_app flask maintain-login-history || exit 1
+fi
+
 exec "$@"
@@ -5,6 +5,7 @@ from pydantic import BaseSettings, Field
 
 REDIS_HOST_TEST = os.getenv('REDIS_HOST_TEST', '127.0.0.1')
 REDIS_PORT_TEST = int(os.getenv('REDIS_PORT_TEST', 6389))
+REDIS_SOCKET_TIMEOUT_TEST = float(os.getenv('REDIS_SOCKET_TIMEOUT_TEST', 0.5))
 
 POSTGRES_HOST_TEST = os.getenv('POSTGRES_HOST_TEST', '127.0.0.1')
 POSTGRES_PORT_TEST = int(os.getenv('POSTGRES_PORT_TEST', 5433))
@@ -12,6 +13,15 @@ POSTGRES_NAME_TEST = os.getenv('POSTGRES_NAME_TEST', 'auth_database_test')
 POSTGRES_USER_TEST = os.getenv('POSTGRES_USER_TEST', 'postgres')
 POSTGRES_PASSWORD_TEST = os.getenv('POSTGRES_PASSWORD_TEST', 1234)
 POSTGRES_OPTIONS_TEST = os.getenv('POSTGRES_OPTIONS_TEST', '-c search_path=users')
+POSTGRES_POOL_SIZE_TEST = int(os.getenv('POSTGRES_POOL_SIZE_TEST', 5))
+POSTGRES_MAX_OVERFLOW_TEST = int(os.getenv('POSTGRES_MAX_OVERFLOW_TEST', 5))
+POSTGRES_STATEMENT_TIMEOUT_TEST = int(os.getenv('POSTGRES_STATEMENT_TIMEOUT_TEST', 5000))
+# the test database stands in for its own replica
+POSTGRES_REPLICA_URIS_TEST = os.getenv(
+    'POSTGRES_REPLICA_URIS_TEST',
+    f'postgresql+psycopg2://{POSTGRES_USER_TEST}:{POSTGRES_PASSWORD_TEST}'
+    f'@{POSTGRES_HOST_TEST}:{POSTGRES_PORT_TEST}/{POSTGRES_NAME_TEST}'
+)
 
 FLASK_HOST = os.getenv('FLASK_HOST', '127.0.0.1')
 FLASK_PORT = int(os.getenv('FLASK_PORT', 5000))
@@ -21,6 +31,39 @@ JWT_SECRET_KEY_TEST = os.getenv('JWT_SECRET_KEY_TEST', 'super-secret')
 JWT_ACCESS_TOKEN_EXPIRES_TEST = timedelta(minutes=int(os.getenv('JWT_ACCESS_TOKEN_EXPIRES_TEST', 5)))
 JWT_REFRESH_TOKEN_EXPIRES_TEST = timedelta(minutes=int(os.getenv('JWT_REFRESH_TOKEN_EXPIRES_TEST', 20)))
 JWT_ERROR_MESSAGE_KEY_TEST = os.getenv('JWT_ERROR_MESSAGE_KEY_TEST', 'message')
+JWT_PERMISSIONS_ENCODING_TEST = os.getenv('JWT_PERMISSIONS_ENCODING_TEST', 'bitmask')
+JWT_VERIFIED_TOKEN_CACHE_SIZE_TEST = int(os.getenv('JWT_VERIFIED_TOKEN_CACHE_SIZE_TEST', 100))
+
+HASHING_EXECUTOR_TEST = os.getenv('HASHING_EXECUTOR_TEST', 'thread')
+HASHING_POOL_SIZE_TEST = int(os.getenv('HASHING_POOL_SIZE_TEST', 2))
+HASHING_QUEUE_SIZE_TEST = int(os.getenv('HASHING_QUEUE_SIZE_TEST', 8))
+HASHING_TIMEOUT_TEST = float(os.getenv('HASHING_TIMEOUT_TEST', 5))
+
+PERMISSIONS_CACHE_TTL_TEST = int(os.getenv('PERMISSIONS_CACHE_TTL_TEST', 60))
+PERMISSIONS_LOCAL_CACHE_SIZE_TEST = int(os.getenv('PERMISSIONS_LOCAL_CACHE_SIZE_TEST', 100))
+PERMISSIONS_LOCAL_CACHE_TTL_TEST = float(os.getenv('PERMISSIONS_LOCAL_CACHE_TTL_TEST', 5))
+
+BLOCKLIST_LOCAL_CACHE_SIZE_TEST = int(os.getenv('BLOCKLIST_LOCAL_CACHE_SIZE_TEST', 100))
+BLOCKLIST_LOCAL_CACHE_TTL_TEST = float(os.getenv('BLOCKLIST_LOCAL_CACHE_TTL_TEST', 2))
+KNOWN_DEVICES_LOCAL_CACHE_SIZE_TEST = int(os.getenv('KNOWN_DEVICES_LOCAL_CACHE_SIZE_TEST', 100))
+KNOWN_DEVICES_LOCAL_CACHE_TTL_TEST = float(os.getenv('KNOWN_DEVICES_LOCAL_CACHE_TTL_TEST', 300))
+KNOWN_DEVICES_CACHE_TTL_TEST = int(os.getenv('KNOWN_DEVICES_CACHE_TTL_TEST', 60))
+ROLE_CATALOG_CHECK_INTERVAL_TEST = float(os.getenv('ROLE_CATALOG_CHECK_INTERVAL_TEST', 1))
+ASSIGN_ROLES_MAX_USERS_TEST = int(os.getenv('ASSIGN_ROLES_MAX_USERS_TEST', 100))
+ASSIGN_ROLES_CHUNK_SIZE_TEST = int(os.getenv('ASSIGN_ROLES_CHUNK_SIZE_TEST', 2))
+PERMISSION_CHECKS_MAX_ITEMS_TEST = int(os.getenv('PERMISSION_CHECKS_MAX_ITEMS_TEST', 100))
+
+LOGIN_EVENTS_QUEUE_SIZE_TEST = int(os.getenv('LOGIN_EVENTS_QUEUE_SIZE_TEST', 100))
+LOGIN_EVENTS_BATCH_SIZE_TEST = int(os.getenv('LOGIN_EVENTS_BATCH_SIZE_TEST', 10))
+LOGIN_EVENTS_FLUSH_INTERVAL_TEST = float(os.getenv('LOGIN_EVENTS_FLUSH_INTERVAL_TEST', 0.1))
+LOGIN_EVENTS_ENQUEUE_TIMEOUT_TEST = float(os.getenv('LOGIN_EVENTS_ENQUEUE_TIMEOUT_TEST', 0.05))
+LOGIN_HISTORY_PAGE_SIZE_TEST = int(os.getenv('LOGIN_HISTORY_PAGE_SIZE_TEST', 20))
+LOGIN_HISTORY_MAX_PAGE_SIZE_TEST = int(os.getenv('LOGIN_HISTORY_MAX_PAGE_SIZE_TEST', 100))
+LOGIN_HISTORY_STREAM_BATCH_SIZE_TEST = int(os.getenv('LOGIN_HISTORY_STREAM_BATCH_SIZE_TEST', 1000))
+LOGIN_HISTORY_RETENTION_MONTHS_TEST = int(os.getenv('LOGIN_HISTORY_RETENTION_MONTHS_TEST', 12))
+LOGIN_HISTORY_PARTITIONS_AHEAD_TEST = int(os.getenv('LOGIN_HISTORY_PARTITIONS_AHEAD_TEST', 1))
+
+METRICS_TOKEN_TEST = os.getenv('METRICS_TOKEN_TEST', 'metrics-secret')
 
 
 class JWTSettings(BaseSettings):
@@ -28,6 +71,15 @@ class JWTSettings(BaseSettings):
     JWT_ACCESS_TOKEN_EXPIRES: timedelta = Field(JWT_ACCESS_TOKEN_EXPIRES_TEST)
     JWT_REFRESH_TOKEN_EXPIRES: timedelta = Field(JWT_REFRESH_TOKEN_EXPIRES_TEST)
     JWT_ERROR_MESSAGE_KEY: str = Field(JWT_ERROR_MESSAGE_KEY_TEST)
+    JWT_PERMISSIONS_ENCODING: str = Field(JWT_PERMISSIONS_ENCODING_TEST)
+    JWT_VERIFIED_TOKEN_CACHE_SIZE: int = Field(JWT_VERIFIED_TOKEN_CACHE_SIZE_TEST)
+
+
+class HashingSettings(BaseSettings):
+    HASHING_EXECUTOR: str = Field(HASHING_EXECUTOR_TEST)
+    HASHING_POOL_SIZE: int = Field(HASHING_POOL_SIZE_TEST)
+    HASHING_QUEUE_SIZE: int = Field(HASHING_QUEUE_SIZE_TEST)
+    HASHING_TIMEOUT: float = Field(HASHING_TIMEOUT_TEST)
 
 
 class PostgresSettings(BaseSettings):
@@ -36,7 +88,54 @@ class PostgresSettings(BaseSettings):
         f'@{POSTGRES_HOST_TEST}:{POSTGRES_PORT_TEST}/{POSTGRES_NAME_TEST}', description='url for auth service'
     )
     SQLALCHEMY_TRACK_MODIFICATIONS: bool = True
+    POSTGRES_POOL_SIZE: int = Field(POSTGRES_POOL_SIZE_TEST)
+    POSTGRES_MAX_OVERFLOW: int = Field(POSTGRES_MAX_OVERFLOW_TEST)
+    POSTGRES_POOL_TIMEOUT: float = 5
+    POSTGRES_POOL_RECYCLE: int = 1800
+    POSTGRES_POOL_PRE_PING: bool = True
+    POSTGRES_APPLICATION_NAME: str = 'auth_test'
+    POSTGRES_STATEMENT_TIMEOUT: int = Field(POSTGRES_STATEMENT_TIMEOUT_TEST)
+    POSTGRES_ADMIN_STATEMENT_TIMEOUT: int = 30000
+    POSTGRES_EXPORT_STATEMENT_TIMEOUT: int = 300000
+    POSTGRES_PGBOUNCER: bool = False
+    POSTGRES_REPLICA_URIS: str = Field(POSTGRES_REPLICA_URIS_TEST)
+    POSTGRES_REPLICA_STICKY_SECONDS: float = 5
 
 
 class RedisSettings(BaseSettings):
     REDIS_URI: str = Field(f'redis://{REDIS_HOST_TEST}:{REDIS_PORT_TEST}')
+    REDIS_SOCKET_TIMEOUT: float = Field(REDIS_SOCKET_TIMEOUT_TEST)
+
+
+class CacheSettings(BaseSettings):
+    PERMISSIONS_CACHE_TTL: int = Field(PERMISSIONS_CACHE_TTL_TEST)
+    PERMISSIONS_LOCAL_CACHE_SIZE: int = Field(PERMISSIONS_LOCAL_CACHE_SIZE_TEST)
+    PERMISSIONS_LOCAL_CACHE_TTL: float = Field(PERMISSIONS_LOCAL_CACHE_TTL_TEST)
+    BLOCKLIST_LOCAL_CACHE_SIZE: int = Field(BLOCKLIST_LOCAL_CACHE_SIZE_TEST)
+    BLOCKLIST_LOCAL_CACHE_TTL: float = Field(BLOCKLIST_LOCAL_CACHE_TTL_TEST)
+    KNOWN_DEVICES_LOCAL_CACHE_SIZE: int = Field(KNOWN_DEVICES_LOCAL_CACHE_SIZE_TEST)
+    KNOWN_DEVICES_LOCAL_CACHE_TTL: float = Field(KNOWN_DEVICES_LOCAL_CACHE_TTL_TEST)
+    KNOWN_DEVICES_CACHE_TTL: int = Field(KNOWN_DEVICES_CACHE_TTL_TEST)
+    ROLE_CATALOG_CHECK_INTERVAL: float = Field(ROLE_CATALOG_CHECK_INTERVAL_TEST)
+
+
+class RoleSettings(BaseSettings):
+    ASSIGN_ROLES_MAX_USERS: int = Field(ASSIGN_ROLES_MAX_USERS_TEST)
+    ASSIGN_ROLES_CHUNK_SIZE: int = Field(ASSIGN_ROLES_CHUNK_SIZE_TEST)
+    PERMISSION_CHECKS_MAX_ITEMS: int = Field(PERMISSION_CHECKS_MAX_ITEMS_TEST)
+
+
+class LoginHistorySettings(BaseSettings):
+    LOGIN_EVENTS_QUEUE_SIZE: int = Field(LOGIN_EVENTS_QUEUE_SIZE_TEST)
+    LOGIN_EVENTS_BATCH_SIZE: int = Field(LOGIN_EVENTS_BATCH_SIZE_TEST)
+    LOGIN_EVENTS_FLUSH_INTERVAL: float = Field(LOGIN_EVENTS_FLUSH_INTERVAL_TEST)
+    LOGIN_EVENTS_ENQUEUE_TIMEOUT: float = Field(LOGIN_EVENTS_ENQUEUE_TIMEOUT_TEST)
+    LOGIN_HISTORY_PAGE_SIZE: int = Field(LOGIN_HISTORY_PAGE_SIZE_TEST)
+    LOGIN_HISTORY_MAX_PAGE_SIZE: int = Field(LOGIN_HISTORY_MAX_PAGE_SIZE_TEST)
+    LOGIN_HISTORY_STREAM_BATCH_SIZE: int = Field(LOGIN_HISTORY_STREAM_BATCH_SIZE_TEST)
+    LOGIN_HISTORY_RETENTION_MONTHS: int = Field(LOGIN_HISTORY_RETENTION_MONTHS_TEST)
+    LOGIN_HISTORY_PARTITIONS_AHEAD: int = Field(LOGIN_HISTORY_PARTITIONS_AHEAD_TEST)
+
+
+class MetricsSettings(BaseSettings):
+    METRICS_TOKEN: str = Field(METRICS_TOKEN_TEST)
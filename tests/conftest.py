@@ -2,8 +2,10 @@ import json
 from http import HTTPStatus
 
 import pytest
+from flask import current_app
+from flask_migrate import downgrade, upgrade
 
-from auth.app import create_app, db
+from auth.app import create_app, db, maintain_login_history
 from auth.models import User
 
 from . import config
@@ -11,7 +13,10 @@ from . import config
 
 @pytest.fixture
 def app():
-    return create_app(config=config)
+    app = create_app(config=config)
+    upgrade()
+    maintain_login_history(app)
+    return app
 
 
 @pytest.fixture
@@ -23,7 +28,11 @@ def client(app):
 def session():
     yield db.session
     db.session.remove()
-    db.drop_all()
+    current_app.extensions['login_events'].flush()
+    downgrade(revision='base')
+    # the app context of every test stays pushed, so its pools would keep their connections open
+    for bind in (None, *current_app.config['SQLALCHEMY_BINDS']):
+        db.get_engine(current_app, bind).dispose()
 
 
 @pytest.fixture
@@ -42,6 +51,7 @@ def create_user(session):
 
     yield _create_user
 
+    current_app.extensions['login_events'].flush()
     for username in created_records:
         User.query.filter_by(username=username).delete()
     session.commit()
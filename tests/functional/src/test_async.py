@@ -0,0 +1,187 @@
+import asyncio
+import json
+import os
+import uuid
+from http import HTTPStatus
+
+from redis import asyncio as aioredis
+from sqlalchemy import event, text
+
+from auth.api.v1.async_views import routes
+from auth.app import db
+from auth.models import create_permissions
+from auth.utils.asgi import AsyncRouter
+from auth.utils.db import engine_options
+
+from ... import config
+
+
+async def not_found(scope, receive, send):
+    await send({'type': 'http.response.start', 'status': HTTPStatus.NOT_FOUND, 'headers': []})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def call(router, path, body, headers=None):
+    scope = {
+        'type': 'http',
+        'method': 'POST',
+        'path': path,
+        'headers': [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()],
+        'client': ('127.0.0.1', 5000),
+    }
+    messages = [{'type': 'http.request', 'body': json.dumps(body).encode(), 'more_body': False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    await router(scope, receive, send)
+    return sent[0]['status'], json.loads(sent[1]['body'] or b'null')
+
+
+def test_async_login_refresh_and_check_permissions(app, create_user, session):
+    create_user('admin', 'admin')
+    router = AsyncRouter(app, routes=routes, fallback=not_found)
+
+    async def scenario():
+        status, body = await call(router, '/api/v1/auth/login', {'username': 'admin', 'password': 'wrong'})
+        assert status == HTTPStatus.UNAUTHORIZED
+
+        status, body = await call(router, '/api/v1/auth/login', {'username': 'admin', 'password': 'admin'})
+        assert status == HTTPStatus.OK
+        tokens = body['tokens']
+
+        refresh_headers = {'Authorization': f'Bearer {tokens["refresh_token"]}'}
+        status, body = await call(router, '/api/v1/auth/refresh-token', {}, refresh_headers)
+        assert status == HTTPStatus.OK
+        status, body = await call(router, '/api/v1/auth/refresh-token', {}, refresh_headers)
+        assert status == HTTPStatus.UNAUTHORIZED
+        assert body['message'] == 'refresh token reuse detected'
+
+        status, body = await call(
+            router,
+            '/api/v1/check-permissions',
+            {'user_id': '8f4233c3-6284-41bd-af5a-737c6a3dc38d', 'role_ids': ['73fdfb99-9465-4736-8661-af9f05d7991e']},
+            {'Authorization': f'Bearer {tokens["access_token"]}'},
+        )
+        assert status == HTTPStatus.NOT_FOUND
+
+        status, _ = await call(router, '/api/v1/auth/unknown', {})
+        assert status == HTTPStatus.NOT_FOUND
+
+        await app.extensions['async_db'].dispose()
+
+    asyncio.run(scenario())
+
+
+def test_async_refresh_without_redis(app, create_user, session, monkeypatch):
+    create_user('admin', 'admin')
+    router = AsyncRouter(app, routes=routes, fallback=not_found)
+
+    async def scenario():
+        status, body = await call(router, '/api/v1/auth/login', {'username': 'admin', 'password': 'admin'})
+        assert status == HTTPStatus.OK
+        refresh_headers = {'Authorization': f'Bearer {body["tokens"]["refresh_token"]}'}
+
+        unavailable = aioredis.Redis.from_url('redis://127.0.0.1:1', socket_connect_timeout=0.1)
+        monkeypatch.setattr(app.extensions['redis'], '_async_client', unavailable)
+        status, body = await call(router, '/api/v1/auth/refresh-token', {}, refresh_headers)
+        assert status == HTTPStatus.SERVICE_UNAVAILABLE
+        assert body['message'] == 'token blocklist is unavailable, try again later'
+
+        await app.extensions['async_db'].dispose()
+
+    asyncio.run(scenario())
+
+
+def test_async_lookups_without_prepared_statement_cache(app, create_user, session):
+    create_user('user1', '123')
+    create_user('user2', '123')
+    async_db = app.extensions['async_db']
+    app.config['POSTGRES_PGBOUNCER'] = True
+    async_db.init_app(app)
+    assert async_db.url.query['prepared_statement_cache_size'] == '0'
+    assert async_db.options['connect_args']['server_settings'] == {'application_name': 'auth_test'}
+    statements = []
+    event.listen(
+        async_db.engine.sync_engine, 'before_cursor_execute',
+        lambda conn, cursor, statement, *args: statements.append(statement),
+    )
+
+    async def scenario():
+        first = await async_db.get_user_by_username('user1')
+        second = await async_db.get_user_by_username('user2')
+        assert first.id != second.id
+        assert await async_db.get_user_permission_codes(first.id) == []
+        await async_db.dispose()
+
+    asyncio.run(scenario())
+    assert statements.count('SET LOCAL statement_timeout = 5000') == 3
+
+
+def test_pgbouncer_connect_args():
+    connect_args = engine_options(config.PostgresSettings())['connect_args']
+    assert connect_args['options'] == '-c statement_timeout=5000'
+
+    connect_args = engine_options(config.PostgresSettings(POSTGRES_PGBOUNCER=True))['connect_args']
+    assert connect_args == {'application_name': 'auth_test'}
+
+
+def test_pgbouncer_statement_timeout_per_transaction(app, session):
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    session.commit()
+    app.config['POSTGRES_PGBOUNCER'] = True
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        session.execute('SELECT 1')
+        session.commit()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    assert statements == ['SET LOCAL statement_timeout = 5000', 'SELECT 1']
+
+
+def test_async_login_rebuilds_permission_index_without_sync_session(app, create_user, session):
+    create_user('admin', 'admin')
+    create_permissions()  # drops the worker's permission index
+    router = AsyncRouter(app, routes=routes, fallback=not_found)
+
+    async def scenario():
+        status, body = await call(router, '/api/v1/auth/login', {'username': 'admin', 'password': 'admin'})
+        assert status == HTTPStatus.OK
+        headers = {'Authorization': f'Bearer {body["tokens"]["access_token"]}'}
+        status, _ = await call(router, '/api/v1/check-permissions', {'user_id': str(uuid.uuid4()), 'role_ids': []}, headers)
+        assert status == HTTPStatus.NOT_FOUND
+        await app.extensions['async_db'].dispose()
+
+    asyncio.run(scenario())
+    with db.engine.connect() as connection:
+        idle = connection.execute(text(
+            "SELECT count(*) FROM pg_stat_activity WHERE state = 'idle in transaction' AND query LIKE '%permissions%'"
+        )).scalar()
+    assert idle == 0
+
+
+def test_async_db_pool_metrics(app, client, session):
+    async_db = app.extensions['async_db']
+
+    def metrics():
+        response = client.get('/api/v1/metrics', headers={'Authorization': 'Bearer metrics-secret'})
+        assert response.status_code == HTTPStatus.OK
+        return response.data.decode()
+
+    async def scenario():
+        async with async_db.engine.connect() as connection:
+            await connection.exec_driver_sql('SELECT 1')
+            assert f'auth_async_db_pool_in_use{{pid="{os.getpid()}"}} 1' in metrics()
+        assert f'auth_async_db_pool_idle{{pid="{os.getpid()}"}} 1' in metrics()
+        await async_db.dispose()
+
+    asyncio.run(scenario())
+    assert f'auth_async_db_pool_size{{pid="{os.getpid()}"}} 0' in metrics()
@@ -0,0 +1,71 @@
+import asyncio
+import time
+
+import pytest
+
+from auth.utils.hashing import HashingUnavailableError, PasswordHasher
+
+
+@pytest.fixture(params=['thread', 'process'])
+def pool_hasher(request):
+    hasher = PasswordHasher(executor=request.param, pool_size=1, queue_size=0, timeout=0.2)
+    hasher._get_executor().submit(time.sleep, 0).result()  # start the worker before timing anything
+    yield hasher
+    hasher.shutdown(wait=True)
+
+
+def test_hash_and_verify(pool_hasher):
+    pool_hasher.timeout = None
+    pwd_hash = pool_hasher.hash('123')
+    assert pool_hasher.verify(pwd_hash, '123')
+    assert not pool_hasher.verify(pwd_hash, '1234')
+    assert asyncio.run(pool_hasher.verify_async(pwd_hash, '123'))
+
+
+def test_timed_out_job_keeps_its_slot(pool_hasher):
+    with pytest.raises(HashingUnavailableError, match='timed out'):
+        pool_hasher._run(time.sleep, 1)
+    # the job still runs, so the only slot stays taken until it ends
+    with pytest.raises(HashingUnavailableError, match='queue is full'):
+        pool_hasher._run(time.sleep, 0)
+    time.sleep(1)
+    assert pool_hasher._run(time.sleep, 0) is None
+
+
+def test_timed_out_async_job_keeps_its_slot(pool_hasher):
+    async def scenario():
+        with pytest.raises(HashingUnavailableError, match='timed out'):
+            await pool_hasher._run_async(time.sleep, 1)
+        with pytest.raises(HashingUnavailableError, match='queue is full'):
+            await pool_hasher._run_async(time.sleep, 0)
+        await asyncio.sleep(1)
+        assert await pool_hasher._run_async(time.sleep, 0) is None
+
+    asyncio.run(scenario())
+
+
+def test_full_queue_is_rejected(pool_hasher):
+    pool_hasher._configure(pool_hasher.executor_type, pool_size=1, queue_size=1, timeout=0.2)
+    assert pool_hasher._slots.acquire(blocking=False)
+    running = pool_hasher._submit(time.sleep, 0.5)
+    assert pool_hasher._slots.acquire(blocking=False)
+    queued = pool_hasher._submit(time.sleep, 0)
+    with pytest.raises(HashingUnavailableError, match='queue is full'):
+        pool_hasher.hash('123')
+    with pytest.raises(HashingUnavailableError, match='queue is full'):
+        asyncio.run(pool_hasher.verify_async('pbkdf2:sha256:1$salt$hash', '123'))
+    running.result()
+    queued.result()
+    pool_hasher.timeout = None
+    assert pool_hasher.verify(pool_hasher.hash('123'), '123')
+
+
+def test_inline_hashing_has_no_queue():
+    hasher = PasswordHasher(executor='inline', pool_size=1, queue_size=0, timeout=0.01)
+    assert hasher._slots.acquire(blocking=False)
+    # runs in the calling thread: neither the taken slot nor the timeout applies
+    assert hasher._run(time.sleep, 0.05) is None
+    pwd_hash = hasher.hash('123')
+    assert hasher.verify(pwd_hash, '123')
+    assert asyncio.run(hasher.verify_async(pwd_hash, '123'))
+    assert list(hasher.hash_many(['1', '2']))[1].startswith('pbkdf2:')
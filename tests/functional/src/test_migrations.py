@@ -0,0 +1,69 @@
+import datetime
+import uuid
+
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
+from flask_migrate import downgrade, upgrade
+from sqlalchemy import text
+
+from auth.app import db
+from auth.models import UserDevice
+from auth.utils.devices import device_fingerprint
+from auth.utils.partitions import get_partitions, include_object
+
+
+def test_migrations_match_models(app, session):
+    with db.engine.connect() as connection:
+        context = MigrationContext.configure(connection, opts={'include_object': include_object})
+        diff = compare_metadata(context, db.metadata)
+
+    # BaseModel.id is both primary key and unique; alembic reports the unnamed unique constraint as missing
+    diff = [change for change in diff if not (change[0] == 'add_constraint' and change[1].name is None)]
+    assert diff == []
+
+
+def test_login_history_conversion(app, session):
+    user_id, other_id = uuid.uuid4(), uuid.uuid4()
+    logins = [
+        (datetime.datetime(2020, 1, 5), 'agent', 'phone'),
+        (datetime.datetime(2020, 2, 7), 'agent', 'phone'),
+        (datetime.datetime(2020, 2, 9), None, None),
+    ]
+    # a database as db.create_all() built it before the login history changes
+    downgrade(revision='0003')
+    with db.engine.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO users (id, created_at, updated_at, username) VALUES (:id, now(), now(), 'user1')"
+        ), {'id': user_id})
+        for created_at, user_agent, device_key in logins:
+            connection.execute(text(
+                'INSERT INTO users_device (id, created_at, updated_at, user_id, ip, device_key, user_agent) '
+                "VALUES (:id, :created_at, :created_at, :user_id, '127.0.0.1', :device_key, :user_agent)"
+            ), {
+                'id': other_id if device_key is None else uuid.uuid4(), 'created_at': created_at,
+                'user_id': user_id, 'device_key': device_key, 'user_agent': user_agent,
+            })
+
+    upgrade()
+    with db.engine.connect() as connection:
+        assert {'users_device_2020_01', 'users_device_2020_02'} <= get_partitions(connection, UserDevice.__table__)
+        devices = connection.execute(text(
+            'SELECT fingerprint, device_key, user_agent, created_at FROM users_known_device WHERE user_id = :id'
+        ), {'id': user_id}).all()
+        devices = sorted((row.fingerprint, row.device_key, row.user_agent, row.created_at) for row in devices)
+        assert devices == sorted([
+            (device_fingerprint('agent', 'phone'), 'phone', 'agent', logins[0][0]),
+            (device_fingerprint(None, None), None, None, logins[2][0]),
+        ])
+        rows = connection.execute(text(
+            'SELECT fingerprint FROM users_device WHERE user_id = :id ORDER BY created_at'
+        ), {'id': user_id}).scalars().all()
+        assert rows == [device_fingerprint('agent', 'phone')] * 2 + [device_fingerprint(None, None)]
+
+    downgrade(revision='0003')
+    with db.engine.connect() as connection:
+        rows = connection.execute(text(
+            'SELECT device_key, user_agent FROM users_device WHERE user_id = :id ORDER BY created_at'
+        ), {'id': user_id}).all()
+        assert [tuple(row) for row in rows] == [('phone', 'agent'), ('phone', 'agent'), (None, None)]
+    upgrade()
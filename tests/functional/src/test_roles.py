@@ -1,10 +1,16 @@
 from http import HTTPStatus
 from flask import jsonify
+import json
 import uuid
 
 import pytest
+from sqlalchemy import event, text
+from sqlalchemy.exc import OperationalError
 
-from auth.models import Role
+from auth.app import db
+from auth.models import Permission, Role, RoleClosure, RolePermissions, UserRole, create_permissions
+from auth.utils.hierarchy import add_parent, remove_parent
+from auth.utils.role_catalog import RoleCatalog, role_catalog
 
 from ..testdata.roles import role_by_id_expected, roles_list
 
@@ -35,6 +41,21 @@ def test_get_role_list(create_role, headers_with_admin_access, client, roles_lis
     assert response.json.get('roles') == roles_list
 
 
+def test_get_role_list_with_role_permission(create_role, client, roles_list, create_user, session):
+    create_role(roles_list)
+    user = create_user('user1', '234', is_superuser=False)
+    create_permissions()
+    permission = Permission.query.filter_by(code='roles').first()
+    session.add(RolePermissions(role_id=roles_list[0]['id'], perm_id=permission.id))
+    session.add(UserRole(user_id=user.id, role_id=roles_list[0]['id']))
+    session.commit()
+
+    response = client.post('/api/v1/auth/login', json={'username': 'user1', 'password': '234'})
+    access_token = response.json['tokens']['access_token']
+    response = client.get('api/v1/role', headers={'Authorization': f'Bearer {access_token}'})
+    assert response.status_code == HTTPStatus.OK
+
+
 def test_create_role(client, headers_with_admin_access, session):
     response = client.post(
         'api/v1/role',
@@ -44,6 +65,16 @@ def test_create_role(client, headers_with_admin_access, session):
     assert response.status_code == HTTPStatus.CREATED
 
 
+def test_create_existing_role(client, headers_with_admin_access, session):
+    for expected_status in (HTTPStatus.CREATED, HTTPStatus.BAD_REQUEST):
+        response = client.post(
+            'api/v1/role',
+            json={'code': 'test_role', 'description': 'for test'},
+            headers=headers_with_admin_access
+        )
+        assert response.status_code == expected_status
+
+
 def test_create_role_without_admin_permission(client, headers_with_user_access, session):
     response = client.post(
         'api/v1/role',
@@ -112,6 +143,24 @@ def test_assign_roles(create_role, client, roles_list, login_user, session):
     assert response.status_code == HTTPStatus.CREATED
 
 
+def test_assign_roles_invalidates_cached_claims(app, create_role, client, roles_list, login_user, session):
+    create_role(roles_list)
+    user, tokens = login_user('user1', '234')
+    redis = app.extensions['redis']
+    assert redis.exists(f'user_claims:{user.id}')
+
+    response = client.post(
+        'api/v1/assign-roles',
+        json={
+            'user_id': user.id,
+            'role_ids': [uuid.UUID(key['id']) for key in roles_list]
+        },
+        headers={'Authorization': f'Bearer {tokens["access_token"]}'}
+    )
+    assert response.status_code == HTTPStatus.CREATED
+    assert not redis.exists(f'user_claims:{user.id}')
+
+
 def test_assign_roles_without_admin_permissions(create_role, client, roles_list, login_user, session):
     create_role(roles_list)
     user, tokens = login_user('user1', '234', is_superuser=False)
@@ -128,7 +177,22 @@ def test_assign_roles_without_admin_permissions(create_role, client, roles_list,
     assert response.status_code == HTTPStatus.FORBIDDEN
 
 
-def test_check_permissions(client, headers_with_admin_access, session):
+def test_check_permissions(create_role, client, roles_list, login_user, session):
+    create_role(roles_list)
+    user, tokens = login_user('user1', '234')
+    headers = {'Authorization': f'Bearer {tokens["access_token"]}'}
+    role_ids = [key['id'] for key in roles_list]
+    client.post('api/v1/assign-roles', json={'user_id': user.id, 'role_ids': role_ids}, headers=headers)
+
+    response = client.post(
+        'api/v1/check-permissions',
+        json={"user_id": str(user.id), "role_ids": role_ids},
+        headers=headers)
+    assert response.status_code == HTTPStatus.OK
+    assert response.json.get('has_permissions') is True
+
+
+def test_check_permissions_of_unknown_user(client, headers_with_admin_access, session):
     response = client.post(
         'api/v1/check-permissions',
         json={
@@ -138,8 +202,7 @@ def test_check_permissions(client, headers_with_admin_access, session):
                 "d4cb21a9-77e4-42df-b79e-4fb25e4ea046"]
         },
         headers=headers_with_admin_access)
-    assert response.status_code == HTTPStatus.OK
-    assert response.json.get('has_permissions') is True
+    assert response.status_code == HTTPStatus.NOT_FOUND
 
 
 def test_check_permissions_without_admin_permission(client, headers_with_user_access, session):
@@ -153,3 +216,371 @@ def test_check_permissions_without_admin_permission(client, headers_with_user_ac
         },
         headers=headers_with_user_access)
     assert response.status_code == HTTPStatus.FORBIDDEN
+
+
+def test_replica_reads(app, client, create_user, login_user, session):
+    user, tokens = login_user('admin', 'admin')
+    headers = {'Authorization': f'Bearer {tokens["access_token"]}'}
+    check = {'user_id': str(user.id), 'role_ids': ['73fdfb99-9465-4736-8661-af9f05d7991e']}
+    replica = db.get_engine(app, bind='replica_0')
+    reads = []
+
+    @event.listens_for(replica, 'before_cursor_execute')
+    def count_replica_reads(conn, cursor, statement, *args):
+        reads.append(statement)
+
+    try:
+        client.post('api/v1/check-permissions', json=check, headers=headers)
+        assert any('FROM users_roles' in statement for statement in reads)
+
+        # read-your-writes: after creating a role the admin reads from primary
+        client.post('api/v1/role', json={'code': 'test_role', 'description': 'for test'}, headers=headers)
+        reads.clear()
+        client.post('api/v1/check-permissions', json=check, headers=headers)
+        assert reads == []
+        response = client.get('api/v1/role', headers=headers)
+        assert 'test_role' in [role['code'] for role in response.json['roles']]
+
+        # claims go to the shared cache, so they are never read from a lagging replica
+        checked = create_user('user1', '123', is_superuser=False)
+        app.extensions['redis'].delete(f'replica_sticky:{user.id}')
+        reads.clear()
+        checks = {'checks': [[str(checked.id), 'roles']]}
+        response = client.post('api/v1/check-permissions/batch', json=checks, headers=headers)
+        assert response.json['results'] == [False]
+        assert reads == []
+    finally:
+        event.remove(replica, 'before_cursor_execute', count_replica_reads)
+    assert Role.query.filter_by(code='test_role').count() == 1
+
+
+def test_role_catalog_etag(create_role, client, roles_list, headers_with_admin_access, session):
+    create_role(roles_list)
+    response = client.get('api/v1/role', headers=headers_with_admin_access)
+    etag = response.headers['ETag']
+    assert response.headers['Cache-Control'] == 'private, no-cache'
+
+    response = client.get('api/v1/role', headers={**headers_with_admin_access, 'If-None-Match': etag})
+    assert response.status_code == HTTPStatus.NOT_MODIFIED
+    assert response.data == b''
+
+    role_url = f'api/v1/role/{roles_list[0]["id"]}'
+    role_etag = client.get(role_url, headers=headers_with_admin_access).headers['ETag']
+    response = client.get(role_url, headers={**headers_with_admin_access, 'If-None-Match': role_etag})
+    assert response.status_code == HTTPStatus.NOT_MODIFIED
+
+    client.patch(role_url, json={'description': 'changed'}, headers=headers_with_admin_access)
+    response = client.get('api/v1/role', headers={**headers_with_admin_access, 'If-None-Match': etag})
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers['ETag'] != etag
+    response = client.get(role_url, headers={**headers_with_admin_access, 'If-None-Match': role_etag})
+    assert response.json['role']['description'] == 'changed'
+
+
+def test_role_catalog_version_reaches_other_workers(app, create_role, roles_list, session):
+    create_role(roles_list[:1])
+    other_worker = RoleCatalog(app.extensions['redis'], check_interval=0)
+    assert len(other_worker.get().role_bodies) == 1
+
+    create_role(roles_list[1:])
+    assert len(other_worker.get().role_bodies) == 1
+    role_catalog.bump()
+    assert len(other_worker.get().role_bodies) == len(roles_list)
+
+
+def test_assign_roles_is_idempotent(create_role, client, roles_list, login_user, session):
+    create_role(roles_list)
+    user, tokens = login_user('user1', '234')
+    headers = {'Authorization': f'Bearer {tokens["access_token"]}'}
+    role_ids = [key['id'] for key in roles_list]
+    for _ in range(2):
+        response = client.post('api/v1/assign-roles', json={'user_id': user.id, 'role_ids': role_ids}, headers=headers)
+        assert response.status_code == HTTPStatus.CREATED
+    assert UserRole.query.filter_by(user_id=user.id).count() == len(role_ids)
+
+    response = client.post(
+        'api/v1/assign-roles',
+        json={'user_id': user.id, 'role_ids': ['8f4233c3-6284-41bd-af5a-737c6a3dc38d']},
+        headers=headers
+    )
+    assert response.status_code == HTTPStatus.NOT_FOUND
+
+
+def test_assign_roles_bulk(app, create_role, client, roles_list, create_user, login_user, session):
+    create_role(roles_list)
+    admin, tokens = login_user('admin', 'admin')
+    headers = {'Authorization': f'Bearer {tokens["access_token"]}'}
+    users = [create_user(f'partner{number}', '123') for number in range(5)]
+    role_ids = [key['id'] for key in roles_list]
+    client.post('api/v1/assign-roles', json={'user_id': users[0].id, 'role_ids': role_ids[:1]}, headers=headers)
+    unknown = '8f4233c3-6284-41bd-af5a-737c6a3dc38d'
+
+    response = client.post(
+        'api/v1/assign-roles/bulk',
+        json={'user_ids': [str(user.id) for user in users] + [unknown, 'not-a-uuid'], 'role_ids': role_ids},
+        headers=headers
+    )
+    assert response.status_code == HTTPStatus.OK
+    results = {item['user_id']: item for item in response.json['results']}
+    assert results['not-a-uuid']['status'] == 'invalid'
+    assert results[unknown]['status'] == 'not_found'
+    assert sorted(results[str(users[0].id)]['assigned_role_ids']) == sorted(role_ids[1:])
+    assert all(results[str(user.id)]['status'] == 'assigned' for user in users)
+    assert UserRole.query.filter(UserRole.user_id.in_([user.id for user in users])).count() == 5 * len(role_ids)
+
+    response = client.post(
+        'api/v1/assign-roles/bulk',
+        json={'user_ids': [str(user.id) for user in users], 'role_ids': role_ids},
+        headers=headers
+    )
+    assert {item['status'] for item in response.json['results']} == {'unchanged'}
+
+    response = client.post(
+        'api/v1/assign-roles/bulk', json={'user_ids': [str(users[0].id)], 'role_ids': [unknown]}, headers=headers
+    )
+    assert response.status_code == HTTPStatus.NOT_FOUND
+    assert response.json['role_ids'] == [unknown]
+
+    response = client.post(
+        'api/v1/assign-roles/bulk',
+        json={'user_ids': [unknown] * (app.config['ASSIGN_ROLES_MAX_USERS'] + 1), 'role_ids': role_ids},
+        headers=headers
+    )
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+
+
+def test_check_permissions_batch(app, create_role, client, roles_list, create_user, login_user, session):
+    create_role(roles_list)
+    _, tokens = login_user('admin', 'admin')
+    headers = {'Authorization': f'Bearer {tokens["access_token"]}'}
+    user = create_user('user1', '123', is_superuser=False)
+    create_permissions()
+    permission = Permission.query.filter_by(code='personal_data').one()
+    session.add(RolePermissions(role_id=roles_list[0]['id'], perm_id=permission.id))
+    session.add(UserRole(user_id=user.id, role_id=roles_list[0]['id']))
+    session.commit()
+    superuser = create_user('superuser', '123')
+    unknown = '8f4233c3-6284-41bd-af5a-737c6a3dc38d'
+    checks = [
+        [str(user.id), 'personal_data'],
+        [str(user.id), 'roles'],
+        [str(superuser.id), 'roles'],
+        [unknown, 'roles'],
+        ['not-a-uuid', 'roles'],
+    ]
+
+    for _ in range(2):  # from the database, then from the cache
+        response = client.post('api/v1/check-permissions/batch', json={'checks': checks}, headers=headers)
+        assert response.status_code == HTTPStatus.OK
+        assert response.json['results'] == [True, False, True, False, False]
+    assert app.extensions['redis'].exists(f'user_claims:{user.id}')
+
+    response = client.post('api/v1/check-permissions/batch', json={'checks': [[unknown]]}, headers=headers)
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+
+
+def test_role_hierarchy(app, create_role, client, roles_list, create_user, login_user, session):
+    create_role(roles_list)
+    admin, subscriber, member = (role['id'] for role in roles_list)
+    _, tokens = login_user('admin', 'admin')
+    headers = {'Authorization': f'Bearer {tokens["access_token"]}'}
+    user = create_user('user1', '123', is_superuser=False)
+    create_permissions()
+    for role_id, code in ((subscriber, 'personal_data'), (member, 'users')):
+        permission = Permission.query.filter_by(code=code).one()
+        session.add(RolePermissions(role_id=role_id, perm_id=permission.id))
+    session.add(UserRole(user_id=user.id, role_id=admin))
+    session.commit()
+
+    def check(*codes):
+        checks = [[str(user.id), code] for code in codes]
+        response = client.post('api/v1/check-permissions/batch', json={'checks': checks}, headers=headers)
+        return response.json['results']
+
+    def closure():
+        return {(str(row.ancestor_id), str(row.descendant_id)): row.paths for row in RoleClosure.query}
+
+    assert check('personal_data', 'users') == [False, False]
+
+    # admin -> member -> subscriber and admin -> subscriber: two paths from subscriber to admin
+    for role_id, parent_id in ((member, subscriber), (admin, member), (admin, subscriber)):
+        response = client.post(f'api/v1/role/{role_id}/parents', json={'parent_id': parent_id}, headers=headers)
+        assert response.status_code == HTTPStatus.CREATED
+    assert closure()[(subscriber, admin)] == 2
+    assert check('personal_data', 'users') == [True, True]
+    response = client.get(f'api/v1/role/{admin}/parents', headers=headers)
+    assert sorted(response.json['parent_ids']) == sorted([member, subscriber])
+
+    response = client.post(f'api/v1/role/{admin}/parents', json={'parent_id': member}, headers=headers)
+    assert response.status_code == HTTPStatus.OK
+    for role_id, parent_id in ((subscriber, admin), (member, member)):
+        response = client.post(f'api/v1/role/{role_id}/parents', json={'parent_id': parent_id}, headers=headers)
+        assert response.status_code == HTTPStatus.CONFLICT
+    response = client.post(f'api/v1/role/{admin}/parents', json={'parent_id': str(uuid.uuid4())}, headers=headers)
+    assert response.status_code == HTTPStatus.NOT_FOUND
+
+    # subscriber is still inherited through member
+    response = client.delete(f'api/v1/role/{admin}/parents/{subscriber}', headers=headers)
+    assert response.status_code == HTTPStatus.NO_CONTENT
+    assert closure()[(subscriber, admin)] == 1
+    assert check('personal_data', 'users') == [True, True]
+    response = client.delete(f'api/v1/role/{admin}/parents/{subscriber}', headers=headers)
+    assert response.status_code == HTTPStatus.NOT_FOUND
+
+    # deleting the role in the middle removes the paths going through it
+    response = client.delete(f'api/v1/role/{member}', headers=headers)
+    assert response.status_code == HTTPStatus.NO_CONTENT
+    assert closure() == {(admin, admin): 1, (subscriber, subscriber): 1}
+    assert check('personal_data', 'users') == [False, False]
+
+
+def test_role_hierarchy_changes_are_serialized(app, create_role, roles_list, session):
+    create_role(roles_list)
+    admin, subscriber, _ = (role['id'] for role in roles_list)
+    assert add_parent(admin, subscriber)
+    session.commit()
+
+    # another transaction changing the edges holds the lock until it commits
+    with db.engine.connect() as other:
+        transaction = other.begin()
+        other.execute(text('LOCK TABLE roles_parents IN SHARE ROW EXCLUSIVE MODE'))
+        for change in (lambda: add_parent(subscriber, admin), lambda: remove_parent(admin, subscriber)):
+            session.execute(text('SET LOCAL lock_timeout = 100'))
+            with pytest.raises(OperationalError):
+                change()
+            session.rollback()
+        transaction.rollback()
+    assert remove_parent(admin, subscriber)
+    session.commit()
+
+
+def test_rbac_export_import(app, create_role, client, roles_list, headers_with_admin_access, session):
+    create_role(roles_list)
+    admin, subscriber, member = (role['id'] for role in roles_list)
+    create_permissions()
+    for role_id, code in ((admin, 'roles'), (member, 'users')):
+        permission = Permission.query.filter_by(code=code).one()
+        session.add(RolePermissions(role_id=role_id, perm_id=permission.id))
+    session.commit()
+    client.post(f'api/v1/role/{admin}/parents', json={'parent_id': member}, headers=headers_with_admin_access)
+
+    response = client.get('api/v1/rbac/export', headers=headers_with_admin_access)
+    assert response.status_code == HTTPStatus.OK
+    assert response.mimetype == 'application/x-ndjson'
+    exported = response.get_data(as_text=True)
+    lines = [json.loads(line) for line in exported.splitlines()]
+    assert {'type': 'role_parent', 'role': 'admin', 'parent': 'member'} in lines
+    assert {'type': 'role_permission', 'role': 'member', 'permission': 'users'} in lines
+
+    # target: subscriber is gone, member gets a new description, admin inherits personal_data from a new role
+    target = [line for line in lines if 'subscriber' not in line.values()]
+    for line in target:
+        if line.get('code') == 'member':
+            line['description'] = 'paying account'
+    target += [
+        {'type': 'role', 'code': 'reader', 'description': 'reads personal data'},
+        {'type': 'role_permission', 'role': 'reader', 'permission': 'personal_data'},
+        {'type': 'role_parent', 'role': 'admin', 'parent': 'reader'},
+    ]
+    body = ''.join(json.dumps(line) + '\n' for line in target)
+
+    response = client.post('api/v1/rbac/import?dry_run=true', data=body, headers=headers_with_admin_access)
+    assert response.status_code == HTTPStatus.OK
+    assert response.json['changes']['roles'] == {'created': 1, 'updated': 1, 'deleted': 1}
+    assert Role.query.filter_by(code='reader').first() is None
+
+    response = client.post('api/v1/rbac/import', data=body, headers=headers_with_admin_access)
+    assert response.status_code == HTTPStatus.OK
+    assert response.json['changes'] == {
+        'permissions': {'created': 0, 'updated': 0, 'deleted': 0},
+        'roles': {'created': 1, 'updated': 1, 'deleted': 1},
+        'role_permissions': {'created': 1, 'updated': 0, 'deleted': 0},
+        'role_parents': {'created': 1, 'updated': 0, 'deleted': 0},
+    }
+    assert Role.query.get(member).description == 'paying account'
+    reader = Role.query.filter_by(code='reader').one()
+    assert RoleClosure.query.filter_by(ancestor_id=reader.id, descendant_id=admin).one().paths == 1
+
+    # importing the same model again changes nothing, and the export is the imported model
+    response = client.post('api/v1/rbac/import', data=body, headers=headers_with_admin_access)
+    assert all(counts == {'created': 0, 'updated': 0, 'deleted': 0} for counts in response.json['changes'].values())
+    exported = client.get('api/v1/rbac/export', headers=headers_with_admin_access).get_data(as_text=True)
+    key = json.dumps
+    assert sorted(map(key, map(json.loads, exported.splitlines()))) == sorted(map(key, target))
+
+    for invalid in (
+        '{"type": "group", "code": "x"}\n',
+        '{"type": "role_permission", "role": "admin", "permission": "missing"}\n',
+        '{"type": "role", "code": "a"}\n{"type": "role", "code": "b"}\n'
+        '{"type": "role_parent", "role": "a", "parent": "b"}\n{"type": "role_parent", "role": "b", "parent": "a"}\n',
+        'not json\n',
+    ):
+        response = client.post('api/v1/rbac/import', data=invalid, headers=headers_with_admin_access)
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+    assert Role.query.filter_by(code='reader').count() == 1
+
+
+def test_rbac_import_invalidates_affected_claims(
+    app, create_role, client, roles_list, login_user, headers_with_admin_access, session
+):
+    create_role(roles_list)
+    admin, subscriber, member = (role['id'] for role in roles_list)
+    create_permissions()
+    client.post(f'api/v1/role/{admin}/parents', json={'parent_id': member}, headers=headers_with_admin_access)
+    users = {}
+    for username, role_id in (('user1', admin), ('user2', subscriber), ('user3', member)):
+        users[username], _ = login_user(username, '234', is_superuser=False)
+        session.add(UserRole(user_id=users[username].id, role_id=role_id))
+    session.commit()
+    redis = app.extensions['redis']
+    assert all(redis.exists(f'user_claims:{user.id}') for user in users.values())
+
+    exported = client.get('api/v1/rbac/export', headers=headers_with_admin_access).get_data(as_text=True)
+    body = exported + json.dumps({'type': 'role_permission', 'role': 'member', 'permission': 'users'}) + '\n'
+    response = client.post('api/v1/rbac/import', data=body, headers=headers_with_admin_access)
+    assert response.status_code == HTTPStatus.OK
+
+    # member and admin, which inherits from it, gained a permission; subscriber did not change
+    assert not redis.exists(f'user_claims:{users["user1"].id}')
+    assert redis.exists(f'user_claims:{users["user2"].id}')
+    assert not redis.exists(f'user_claims:{users["user3"].id}')
+
+
+def test_rbac_cli(app, create_role, roles_list, session, tmp_path):
+    create_role(roles_list)
+    create_permissions()
+    runner = app.test_cli_runner()
+    path = tmp_path / 'rbac.ndjson'
+
+    result = runner.invoke(args=['export-rbac', str(path)])
+    assert result.exit_code == 0
+    assert len(path.read_text().splitlines()) == 6
+
+    path.write_text(path.read_text().replace('"subscriber"', '"trial"'))
+    result = runner.invoke(args=['import-rbac', str(path)])
+    assert result.exit_code == 0, result.output
+    assert 'roles: created 1, updated 0, deleted 1' in result.output
+    assert Role.query.filter_by(code='trial').count() == 1
+
+
+def test_admin_statement_timeout(app, create_role, client, roles_list, headers_with_admin_access, session):
+    create_role(roles_list)
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        # gateway and catalog reads keep the short default timeout and send no SET LOCAL
+        client.get('api/v1/role', headers=headers_with_admin_access)
+        client.post('api/v1/check-permissions/batch', json={'checks': []}, headers=headers_with_admin_access)
+        assert not [statement for statement in statements if 'statement_timeout' in statement]
+
+        session.commit()  # tests share one app context, so the next request starts its own transaction
+        client.post('api/v1/role', json={'code': 'new', 'description': 'new'}, headers=headers_with_admin_access)
+        assert 'SET LOCAL statement_timeout = 30000' in statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    Role.query.filter_by(code='new').delete()
+    session.commit()
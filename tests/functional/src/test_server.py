@@ -0,0 +1,26 @@
+import gc
+import os
+
+from auth.utils.server import hashing_pool_size, prepare_fork, process_memory, worker_count
+
+
+def test_worker_count():
+    assert worker_count(3, cpus=8) == 3
+    assert worker_count(0, cpus=8) == 8
+    assert worker_count(0, cpus=1) == 2
+    assert hashing_pool_size(4, cpus=8) == 2
+    assert hashing_pool_size(8, cpus=2) == 1
+
+
+def test_prepare_fork_keeps_database_usable(app, session):
+    session.execute('SELECT 1')
+    session.commit()
+    prepare_fork()
+    gc.unfreeze()
+    assert session.execute('SELECT 1').scalar() == 1
+
+
+def test_process_memory():
+    memory = process_memory(os.getpid())
+    if memory is not None:
+        assert 0 < memory['private'] <= memory['rss']
@@ -1,6 +1,24 @@
+import datetime
 import json
+import os
+import uuid
 from http import HTTPStatus
 
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+from cryptography.hazmat.primitives.serialization import Encoding, NoEncryption, PrivateFormat
+from redis import Redis
+from sqlalchemy import text
+from werkzeug.security import generate_password_hash
+
+from auth.app import configure_jwt, db
+from auth.models import KnownDevice, UserData, UserDevice
+from auth.utils.partitions import create_partitions, drop_partitions, get_partitions
+from auth.utils.queries import get_user, get_user_by_username
+
+from ... import config
+
 # создать нового пользователя (залогиниться), проверить наличие данных в базе psql
 # создать пользователя, добавить ему перс.данные, проверить наличие перс.данных в базе
 # создать пользователя, добавить ему перс.данные, изменить перс.данные, проверить изменение перс.данных в базе
@@ -127,6 +145,93 @@ def test_logout(client, session, login_user):
     assert response.status_code == HTTPStatus.OK
 
 
+
+def test_logout_without_redis(app, client, session, login_user, monkeypatch):
+    login_user('user1', '234')
+    access_tokens = [
+        client.post('/api/v1/auth/login', json={'username': 'user1', 'password': '234'}).json['tokens']['access_token']
+        for _ in range(2)
+    ]
+    unavailable = Redis.from_url('redis://127.0.0.1:1', socket_connect_timeout=0.1)
+    monkeypatch.setattr(app.extensions['redis'], '_client', unavailable)
+
+    for url, token in zip(('/api/v1/auth/logout', '/api/v1/auth/logout-all'), access_tokens):
+        response = client.post(url, json={}, headers={'Authorization': f'Bearer {token}'})
+        assert response.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+
+
+def test_refresh_without_redis(app, client, session, login_user, monkeypatch):
+    _, tokens = login_user('user1', '234')
+    unavailable = Redis.from_url('redis://127.0.0.1:1', socket_connect_timeout=0.1)
+    monkeypatch.setattr(app.extensions['redis'], '_client', unavailable)
+
+    response = client.post(
+        '/api/v1/auth/refresh-token', headers={'Authorization': f'Bearer {tokens["refresh_token"]}'}
+    )
+    assert response.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+
+
+def test_access_after_logout(client, session, login_user):
+    user, tokens = login_user('user1', '234')
+    headers = {'Authorization': f'Bearer {tokens["access_token"]}'}
+    response = client.post(
+        '/api/v1/auth/logout',
+        json={'refresh_token': tokens['refresh_token']},
+        headers=headers
+    )
+    assert response.status_code == HTTPStatus.OK
+
+    response = client.patch(
+        f'/api/v1/auth/change-password/{user.id}',
+        json={'old_password': '234', 'new_password': '345'},
+        headers=headers
+    )
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
+
+    response = client.post(
+        '/api/v1/auth/refresh-token',
+        headers={'Authorization': f'Bearer {tokens["refresh_token"]}'}
+    )
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
+
+
+def test_logout_all(app, client, session, login_user):
+    user, tokens = login_user('user1', '234')
+    response = client.post('/api/v1/auth/login', json={'username': 'user1', 'password': '234'})
+    other_tokens = response.json['tokens']
+
+    response = client.post(
+        '/api/v1/auth/logout-all',
+        headers={'Authorization': f'Bearer {tokens["access_token"]}'}
+    )
+    assert response.status_code == HTTPStatus.OK
+    # refresh chains carry the generation past any TTL, so the counter must never expire back to 0
+    assert app.extensions['redis'].ttl(f'token_generation:{user.id}') == -1
+
+    for token in (tokens['access_token'], other_tokens['access_token']):
+        response = client.patch(
+            f'/api/v1/auth/change-password/{user.id}',
+            json={'old_password': '234', 'new_password': '345'},
+            headers={'Authorization': f'Bearer {token}'}
+        )
+        assert response.status_code == HTTPStatus.UNAUTHORIZED
+
+    response = client.post(
+        '/api/v1/auth/refresh-token',
+        headers={'Authorization': f'Bearer {other_tokens["refresh_token"]}'}
+    )
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
+
+    response = client.post('/api/v1/auth/login', json={'username': 'user1', 'password': '234'})
+    new_access_token = response.json['tokens']['access_token']
+    response = client.patch(
+        f'/api/v1/auth/change-password/{user.id}',
+        json={'old_password': '234', 'new_password': '345'},
+        headers={'Authorization': f'Bearer {new_access_token}'}
+    )
+    assert response.status_code == HTTPStatus.OK
+
+
 def test_refresh_token(client, session, login_user):
     _, tokens = login_user('user1', '234')
     refresh_token = tokens['refresh_token']
@@ -141,6 +246,23 @@ def test_refresh_token(client, session, login_user):
     assert response.status_code == HTTPStatus.OK
 
 
+def test_refresh_token_reuse(client, session, login_user):
+    _, tokens = login_user('user1', '234')
+    headers = {'Authorization': f'Bearer {tokens["refresh_token"]}'}
+    response = client.post('/api/v1/auth/refresh-token', headers=headers)
+    assert response.status_code == HTTPStatus.OK
+    rotated_refresh_token = response.json['tokens']['refresh_token']
+
+    response = client.post('/api/v1/auth/refresh-token', headers=headers)
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
+
+    response = client.post(
+        '/api/v1/auth/refresh-token',
+        headers={'Authorization': f'Bearer {rotated_refresh_token}'}
+    )
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
+
+
 def test_refresh_token_incorrect(client, session, login_user):
     _, tokens = login_user('user1', '234')
     refresh_token = tokens['refresh_token'] + '345345'
@@ -195,3 +317,261 @@ def test_change_password_nonexistent_user(client, session, login_user):
     )
 
     assert response.status_code == HTTPStatus.NOT_FOUND
+
+
+def test_jwks(client, session):
+    response = client.get('/api/v1/auth/.well-known/jwks.json')
+    assert response.status_code == HTTPStatus.OK
+    assert 'keys' in response.json
+    assert 'max-age' in response.headers['Cache-Control']
+
+    response = client.get(
+        '/api/v1/auth/.well-known/jwks.json',
+        headers={'If-None-Match': response.headers['ETag']}
+    )
+    assert response.status_code == HTTPStatus.NOT_MODIFIED
+
+
+@pytest.mark.parametrize('algorithm', ['RS256', 'EdDSA'])
+def test_jwks_asymmetric_signing(app, client, create_user, session, tmp_path, algorithm):
+    if algorithm == 'RS256':
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    else:
+        private_key = ed25519.Ed25519PrivateKey.generate()
+    key_path = tmp_path / 'jwt.pem'
+    key_path.write_bytes(private_key.private_bytes(Encoding.PEM, PrivateFormat.PKCS8, NoEncryption()))
+
+    class JWTSettings(config.JWTSettings):
+        JWT_ALGORITHM: str = algorithm
+        JWT_PRIVATE_KEY_PATH: str = str(key_path)
+
+    configure_jwt(app, config=JWTSettings())
+    user = create_user('user1', '123')
+    response = client.post('/api/v1/auth/login', json={'username': 'user1', 'password': '123'})
+    access_token = response.json['tokens']['access_token']
+
+    header = jwt.get_unverified_header(access_token)
+    assert header['alg'] == algorithm
+    keys = client.get('/api/v1/auth/.well-known/jwks.json').json['keys']
+    assert [key['kid'] for key in keys] == [header['kid']]
+    assert keys[0]['alg'] == algorithm
+    claims = jwt.decode(access_token, jwt.PyJWK(keys[0]).key, algorithms=[algorithm])
+    assert claims['sub'] == str(user.id)
+
+    response = client.get(
+        f'/api/v1/auth/login-history/{user.id}', headers={'Authorization': f'Bearer {access_token}'}
+    )
+    assert response.status_code == HTTPStatus.OK
+
+
+def test_login_history(app, client, session, login_user):
+    user, tokens = login_user('user1', '234')
+    client.post(
+        '/api/v1/auth/login',
+        json={'username': 'user1', 'password': '234', 'device_key': 'phone'},
+        headers={'User-Agent': 'test-agent'}
+    )
+    app.extensions['login_events'].flush()
+
+    response = client.get(
+        f'/api/v1/auth/login-history/{user.id}',
+        headers={'Authorization': f'Bearer {tokens["access_token"]}'}
+    )
+    assert response.status_code == HTTPStatus.OK
+    history = response.json['history']
+    assert len(history) == 2
+    assert history[0]['device']['device_key'] == 'phone'
+    assert history[0]['device']['user_agent'] == 'test-agent'
+
+
+def test_login_history_pagination(app, client, session, login_user):
+    user, tokens = login_user('user1', '234')
+    for device_key in ('phone', 'laptop'):
+        client.post('/api/v1/auth/login', json={'username': 'user1', 'password': '234', 'device_key': device_key})
+    app.extensions['login_events'].flush()
+    headers = {'Authorization': f'Bearer {tokens["access_token"]}'}
+
+    pages = []
+    cursor = ''
+    while cursor is not None:
+        response = client.get(f'/api/v1/auth/login-history/{user.id}?limit=1&cursor={cursor}', headers=headers)
+        assert response.status_code == HTTPStatus.OK
+        pages.append(response.json['history'])
+        cursor = response.json['next_cursor']
+    assert [len(page) for page in pages] == [1, 1, 1]
+    assert pages[0][0]['device']['device_key'] == 'laptop'
+
+    response = client.get(f'/api/v1/auth/login-history/{user.id}?format=ndjson', headers=headers)
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert [line['device']['device_key'] for line in lines] == ['laptop', 'phone', None]
+
+    response = client.get(f'/api/v1/auth/login-history/{user.id}?cursor=broken', headers=headers)
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+
+
+def test_known_device_written_once(app, client, session, login_user):
+    user, _ = login_user('user1', '234')
+    for _ in range(3):
+        client.post('/api/v1/auth/login', json={'username': 'user1', 'password': '234', 'device_key': 'phone'})
+        app.extensions['login_events'].flush()
+
+    assert UserDevice.query.filter_by(user_id=user.id).count() == 4
+    assert KnownDevice.query.filter_by(user_id=user.id).count() == 2
+
+
+def test_login_history_partitions(app, session):
+    table = UserDevice.__table__
+    with db.get_engine(app).begin() as connection:
+        create_partitions(connection, table, today=datetime.date(2020, 1, 15), ahead=1)
+        assert {'users_device_2020_01', 'users_device_2020_02'} <= get_partitions(connection, table)
+
+        dropped = drop_partitions(connection, table, today=datetime.date(2021, 1, 1), retention=12)
+        assert dropped == ['users_device_2020_01']
+        assert 'users_device_2020_02' in get_partitions(connection, table)
+
+
+def test_login_history_default_partition(app, session, create_user):
+    writer = app.extensions['login_events']
+    table = UserDevice.__table__
+    user = create_user('user1', '234')
+    # logins of a month no partition was created for, as if maintenance stopped running
+    month = datetime.datetime(2090, 3, 1)
+    batch = []
+    for day in (1, 20):
+        row = {'id': uuid.uuid4(), 'user_id': user.id, 'created_at': month.replace(day=day), 'updated_at': month}
+        batch.append(({**row, 'ip': None, 'fingerprint': 'f' * 64}, {**row, 'fingerprint': 'f' * 64}))
+    failed = writer.failed
+    writer._write(batch)
+    assert writer.failed == failed
+
+    with db.get_engine(app).begin() as connection:
+        assert connection.execute(text('SELECT count(*) FROM users_device_default')).scalar() == 2
+        assert create_partitions(connection, table, today=month.date(), ahead=0) == ['users_device_2090_03']
+        assert connection.execute(text('SELECT count(*) FROM users_device_2090_03')).scalar() == 2
+        assert connection.execute(text('SELECT count(*) FROM users_device_default')).scalar() == 0
+        connection.execute(text('DROP TABLE users_device_2090_03'))
+
+
+def test_lost_login_events_metrics(app, client, session):
+    writer = app.extensions['login_events']
+    # an unknown user breaks the foreign key, so the whole batch is lost
+    writer.enqueue(uuid.uuid4())
+    writer.flush()
+
+    response = client.get('/api/v1/metrics', headers={'Authorization': 'Bearer metrics-secret'})
+    assert response.status_code == HTTPStatus.OK
+    assert f'auth_login_events_failed_total{{pid="{os.getpid()}"}} {writer.failed}' in response.data.decode()
+    assert writer.failed >= 1
+
+
+def test_db_pool_metrics(app, client, session):
+    for headers in ({}, {'Authorization': 'Bearer wrong'}):
+        response = client.get('/api/v1/metrics', headers=headers)
+        assert response.status_code == HTTPStatus.UNAUTHORIZED
+
+    response = client.get('/api/v1/metrics', headers={'Authorization': 'Bearer metrics-secret'})
+    assert response.status_code == HTTPStatus.OK
+    assert 'auth_db_pool_in_use{pid=' in response.data.decode()
+    assert 'auth_db_pool_checkout_wait_seconds_total' in response.data.decode()
+
+    app.config['METRICS_TOKEN'] = None
+    response = client.get('/api/v1/metrics', headers={'Authorization': 'Bearer metrics-secret'})
+    assert response.status_code == HTTPStatus.NOT_FOUND
+
+
+def test_add_personal_data(client, session, login_user):
+    user, tokens = login_user('user1', '234')
+    headers = {'Authorization': f'Bearer {tokens["access_token"]}'}
+
+    response = client.post(
+        f'/api/v1/auth/add-personal-data/{user.id}',
+        json={'first_name': 'Ivan', 'city': 'Moscow'},
+        headers=headers
+    )
+    assert response.status_code == HTTPStatus.OK
+    assert UserData.query.filter_by(user_id=user.id).one().first_name == 'Ivan'
+
+    response = client.post(
+        '/api/v1/auth/add-personal-data/8f4233c3-6284-41bd-af5a-737c6a3dc38d',
+        json={'first_name': 'Ivan'},
+        headers=headers
+    )
+    assert response.status_code == HTTPStatus.NOT_FOUND
+
+
+def test_precompiled_lookups_bind_parameters(app, create_user, session):
+    first = create_user('user1', '123')
+    second = create_user('user2', '123')
+    assert get_user_by_username('user1').id == first.id
+    assert get_user_by_username('user2').id == second.id
+    assert get_user_by_username('nobody') is None
+    assert get_user(second.id).username == 'user2'
+
+
+def test_import_users(app, client, create_user, session, tmp_path):
+    create_user('existing', 'old', is_superuser=False)
+    legacy_id = '7cd483e9-5888-40fd-813a-a382154bcfd2'
+    source = tmp_path / 'users.csv'
+    source.write_text(
+        'id,username,password,pwd_hash,is_superuser,first_name,city\n'
+        f'{legacy_id},imported1,secret1,,true,Ivan,Moscow\n'
+        ',imported2,,' + generate_password_hash('secret2') + ',,,\n'
+        ',existing,new,,,,\n'
+        ',no_password,,,,,\n'
+        ',imported3,secret3,,0,,\n'
+    )
+    runner = app.test_cli_runner()
+
+    checkpoint = tmp_path / 'users.csv.checkpoint'
+    result = runner.invoke(args=['import-users', str(source), '--batch-size', '2'])
+    assert result.exit_code == 0, result.output
+    assert 'records: 5, inserted: 3, existing: 1, invalid: 1' in result.output
+    assert not checkpoint.exists()
+
+    user = get_user(legacy_id)
+    assert user.username == 'imported1' and user.is_superuser
+    assert UserData.query.filter_by(user_id=user.id).one().city == 'Moscow'
+    assert UserData.query.filter_by(user_id=get_user_by_username('imported3').id).first() is None
+    for username, password in (('imported2', 'secret2'), ('imported3', 'secret3'), ('existing', 'old')):
+        response = client.post('/api/v1/auth/login', json={'username': username, 'password': password})
+        assert response.status_code == HTTPStatus.OK
+
+    # a finished import leaves no checkpoint: run again, everything is read and nothing is duplicated
+    result = runner.invoke(args=['import-users', str(source)])
+    assert 'records: 5, inserted: 0, existing: 4, invalid: 1' in result.output
+
+    ndjson = tmp_path / 'users.ndjson'
+    ndjson.write_text(
+        json.dumps({'username': 'imported1', 'password': 'x'}) + '\nnot json\n'
+        + json.dumps({'username': 'imported4', 'password': 'secret4', 'email': 'a@b.c'}) + '\n'
+    )
+    result = runner.invoke(args=['import-users', str(ndjson), '--checkpoint', str(tmp_path / 'other')])
+    assert 'records: 3, inserted: 1, existing: 1, invalid: 1' in result.output
+    assert UserData.query.filter_by(user_id=get_user_by_username('imported4').id).one().email == 'a@b.c'
+
+    # a batch that fails stops the run after the committed ones; the fixed file resumes from there
+    broken = tmp_path / 'broken.ndjson'
+    records = [{'username': f'batch{number}', 'pwd_hash': 'pbkdf2:sha256:1$a$b'} for number in range(4)]
+    records[2]['birth_date'] = 'not a date'
+    broken.write_text(''.join(json.dumps(record) + '\n' for record in records))
+    result = runner.invoke(args=['import-users', str(broken), '--batch-size', '2'])
+    assert result.exit_code != 0
+    assert 'records 3-4 were not loaded' in result.output
+    assert json.loads((tmp_path / 'broken.ndjson.checkpoint').read_text())['records'] == 2
+
+    # another file under the same name does not resume from the checkpoint
+    broken.write_text(''.join(json.dumps(record) + '\n' for record in reversed(records)))
+    result = runner.invoke(args=['import-users', str(broken), '--batch-size', '2'])
+    assert result.exit_code != 0
+    assert 'differ from the ones recorded' in result.output
+
+    del records[2]['birth_date']
+    broken.write_text(''.join(json.dumps(record) + '\n' for record in records))
+    result = runner.invoke(args=['import-users', str(broken), '--batch-size', '2'])
+    assert 'records: 2, inserted: 2' in result.output
+    assert not (tmp_path / 'broken.ndjson.checkpoint').exists()
+
+    for username in ('imported1', 'imported2', 'imported3', 'imported4', 'batch0', 'batch1', 'batch2', 'batch3'):
+        db.session.delete(get_user_by_username(username))
+    db.session.commit()